@@ -0,0 +1,3 @@
+"""
+Load tests of the linkly api, see ``benchmarks.run``.
+"""
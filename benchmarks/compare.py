@@ -0,0 +1,95 @@
+"""
+Compare two ``benchmarks.run`` reports.
+
+Prints throughput and latency percentiles per operation side by side with
+the relative change. With ``--fail-over PCT`` the exit code is 1 when any
+operation's p99 got more than PCT percent slower, so it can gate a CI job.
+
+usage: python -m benchmarks.compare baseline.json candidate.json [--fail-over 10]
+"""
+
+import argparse
+import json
+import sys
+
+METRICS = ("throughput_rps", "p50", "p90", "p99")
+
+
+def metric(result: dict, name: str) -> float | None:
+    if name == "throughput_rps":
+        return result.get("throughput_rps")
+    return result["latency_ms"].get(name)
+
+
+def change(old: float | None, new: float | None) -> float | None:
+    if not old or new is None:
+        return None
+    return (new - old) / old * 100
+
+
+def compare(baseline: dict, candidate: dict) -> list[dict]:
+    rows = []
+    for op, old in baseline["results"].items():
+        new = candidate["results"].get(op)
+        if new is None:
+            continue
+        for name in METRICS:
+            before, after = metric(old, name), metric(new, name)
+            rows.append(
+                {
+                    "operation": op,
+                    "metric": name,
+                    "baseline": before,
+                    "candidate": after,
+                    "change_pct": change(before, after),
+                }
+            )
+    return rows
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    parser.add_argument(
+        "--fail-over", type=float, help="max allowed p99 slowdown, percent"
+    )
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    print(
+        f"baseline {baseline['meta'].get('commit')} -> "
+        f"candidate {candidate['meta'].get('commit')}"
+    )
+    print(f"{'operation':<10} {'metric':<15} {'baseline':>10} {'candidate':>10} {'change':>8}")  # fmt: skip
+
+    regressions = []
+    for row in compare(baseline, candidate):
+        pct = row["change_pct"]
+        shown = "n/a" if pct is None else f"{pct:+.1f}%"
+        print(
+            f"{row['operation']:<10} {row['metric']:<15} "
+            f"{row['baseline']!s:>10} {row['candidate']!s:>10} {shown:>8}"
+        )
+        if (
+            args.fail_over is not None
+            and row["metric"] == "p99"
+            and pct is not None
+            and pct > args.fail_over
+        ):
+            regressions.append(row)
+
+    for row in regressions:
+        print(
+            f"[!] {row['operation']} p99 regressed {row['change_pct']:.1f}% "
+            f"({row['baseline']} -> {row['candidate']} ms)"
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+"""
+Stub of the IP details API (``IP_DETAILS_URL``) on a local port.
+
+Answers ``GET /<ip>`` with a fixed city and country after an optional delay,
+over HTTP/1.1 keep-alive, so the geoip fallback of the click pipeline makes
+real network calls without leaving the machine.
+"""
+
+import asyncio
+import json
+
+LOCATION = json.dumps({"status": "success", "city": "Kathmandu", "country": "Nepal"})
+
+
+class IPStub:
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.requests = 0
+        self._server: asyncio.AbstractServer | None = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.sockets[0].getsockname()[:2]
+        return f"http://{host}:{port}"
+
+    async def start(self, host: str = "127.0.0.1", port: int = 0) -> "IPStub":
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self
+
+    async def stop(self) -> None:
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _handle(self, reader, writer) -> None:
+        body = LOCATION.encode()
+        try:
+            while True:
+                request = await reader.readuntil(b"\r\n\r\n")
+                if not request:
+                    break
+                self.requests += 1
+                if self.delay:
+                    await asyncio.sleep(self.delay)
+                writer.write(
+                    b"HTTP/1.1 200 OK\r\n"
+                    b"Content-Type: application/json\r\n"
+                    + f"Content-Length: {len(body)}\r\n\r\n".encode()
+                    + body
+                )
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
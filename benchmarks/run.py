@@ -0,0 +1,423 @@
+"""
+End-to-end load test of the linkly api.
+
+By default ``linkly.main:app`` is booted in process (lifespan included) on
+top of the in-memory Mongo and Redis stand-ins and a local stub of the IP
+details API, and driven through ``httpx.ASGITransport``. With ``--base-url``
+an already running server is driven over the network instead.
+
+The run registers ``--users`` users, shortens ``--links`` links and then
+sends ``--requests`` requests from ``--concurrency`` concurrent clients,
+picking each request from ``--mix`` and each link from a Zipf distribution
+(``--zipf`` is the exponent; ~1 means a few links get most of the traffic).
+
+Results are printed and, with ``--output``, written as JSON: per operation
+the status codes, throughput, latency percentiles and a histogram with fixed
+bucket bounds, so two runs can be compared with ``benchmarks.compare``.
+
+usage: python -m benchmarks.run [--requests N] [--concurrency C] [--links L]
+                                [--zipf S] [--mix redirect=80,shorten=10,...]
+                                [--output results.json] [--base-url URL]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+from bisect import bisect_left
+from contextlib import AsyncExitStack, contextmanager
+from datetime import datetime, timezone
+
+import httpx
+
+BENCHMARK_SECRET = "benchmark-secret-not-for-production-use"
+BASE62 = "0123456789abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ"
+
+# settings are read at import time, give the app a usable environment first
+os.environ.setdefault("LOCAL_HOST", "http://bench.local")
+os.environ.setdefault("DB_NAME", "linkly_bench")
+os.environ.setdefault("SECRET_KEY", BENCHMARK_SECRET)
+os.environ.setdefault("ALGORITHM", "HS256")
+os.environ.setdefault("SESSION_SECRET", "benchmark-session")
+os.environ.setdefault("BASE62", BASE62)
+
+OPERATIONS = ("redirect", "shorten", "analytics", "me")
+DEFAULT_MIX = "redirect=80,shorten=10,analytics=5,me=5"
+
+# upper bounds in milliseconds, fixed so histograms of different runs line up
+HISTOGRAM_BOUNDS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # fmt: skip
+
+
+def parse_mix(mix: str) -> dict[str, float]:
+    weights = {}
+    for part in mix.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in OPERATIONS:
+            raise ValueError(
+                f"Unknown operation {name!r}, expected one of {OPERATIONS}"
+            )
+        weights[name] = float(weight or 1)
+    return weights
+
+
+class Zipf:
+    """
+    Sample ``items`` with probability proportional to ``1 / rank ** s``.
+    """
+
+    def __init__(self, items: list, s: float, rng: random.Random):
+        self.items = items
+        self.rng = rng
+        total = 0.0
+        self.cumulative = []
+        for rank in range(1, len(items) + 1):
+            total += 1 / rank**s
+            self.cumulative.append(total)
+
+    def sample(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.items[bisect_left(self.cumulative, point)]
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies: dict[str, list[float]] = {op: [] for op in OPERATIONS}
+        self.statuses: dict[str, dict[str, int]] = {op: {} for op in OPERATIONS}
+        self.errors: dict[str, int] = {op: 0 for op in OPERATIONS}
+
+    def record(self, op: str, seconds: float, status: int | str) -> None:
+        self.latencies[op].append(seconds * 1000)
+        key = str(status)
+        self.statuses[op][key] = self.statuses[op].get(key, 0) + 1
+        if not isinstance(status, int) or status >= 500:
+            self.errors[op] += 1
+
+    def summary(self, elapsed: float) -> dict:
+        results = {}
+        for op, values in self.latencies.items():
+            if values:
+                results[op] = summarize(values, elapsed)
+                results[op]["statuses"] = self.statuses[op]
+                results[op]["errors"] = self.errors[op]
+        everything = list(itertools.chain.from_iterable(self.latencies.values()))
+        results["total"] = summarize(everything, elapsed)
+        results["total"]["errors"] = sum(self.errors.values())
+        return results
+
+
+def summarize(values: list[float], elapsed: float) -> dict:
+    ordered = sorted(values)
+
+    def percentile(p: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(p * len(ordered)))], 3)
+
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for value in ordered:
+        counts[bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+    bounds = [*HISTOGRAM_BOUNDS, "+Inf"]
+
+    return {
+        "count": len(ordered),
+        "throughput_rps": round(len(ordered) / elapsed, 1) if elapsed else None,
+        "latency_ms": {
+            "mean": round(sum(ordered) / len(ordered), 3),
+            "p50": percentile(0.50),
+            "p90": percentile(0.90),
+            "p99": percentile(0.99),
+            "max": round(ordered[-1], 3),
+        },
+        "histogram": [[bound, count] for bound, count in zip(bounds, counts)],
+    }
+
+
+def git_commit() -> str | None:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+@contextmanager
+def overrides(*changes):
+    """
+    Temporarily set ``(obj, attr, value)`` attributes.
+    """
+    saved = [(obj, attr, getattr(obj, attr)) for obj, attr, _ in changes]
+    for obj, attr, value in changes:
+        setattr(obj, attr, value)
+    try:
+        yield
+    finally:
+        for obj, attr, value in reversed(saved):
+            setattr(obj, attr, value)
+
+
+async def stop_worker(worker, task: asyncio.Task) -> None:
+    # the worker finishes the batch in hand and leaves the rest in the stream
+    worker.stop()
+    await task
+
+
+async def in_process_app(stack: AsyncExitStack, ip_delay: float) -> httpx.AsyncClient:
+    """
+    Boot ``linkly.main:app`` on the stand-ins and return a client for it.
+    """
+    from fastapi_cache import FastAPICache
+
+    import linkly.authentication.jwt.token as token
+    from benchmarks.ip_stub import IPStub
+    from benchmarks.stand_ins import stand_ins
+    from linkly import app as api
+    from linkly.database import get_db_instance
+    from linkly.main import app
+    from linkly.services.click_stream import analytics_worker
+    from linkly.settings import settings
+
+    stub = await IPStub(delay=ip_delay).start()
+    stack.push_async_callback(stub.stop)
+
+    # the test suite imports linkly without an environment
+    stack.enter_context(
+        overrides(
+            (settings, "IP_DETAILS_URL", stub.url),
+            (settings, "GEOIP_HTTP_FALLBACK", True),
+            (settings, "LOCAL_HOST", settings.LOCAL_HOST or "http://bench.local"),
+            (settings, "BASE62", settings.BASE62 or BASE62),
+            (token, "SECRET_KEY", token.SECRET_KEY or BENCHMARK_SECRET),
+            (token, "ALGORITHM", token.ALGORITHM or "HS256"),
+        )
+    )
+    stack.enter_context(stand_ins())
+    stack.callback(FastAPICache.reset)
+    await stack.enter_async_context(api.router.lifespan_context(api))
+    if settings.CLICK_INGEST == "stream":
+        # stands in for the linkly-analytics-worker processes, stopped before
+        # the lifespan closes the upstream clients it uses
+        task = asyncio.create_task(analytics_worker.run(get_db_instance()))
+        stack.push_async_callback(stop_worker, analytics_worker, task)
+
+    transport = httpx.ASGITransport(app=app, client=("127.0.0.1", 50000))
+    return await stack.enter_async_context(
+        httpx.AsyncClient(transport=transport, base_url=settings.LOCAL_HOST)
+    )
+
+
+async def setup(
+    client: httpx.AsyncClient, users: int, links: int, rng: random.Random
+) -> tuple[list[str], list[str]]:
+    """
+    Register and log in ``users`` users and shorten ``links`` links spread
+    over them. Returns (tokens, short ids).
+    """
+    run_id = f"{int(time.time())}{rng.randrange(10**6)}"
+    tokens = []
+    for i in range(users):
+        email = f"bench{run_id}-{i}@example.com"
+        response = await client.post(
+            "/register",
+            json={"name": f"bench{run_id}-{i}", "email": email, "password": "bench"},
+        )
+        response.raise_for_status()
+        response = await client.post(
+            "/login", data={"username": email, "password": "bench"}
+        )
+        response.raise_for_status()
+        tokens.append(response.json()["access_token"])
+
+    short_ids = []
+    batch = 1000
+    for start in range(0, links, batch):
+        items = [
+            {"original_url": f"https://example.com/{run_id}/{n}", "expiry": None}
+            for n in range(start, min(links, start + batch))
+        ]
+        headers = {"Authorization": f"Bearer {tokens[(start // batch) % len(tokens)]}"}
+        response = await client.post("/shorten/batch", json=items, headers=headers)
+        response.raise_for_status()
+        for result in response.json()["results"]:
+            if result["short_url"]:
+                short_ids.append(result["short_url"].rsplit("/", 1)[-1])
+    return tokens, short_ids
+
+
+async def drive(
+    client: httpx.AsyncClient,
+    recorder: Recorder | None,
+    total: int,
+    concurrency: int,
+    mix: dict[str, float],
+    links: Zipf,
+    tokens: list[str],
+    rng: random.Random,
+) -> float:
+    """
+    Send ``total`` requests from ``concurrency`` workers. Returns the elapsed
+    wall clock time.
+    """
+    operations = list(mix)
+    weights = list(mix.values())
+    remaining = itertools.count()
+    created = itertools.count()
+
+    def request(op: str) -> tuple[str, str, dict]:
+        auth = {"Authorization": f"Bearer {rng.choice(tokens)}"}
+        if op == "redirect":
+            visitor = rng.randrange(10000)
+            headers = {"user-agent": f"bench-visitor/{visitor}"}
+            url = f"/{links.sample()}"
+            if rng.random() < 0.3:
+                url += f"?utm_source=src{rng.randrange(5)}&utm_medium=bench"
+            return "GET", url, {"headers": headers}
+        if op == "shorten":
+            body = {
+                "original_url": f"https://example.org/{next(created)}",
+                "expiry": None,
+            }
+            return "POST", "/shorten", {"json": body, "headers": auth}
+        if op == "analytics":
+            return "GET", f"/analytics/{links.sample()}", {"headers": auth}
+        return "GET", "/me", {"headers": auth}
+
+    async def worker():
+        while next(remaining) < total:
+            op = rng.choices(operations, weights)[0]
+            method, url, kwargs = request(op)
+            start = time.perf_counter()
+            try:
+                response = await client.request(method, url, **kwargs)
+                status = response.status_code
+            except Exception as e:
+                status = type(e).__name__
+            if recorder is not None:
+                recorder.record(op, time.perf_counter() - start, status)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_benchmark(
+    requests: int = 10000,
+    concurrency: int = 32,
+    links: int = 1000,
+    users: int = 4,
+    zipf: float = 1.1,
+    mix: str = DEFAULT_MIX,
+    warmup: int = 0,
+    ip_delay: float = 0.0,
+    seed: int = 1,
+    base_url: str | None = None,
+) -> dict:
+    rng = random.Random(seed)
+    weights = parse_mix(mix)
+
+    async with AsyncExitStack() as stack:
+        if base_url:
+            client = await stack.enter_async_context(
+                httpx.AsyncClient(base_url=base_url, timeout=30)
+            )
+        else:
+            client = await in_process_app(stack, ip_delay)
+
+        tokens, short_ids = await setup(client, users, links, rng)
+        rng.shuffle(short_ids)
+        popularity = Zipf(short_ids, zipf, rng)
+
+        if warmup:
+            await drive(
+                client, None, warmup, concurrency, weights, popularity, tokens, rng
+            )
+        recorder = Recorder()
+        elapsed = await drive(
+            client, recorder, requests, concurrency, weights, popularity, tokens, rng
+        )
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+            "python": platform.python_version(),
+            "target": base_url or "in-process (stand-ins)",
+            "config": {
+                "requests": requests,
+                "concurrency": concurrency,
+                "links": links,
+                "users": users,
+                "zipf": zipf,
+                "mix": weights,
+                "warmup": warmup,
+                "ip_delay": ip_delay,
+                "seed": seed,
+            },
+            "elapsed_s": round(elapsed, 3),
+        },
+        "results": recorder.summary(elapsed),
+    }
+
+
+def print_results(report: dict) -> None:
+    meta = report["meta"]
+    print(f"[✔] {meta['target']} @ {meta['commit']} in {meta['elapsed_s']}s")
+    print(f"{'operation':<10} {'count':>7} {'err':>5} {'rps':>9} {'p50':>8} {'p90':>8} {'p99':>8} {'max':>8}")  # fmt: skip
+    for op, result in report["results"].items():
+        latency = result["latency_ms"]
+        print(
+            f"{op:<10} {result['count']:>7} {result['errors']:>5} "
+            f"{result['throughput_rps']:>9} {latency['p50']:>8} {latency['p90']:>8} "
+            f"{latency['p99']:>8} {latency['max']:>8}"
+        )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--links", type=int, default=1000)
+    parser.add_argument("--users", type=int, default=4)
+    parser.add_argument("--zipf", type=float, default=1.1)
+    parser.add_argument("--mix", default=DEFAULT_MIX)
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument(
+        "--ip-delay", type=float, default=0.0, help="stub IP API latency, seconds"
+    )
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--base-url", help="drive a running server instead")
+    parser.add_argument("--output", help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(
+        run_benchmark(
+            requests=args.requests,
+            concurrency=args.concurrency,
+            links=args.links,
+            users=args.users,
+            zipf=args.zipf,
+            mix=args.mix,
+            warmup=args.warmup,
+            ip_delay=args.ip_delay,
+            seed=args.seed,
+            base_url=args.base_url,
+        )
+    )
+    print_results(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"[✔] Report written to {args.output}")
+    return 1 if report["results"]["total"]["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,879 @@
+"""
+In-memory stand-ins for Mongo and Redis, good enough to run the app.
+
+They implement the subset of motor and redis.asyncio the service uses:
+
+* Mongo: find / find_one / insert / update / delete / bulk_write /
+  find_one_and_update with the query and update operators linkly sends, and
+  an aggregation pipeline of ``$match``, ``$sort``, ``$project``,
+  ``$unwind``, ``$group`` (``$sum``), ``$skip`` and ``$limit``.
+* Redis: strings with expiry, counters, hashes, sorted sets, HyperLogLogs
+  (exact sets), streams, pub/sub, pipelines and the lease scripts of the
+  scheduler. Values are returned as bytes like a real client without
+  ``decode_responses``.
+
+There is no I/O, so numbers measured against them show the cost of the
+application code itself. ``stand_ins()`` swaps them in for the real clients
+and restores the real ones on exit.
+"""
+
+import asyncio
+import copy
+import sys
+import time
+from contextlib import contextmanager
+from types import SimpleNamespace
+from typing import Any
+
+from bson import ObjectId
+from pymongo import DeleteMany, DeleteOne, InsertOne, ReturnDocument, UpdateOne
+from redis.exceptions import ResponseError
+
+# ==================== MONGO ====================
+
+_MISSING = object()
+
+
+def get_path(doc: Any, path: str) -> Any:
+    for part in path.split("."):
+        if isinstance(doc, dict) and part in doc:
+            doc = doc[part]
+        else:
+            return _MISSING
+    return doc
+
+
+def set_path(doc: dict, path: str, value: Any) -> None:
+    *parents, last = path.split(".")
+    for part in parents:
+        doc = doc.setdefault(part, {})
+    doc[last] = value
+
+
+def _compare(op: str, value: Any, operand: Any) -> bool:
+    if op == "$exists":
+        return (value is not _MISSING) == bool(operand)
+    if value is _MISSING:
+        value = None
+    if op == "$eq":
+        return value == operand or (isinstance(value, list) and operand in value)
+    if op == "$ne":
+        return not _compare("$eq", value, operand)
+    if op == "$in":
+        return any(_compare("$eq", value, item) for item in operand)
+    if op == "$nin":
+        return not _compare("$in", value, operand)
+    if value is None or operand is None:
+        return False
+    try:
+        if op == "$gt":
+            return value > operand
+        if op == "$gte":
+            return value >= operand
+        if op == "$lt":
+            return value < operand
+        if op == "$lte":
+            return value <= operand
+    except TypeError:
+        return False
+    raise NotImplementedError(f"query operator {op}")
+
+
+def matches(doc: dict, query: dict | None) -> bool:
+    for key, condition in (query or {}).items():
+        if key == "$or":
+            if not any(matches(doc, sub) for sub in condition):
+                return False
+        elif key == "$and":
+            if not all(matches(doc, sub) for sub in condition):
+                return False
+        else:
+            value = get_path(doc, key)
+            if isinstance(condition, dict) and any(
+                k.startswith("$") for k in condition
+            ):
+                if not all(_compare(op, value, arg) for op, arg in condition.items()):
+                    return False
+            elif not _compare("$eq", value, condition):
+                return False
+    return True
+
+
+def apply_update(doc: dict, update: dict, inserting: bool = False) -> None:
+    for op, fields in update.items():
+        if op == "$setOnInsert" and not inserting:
+            continue
+        for path, value in fields.items():
+            current = get_path(doc, path)
+            if op in ("$set", "$setOnInsert"):
+                set_path(doc, path, copy.deepcopy(value))
+            elif op == "$unset":
+                *parents, last = path.split(".")
+                parent = get_path(doc, ".".join(parents)) if parents else doc
+                if isinstance(parent, dict):
+                    parent.pop(last, None)
+            elif op == "$inc":
+                set_path(doc, path, (0 if current is _MISSING else current) + value)
+            elif op in ("$push", "$addToSet"):
+                items = value["$each"] if isinstance(value, dict) else [value]
+                target = [] if current is _MISSING else current
+                for item in copy.deepcopy(items):
+                    if op == "$push" or item not in target:
+                        target.append(item)
+                limit = value.get("$slice") if isinstance(value, dict) else None
+                if limit is not None:
+                    target = target[limit:] if limit < 0 else target[:limit]
+                set_path(doc, path, target)
+            elif op == "$min":
+                if current is _MISSING or value < current:
+                    set_path(doc, path, value)
+            elif op == "$max":
+                if current is _MISSING or value > current:
+                    set_path(doc, path, value)
+            else:
+                raise NotImplementedError(f"update operator {op}")
+
+
+def project(doc: dict, projection: dict | None) -> dict:
+    if not projection:
+        return copy.deepcopy(doc)
+    include = {k for k, v in projection.items() if v and k != "_id"}
+    if include:
+        result = {}
+        if projection.get("_id", 1) and "_id" in doc:
+            result["_id"] = doc["_id"]
+        for field in include:
+            value = get_path(doc, field)
+            if value is not _MISSING:
+                set_path(result, field, copy.deepcopy(value))
+        return result
+    result = copy.deepcopy(doc)
+    for field, keep in projection.items():
+        if not keep:
+            result.pop(field, None)
+    return result
+
+
+def _sort_key(value: Any) -> tuple:
+    return (value is _MISSING or value is None, value if value is not _MISSING else 0)
+
+
+def sort_documents(docs: list[dict], spec) -> list[dict]:
+    if isinstance(spec, str):
+        spec = [(spec, 1)]
+    elif isinstance(spec, dict):
+        spec = list(spec.items())
+    for field, direction in reversed(spec):
+        docs.sort(key=lambda d: _sort_key(get_path(d, field)), reverse=direction < 0)
+    return docs
+
+
+def evaluate(expr: Any, doc: dict, variables: dict) -> Any:
+    if isinstance(expr, str) and expr.startswith("$$"):
+        name, _, path = expr[2:].partition(".")
+        value = variables[name]
+        return get_path(value, path) if path else value
+    if isinstance(expr, str) and expr.startswith("$"):
+        value = get_path(doc, expr[1:])
+        return None if value is _MISSING else value
+    if isinstance(expr, dict) and len(expr) == 1:
+        ((op, args),) = expr.items()
+        if op == "$filter":
+            items = evaluate(args["input"], doc, variables) or []
+            name = args.get("as", "this")
+            return [
+                item
+                for item in items
+                if evaluate(args["cond"], doc, {**variables, name: item})
+            ]
+        if op == "$size":
+            return len(evaluate(args, doc, variables) or [])
+        if op == "$and":
+            return all(evaluate(arg, doc, variables) for arg in args)
+        if op == "$or":
+            return any(evaluate(arg, doc, variables) for arg in args)
+        if op in ("$eq", "$ne", "$gt", "$gte", "$lt", "$lte"):
+            left, right = (evaluate(arg, doc, variables) for arg in args)
+            if op == "$eq":
+                return left == right
+            if op == "$ne":
+                return left != right
+            return _compare(op, left, right)
+    return expr
+
+
+class Cursor:
+    def __init__(self, produce):
+        self._produce = produce
+        self._sort = None
+        self._skip = 0
+        self._limit = 0
+
+    def sort(self, key_or_list, direction=None) -> "Cursor":
+        self._sort = (
+            [(key_or_list, direction or 1)]
+            if isinstance(key_or_list, str)
+            else key_or_list
+        )
+        return self
+
+    def skip(self, count: int) -> "Cursor":
+        self._skip = count
+        return self
+
+    def limit(self, count: int) -> "Cursor":
+        self._limit = count
+        return self
+
+    def batch_size(self, size: int) -> "Cursor":
+        return self
+
+    def _documents(self) -> list[dict]:
+        docs = self._produce()
+        if self._sort:
+            docs = sort_documents(docs, self._sort)
+        docs = docs[self._skip :]
+        return docs[: self._limit] if self._limit else docs
+
+    async def to_list(self, length: int | None = None) -> list[dict]:
+        docs = self._documents()
+        return docs[:length] if length else docs
+
+    def __aiter__(self):
+        return self._iterate()
+
+    async def _iterate(self):
+        for doc in self._documents():
+            yield doc
+
+
+class InMemoryCollection:
+    def __init__(self, name: str):
+        self.name = name
+        self.docs: dict[Any, dict] = {}
+
+    def _find(self, query: dict | None) -> list[dict]:
+        if query and set(query) == {"_id"} and not isinstance(query["_id"], dict):
+            doc = self.docs.get(query["_id"])
+            return [doc] if doc is not None else []
+        return [doc for doc in self.docs.values() if matches(doc, query)]
+
+    def find(
+        self, query: dict | None = None, projection: dict | None = None, **_
+    ) -> Cursor:
+        return Cursor(lambda: [project(doc, projection) for doc in self._find(query)])
+
+    async def find_one(
+        self, query: dict | None = None, projection: dict | None = None, **_
+    ):
+        found = self._find(query)
+        return project(found[0], projection) if found else None
+
+    async def count_documents(self, query: dict | None = None) -> int:
+        return len(self._find(query))
+
+    async def insert_one(self, doc: dict):
+        doc.setdefault("_id", ObjectId())
+        self.docs[doc["_id"]] = copy.deepcopy(doc)
+        return SimpleNamespace(inserted_id=doc["_id"], acknowledged=True)
+
+    async def insert_many(self, docs: list[dict], ordered: bool = True):
+        ids = [(await self.insert_one(doc)).inserted_id for doc in docs]
+        return SimpleNamespace(inserted_ids=ids, acknowledged=True)
+
+    def _upsert(self, query: dict, update: dict) -> dict:
+        doc = {
+            key: copy.deepcopy(value)
+            for key, value in query.items()
+            if not key.startswith("$")
+            and not (isinstance(value, dict) and any(k.startswith("$") for k in value))
+        }
+        doc.setdefault("_id", ObjectId())
+        apply_update(doc, update, inserting=True)
+        self.docs[doc["_id"]] = doc
+        return doc
+
+    async def update_one(self, query: dict, update: dict, upsert: bool = False):
+        found = self._find(query)
+        if found:
+            apply_update(found[0], update)
+            return SimpleNamespace(matched_count=1, modified_count=1, upserted_id=None)
+        if upsert:
+            doc = self._upsert(query, update)
+            return SimpleNamespace(
+                matched_count=0, modified_count=0, upserted_id=doc["_id"]
+            )
+        return SimpleNamespace(matched_count=0, modified_count=0, upserted_id=None)
+
+    async def update_many(self, query: dict, update: dict, upsert: bool = False):
+        found = self._find(query)
+        for doc in found:
+            apply_update(doc, update)
+        return SimpleNamespace(matched_count=len(found), modified_count=len(found))
+
+    async def find_one_and_update(
+        self,
+        query: dict,
+        update: dict,
+        projection: dict | None = None,
+        upsert: bool = False,
+        return_document: bool = ReturnDocument.BEFORE,
+        **_,
+    ):
+        found = self._find(query)
+        if found:
+            before = copy.deepcopy(found[0])
+            apply_update(found[0], update)
+            doc = found[0] if return_document == ReturnDocument.AFTER else before
+        elif upsert:
+            doc = self._upsert(query, update)
+            if return_document != ReturnDocument.AFTER:
+                return None
+        else:
+            return None
+        return project(doc, projection)
+
+    async def delete_one(self, query: dict):
+        found = self._find(query)
+        if found:
+            del self.docs[found[0]["_id"]]
+        return SimpleNamespace(deleted_count=len(found[:1]))
+
+    async def delete_many(self, query: dict):
+        found = self._find(query)
+        for doc in found:
+            del self.docs[doc["_id"]]
+        return SimpleNamespace(deleted_count=len(found))
+
+    async def bulk_write(self, operations: list, ordered: bool = True):
+        inserted = upserted = modified = deleted = 0
+        for op in operations:
+            if isinstance(op, InsertOne):
+                await self.insert_one(op._doc)
+                inserted += 1
+            elif isinstance(op, UpdateOne):
+                result = await self.update_one(op._filter, op._doc, upsert=op._upsert)
+                upserted += result.upserted_id is not None
+                modified += result.modified_count
+            elif isinstance(op, DeleteOne):
+                deleted += (await self.delete_one(op._filter)).deleted_count
+            elif isinstance(op, DeleteMany):
+                deleted += (await self.delete_many(op._filter)).deleted_count
+            else:
+                raise NotImplementedError(type(op).__name__)
+        return SimpleNamespace(
+            inserted_count=inserted,
+            upserted_count=upserted,
+            modified_count=modified,
+            deleted_count=deleted,
+        )
+
+    async def create_indexes(self, models: list) -> list[str]:
+        return [model.document["name"] for model in models]
+
+    def aggregate(self, pipeline: list[dict], **_) -> Cursor:
+        return Cursor(lambda: self._aggregate(pipeline))
+
+    def _aggregate(self, pipeline: list[dict]) -> list[dict]:
+        docs = [copy.deepcopy(doc) for doc in self.docs.values()]
+        for stage in pipeline:
+            ((name, spec),) = stage.items()
+            if name == "$match":
+                docs = [doc for doc in docs if matches(doc, spec)]
+            elif name == "$sort":
+                docs = sort_documents(docs, spec)
+            elif name == "$skip":
+                docs = docs[spec:]
+            elif name == "$limit":
+                docs = docs[:spec]
+            elif name == "$project":
+                docs = [self._project_stage(doc, spec) for doc in docs]
+            elif name == "$unwind":
+                docs = self._unwind(docs, spec)
+            elif name == "$group":
+                docs = self._group(docs, spec)
+            else:
+                raise NotImplementedError(f"aggregation stage {name}")
+        return docs
+
+    @staticmethod
+    def _project_stage(doc: dict, spec: dict) -> dict:
+        result = {"_id": doc["_id"]} if spec.get("_id", 1) and "_id" in doc else {}
+        for field, value in spec.items():
+            if field == "_id":
+                continue
+            if value in (1, True):
+                found = get_path(doc, field)
+                if found is not _MISSING:
+                    set_path(result, field, found)
+            elif value not in (0, False):
+                set_path(result, field, evaluate(value, doc, {}))
+        return result
+
+    @staticmethod
+    def _group(docs: list[dict], spec: dict) -> list[dict]:
+        groups: dict = {}
+        for doc in docs:
+            key = evaluate(spec["_id"], doc, {})
+            group = groups.setdefault(repr(key), {"_id": key})
+            for field, accumulator in spec.items():
+                if field == "_id":
+                    continue
+                ((op, expr),) = accumulator.items()
+                if op != "$sum":
+                    raise NotImplementedError(f"accumulator {op}")
+                group[field] = group.get(field, 0) + (evaluate(expr, doc, {}) or 0)
+        return list(groups.values())
+
+    @staticmethod
+    def _unwind(docs: list[dict], spec) -> list[dict]:
+        if isinstance(spec, str):
+            spec = {"path": spec}
+        field = spec["path"][1:]
+        index_field = spec.get("includeArrayIndex")
+        result = []
+        for doc in docs:
+            items = get_path(doc, field)
+            if not isinstance(items, list) or not items:
+                if spec.get("preserveNullAndEmptyArrays"):
+                    result.append(doc)
+                continue
+            for i, item in enumerate(items):
+                unwound = dict(doc)
+                set_path(unwound, field, item)
+                if index_field:
+                    unwound[index_field] = i
+                result.append(unwound)
+        return result
+
+
+class InMemoryDatabase:
+    def __init__(self, name: str = "linkly"):
+        self.name = name
+        self._collections: dict[str, InMemoryCollection] = {}
+
+    def __getitem__(self, name: str) -> InMemoryCollection:
+        if name not in self._collections:
+            self._collections[name] = InMemoryCollection(name)
+        return self._collections[name]
+
+    def __getattr__(self, name: str) -> InMemoryCollection:
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return self[name]
+
+
+class InMemoryMongoClient:
+    def __init__(self):
+        self._databases: dict[str, InMemoryDatabase] = {}
+
+    def __getitem__(self, name: str) -> InMemoryDatabase:
+        if name not in self._databases:
+            self._databases[name] = InMemoryDatabase(name)
+        return self._databases[name]
+
+
+# ==================== REDIS ====================
+
+
+def _encode(value: Any) -> bytes:
+    if isinstance(value, bytes):
+        return value
+    if isinstance(value, (int, float)):
+        return repr(value).encode()
+    return str(value).encode()
+
+
+class InMemoryPipeline:
+    def __init__(self, redis: "InMemoryRedis"):
+        self.redis = redis
+        self.commands: list = []
+
+    def __getattr__(self, name: str):
+        command = getattr(self.redis, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((command, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self, raise_on_error: bool = True) -> list:
+        commands, self.commands = self.commands, []
+        results = []
+        for command, args, kwargs in commands:
+            try:
+                results.append(await command(*args, **kwargs))
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        return results
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.commands = []
+
+
+class InMemoryPubSub:
+    def __init__(self, redis: "InMemoryRedis"):
+        self.redis = redis
+        self.queue: asyncio.Queue = asyncio.Queue()
+        self.channels: set[bytes] = set()
+
+    async def subscribe(self, *channels) -> None:
+        for channel in map(_encode, channels):
+            self.channels.add(channel)
+            self.redis._subscribers.setdefault(channel, set()).add(self)
+            self.queue.put_nowait({"type": "subscribe", "channel": channel, "data": 1})
+
+    async def unsubscribe(self, *channels) -> None:
+        for channel in map(_encode, channels or tuple(self.channels)):
+            self.channels.discard(channel)
+            self.redis._subscribers.get(channel, set()).discard(self)
+
+    async def listen(self):
+        while True:
+            yield await self.queue.get()
+
+    async def aclose(self) -> None:
+        await self.unsubscribe()
+
+
+class InMemoryRedis:
+    def __init__(self):
+        self.data: dict[bytes, Any] = {}
+        self.expires: dict[bytes, float] = {}
+        self._subscribers: dict[bytes, set[InMemoryPubSub]] = {}
+        # stream key -> group -> {"delivered": index, "pending": {id: [...]}}
+        self._groups: dict[bytes, dict[bytes, dict]] = {}
+        self._appended = asyncio.Event()
+
+    def _live(self, key) -> bytes:
+        key = _encode(key)
+        deadline = self.expires.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+        return key
+
+    def _expire_in(self, key: bytes, seconds: float | None) -> None:
+        if seconds is None:
+            self.expires.pop(key, None)
+        else:
+            self.expires[key] = time.monotonic() + seconds
+
+    def pipeline(self, transaction: bool = True) -> InMemoryPipeline:
+        return InMemoryPipeline(self)
+
+    def pubsub(self) -> InMemoryPubSub:
+        return InMemoryPubSub(self)
+
+    async def ping(self) -> bool:
+        return True
+
+    async def get(self, key):
+        return self.data.get(self._live(key))
+
+    async def set(self, key, value, ex=None, px=None, nx=False, xx=False):
+        key = self._live(key)
+        if (nx and key in self.data) or (xx and key not in self.data):
+            return None
+        self.data[key] = _encode(value)
+        self._expire_in(key, ex if ex is not None else (px / 1000 if px else None))
+        return True
+
+    async def delete(self, *keys) -> int:
+        removed = 0
+        for key in map(self._live, keys):
+            removed += self.data.pop(key, None) is not None
+            self.expires.pop(key, None)
+        return removed
+
+    async def exists(self, *keys) -> int:
+        return sum(self._live(key) in self.data for key in keys)
+
+    async def expire(self, key, seconds) -> bool:
+        key = self._live(key)
+        if key not in self.data:
+            return False
+        self._expire_in(key, seconds)
+        return True
+
+    async def eval(self, script, numkeys, key, token, *args):
+        # only the owner-checked scripts of linkly.services.scheduler.Lease
+        if self.data.get(self._live(key)) != _encode(token):
+            return 0
+        if 'redis.call("expire"' in script:
+            return int(await self.expire(key, *args))
+        return await self.delete(key)
+
+    async def ttl(self, key) -> int:
+        key = self._live(key)
+        if key not in self.data:
+            return -2
+        if key not in self.expires:
+            return -1
+        return max(0, round(self.expires[key] - time.monotonic()))
+
+    async def incrby(self, key, amount: int = 1) -> int:
+        key = self._live(key)
+        value = int(self.data.get(key, b"0")) + amount
+        self.data[key] = _encode(value)
+        return value
+
+    async def incr(self, key, amount: int = 1) -> int:
+        return await self.incrby(key, amount)
+
+    async def hincrby(self, key, field, amount: int = 1) -> int:
+        hash_ = self.data.setdefault(self._live(key), {})
+        field = _encode(field)
+        hash_[field] = _encode(int(hash_.get(field, b"0")) + amount)
+        return int(hash_[field])
+
+    async def hset(self, key, field=None, value=None, mapping=None) -> int:
+        hash_ = self.data.setdefault(self._live(key), {})
+        items = dict(mapping or {})
+        if field is not None:
+            items[field] = value
+        added = 0
+        for f, v in items.items():
+            added += _encode(f) not in hash_
+            hash_[_encode(f)] = _encode(v)
+        return added
+
+    async def hget(self, key, field):
+        return self.data.get(self._live(key), {}).get(_encode(field))
+
+    async def hgetall(self, key) -> dict:
+        return dict(self.data.get(self._live(key), {}))
+
+    async def hdel(self, key, *fields) -> int:
+        hash_ = self.data.get(self._live(key), {})
+        return sum(hash_.pop(_encode(f), None) is not None for f in fields)
+
+    async def sadd(self, key, *members) -> int:
+        set_ = self.data.setdefault(self._live(key), set())
+        before = len(set_)
+        set_.update(map(_encode, members))
+        return len(set_) - before
+
+    async def srem(self, key, *members) -> int:
+        set_ = self.data.get(self._live(key), set())
+        removed = [m for m in map(_encode, members) if m in set_]
+        set_.difference_update(removed)
+        return len(removed)
+
+    async def srandmember(self, key, number: int) -> list:
+        return list(self.data.get(self._live(key), set()))[:number]
+
+    async def smembers(self, key) -> set:
+        return set(self.data.get(self._live(key), set()))
+
+    async def rename(self, key, new) -> bool:
+        key, new = self._live(key), _encode(new)
+        if key not in self.data:
+            raise ResponseError("no such key")
+        self.data[new] = self.data.pop(key)
+        self._expire_in(new, None)
+        if key in self.expires:
+            self.expires[new] = self.expires.pop(key)
+        return True
+
+    async def zadd(self, key, mapping: dict, nx: bool = False) -> int:
+        zset = self.data.setdefault(self._live(key), {})
+        added = 0
+        for member, score in mapping.items():
+            member = _encode(member)
+            if nx and member in zset:
+                continue
+            added += member not in zset
+            zset[member] = float(score)
+        return added
+
+    async def zscore(self, key, member) -> float | None:
+        return self.data.get(self._live(key), {}).get(_encode(member))
+
+    async def zrangebyscore(
+        self, key, min, max, start=None, num=None, withscores=False
+    ) -> list:
+        low = float("-inf") if min == "-inf" else float(min)
+        high = float("inf") if max == "+inf" else float(max)
+        found = sorted(
+            (score, member)
+            for member, score in self.data.get(self._live(key), {}).items()
+            if low <= score <= high
+        )
+        if start is not None:
+            found = found[start : start + num]
+        if withscores:
+            return [(member, score) for score, member in found]
+        return [member for _, member in found]
+
+    async def zrem(self, key, *members) -> int:
+        zset = self.data.get(self._live(key), {})
+        return sum(zset.pop(_encode(m), None) is not None for m in members)
+
+    async def zcard(self, key) -> int:
+        return len(self.data.get(self._live(key), {}))
+
+    async def xadd(self, key, fields: dict, maxlen=None, approximate=True) -> bytes:
+        entries = self.data.setdefault(self._live(key), [])
+        entry_id = _encode(f"{time.time_ns() // 1_000_000}-{len(entries)}")
+        entries.append((entry_id, {_encode(k): _encode(v) for k, v in fields.items()}))
+        self._appended.set()
+        return entry_id
+
+    async def xlen(self, key) -> int:
+        return len(self.data.get(self._live(key), []))
+
+    async def xgroup_create(self, key, group, id="$", mkstream=False) -> bool:
+        key, group = self._live(key), _encode(group)
+        groups = self._groups.setdefault(key, {})
+        if group in groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        entries = self.data.setdefault(key, [])
+        start = len(entries) if id == "$" else 0
+        groups[group] = {"delivered": start, "pending": {}}
+        return True
+
+    async def xgroup_delconsumer(self, key, group, consumer) -> int:
+        return 0
+
+    async def xreadgroup(
+        self, group, consumer, streams: dict, count=None, block=None
+    ) -> list:
+        deadline = time.monotonic() + (block or 0) / 1000
+        while True:
+            response = []
+            for key in streams:
+                key = self._live(key)
+                state = self._groups[key][_encode(group)]
+                entries = self.data[key][state["delivered"] :][:count]
+                state["delivered"] += len(entries)
+                for entry_id, _ in entries:
+                    state["pending"][entry_id] = [
+                        _encode(consumer),
+                        time.monotonic(),
+                        1,
+                    ]
+                if entries:
+                    response.append([key, entries])
+            timeout = deadline - time.monotonic()
+            if response or block is None or timeout <= 0:
+                return response
+            self._appended.clear()
+            try:
+                await asyncio.wait_for(self._appended.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+
+    async def xack(self, key, group, *ids) -> int:
+        pending = self._groups[self._live(key)][_encode(group)]["pending"]
+        return sum(pending.pop(_encode(i), None) is not None for i in ids)
+
+    async def xpending_range(
+        self, key, group, min, max, count, consumername=None, idle=None
+    ) -> list[dict]:
+        now = time.monotonic()
+        pending = self._groups[self._live(key)][_encode(group)]["pending"]
+        found = []
+        for entry_id, (consumer, since, delivered) in pending.items():
+            waited = (now - since) * 1000
+            if consumername is not None and consumer != _encode(consumername):
+                continue
+            if idle is not None and waited < idle:
+                continue
+            found.append(
+                {
+                    "message_id": entry_id,
+                    "consumer": consumer,
+                    "time_since_delivered": int(waited),
+                    "times_delivered": delivered,
+                }
+            )
+        return found[:count]
+
+    async def xclaim(
+        self, key, group, consumer, min_idle_time, message_ids: list
+    ) -> list:
+        key = self._live(key)
+        pending = self._groups[key][_encode(group)]["pending"]
+        fields = dict(self.data.get(key, []))
+        claimed = []
+        for entry_id in map(_encode, message_ids):
+            if entry_id in pending:
+                delivered = pending[entry_id][2] + 1
+                pending[entry_id] = [_encode(consumer), time.monotonic(), delivered]
+                claimed.append((entry_id, fields.get(entry_id)))
+        return claimed
+
+    async def pfadd(self, key, *values) -> int:
+        members = self.data.setdefault(self._live(key), set())
+        before = len(members)
+        members.update(map(_encode, values))
+        return int(len(members) != before)
+
+    async def pfcount(self, *keys) -> int:
+        return len(set().union(*(self.data.get(self._live(k), set()) for k in keys)))
+
+    async def publish(self, channel, message) -> int:
+        subscribers = self._subscribers.get(_encode(channel), set())
+        for pubsub in subscribers:
+            pubsub.queue.put_nowait(
+                {
+                    "type": "message",
+                    "channel": _encode(channel),
+                    "data": _encode(message),
+                }
+            )
+        return len(subscribers)
+
+    async def aclose(self) -> None:
+        pass
+
+
+# ==================== PATCHING ====================
+
+
+@contextmanager
+def stand_ins(mongo=None, redis=None):
+    """
+    Replace the mongo client and every module level ``redis_client`` of the
+    already imported ``linkly`` modules, and put them back afterwards.
+    """
+    import linkly.database as database
+
+    mongo = mongo if mongo is not None else InMemoryMongoClient()
+    redis = redis if redis is not None else InMemoryRedis()
+    real_redis = database.redis_client
+
+    patched = [(database, "client", database.client)]
+    for name, module in list(sys.modules.items()):
+        if (name == "linkly" or name.startswith("linkly.")) and getattr(
+            module, "redis_client", None
+        ) is real_redis:
+            patched.append((module, "redis_client", real_redis))
+
+    for module, attr, _ in patched:
+        setattr(module, attr, redis if attr == "redis_client" else mongo)
+
+    # objects holding the client itself rather than the module global
+    holders = [
+        obj
+        for module, attr, _ in patched
+        for obj in vars(module).values()
+        if getattr(obj, "redis", None) is real_redis
+    ]
+    for obj in holders:
+        obj.redis = redis
+
+    try:
+        yield mongo, redis
+    finally:
+        for module, attr, value in patched:
+            setattr(module, attr, value)
+        for obj in holders:
+            obj.redis = real_redis
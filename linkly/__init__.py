@@ -1,45 +1,62 @@
-import asyncio
 from contextlib import asynccontextmanager
 
-import redis.asyncio as redis
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi_cache import FastAPICache
 from fastapi_cache.backends.redis import RedisBackend
 from starlette.middleware.sessions import SessionMiddleware
 
-from linkly.database import get_db_instance
+from linkly.authentication.jwt.principal import principal_invalidation_listener
+from linkly.database import get_db_instance, redis_client
+from linkly.indexes import ensure_indexes
 
 # --- Routers ---
-from linkly.routes import auth, shortner
+from linkly.routes import auth, metrics, profiles, shortner
+from linkly.services.clicks import click_queue
+from linkly.services.counters import rollup_counters
+from linkly.services.expiry import expiry_sweeper
+from linkly.services.metrics import metrics_exporter
+from linkly.services.passwords import password_hasher
+from linkly.services.profiling import profiling
+from linkly.services.qr import qr_cache
+from linkly.services.redirect_cache import redirect_invalidation_listener
+from linkly.services.scheduler import scheduler
+from linkly.services.upstreams import upstreams
 from linkly.settings import settings
+from linkly.utils.asgi import PathScoped
 
 
-# --- Redis Key Expiry Listener ---
-async def redis_key_expiry_listener(redis_client):
-    await redis_client.config_set("notify-keyspace-events", "Ex")
-    pubsub = redis_client.pubsub()
-    await pubsub.subscribe("__keyevent@0__:expired")
-
-    db = get_db_instance()
-    async for message in pubsub.listen():
-        if message["type"] == "message":
-            key = message["data"]
-            if isinstance(key, bytes):
-                key = key.decode()
-            if key.startswith("expire:"):
-                short_id = key.split(":")[1]
-                await db.urls.delete_one({"short_id": short_id})
-                print(f"[✔] Deleted expired link: {short_id}")
-
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    redis_url = settings.redis_url.replace("redis://", "rediss://")
-    redis_client = redis.from_url(redis_url)
     FastAPICache.init(RedisBackend(redis_client), prefix="fastapi-cache")
-    
-    asyncio.create_task(redis_key_expiry_listener(redis_client))
+
+    scheduler.supervise(
+        "redirect-invalidation", lambda: redirect_invalidation_listener(redis_client)
+    )
+    scheduler.supervise(
+        "principal-invalidation", lambda: principal_invalidation_listener(redis_client)
+    )
+    scheduler.every(
+        "expiry-sweep",
+        settings.EXPIRY_SWEEP_INTERVAL,
+        lambda: expiry_sweeper.tick(get_db_instance()),
+    )
+    await ensure_indexes(get_db_instance())
+    await click_queue.start(get_db_instance())
+    await rollup_counters.start(get_db_instance())
+    await scheduler.start()
+    await metrics_exporter.start()
+    await profiling.start()
     yield
+    await profiling.stop()
+    await metrics_exporter.stop()
+    await scheduler.stop()
+    await click_queue.stop()
+    await rollup_counters.stop()
+    password_hasher.shutdown()
+    qr_cache.shutdown()
+    await upstreams.aclose()
+
 
 app = FastAPI(lifespan=lifespan)
 
@@ -54,11 +71,14 @@ origins = [
 ]
 
 
+# only the oauth flows keep state in the session cookie
 app.add_middleware(
-    SessionMiddleware,
+    PathScoped,
+    prefixes=("/auth/",),
+    middleware=SessionMiddleware,
     secret_key=settings.SESSION_SECRET,
-    same_site = "lax"
-    # https_only=True    
+    same_site="lax",
+    # https_only=True
 )
 
 app.add_middleware(
@@ -70,4 +90,7 @@ app.add_middleware(
 )
 
 app.include_router(auth.router)
+# before shortner, whose /{short_id} would match /metrics
+app.include_router(metrics.router)
+app.include_router(profiles.router)
 app.include_router(shortner.router)
@@ -4,6 +4,7 @@ from fastapi import Depends, Header, HTTPException
 from fastapi.security import OAuth2PasswordBearer
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
+from linkly.authentication.jwt.principal import PRINCIPAL_FIELDS, principal_cache
 from linkly.authentication.jwt.token import verify_token
 from linkly.database import get_db_instance as get_db
 from linkly.services.auth import UserRepository
@@ -14,12 +15,18 @@ oauth2_scheme = OAuth2PasswordBearer(tokenUrl="login")
 async def get_current_user(
     token: str = Depends(oauth2_scheme), db: AsyncIOMotorDatabase = Depends(get_db)
 ):
+    cached = principal_cache.get(token)
+    if cached is not None:
+        # copy, handlers must not be able to change the cached entry
+        return dict(cached[1])
+
     repo = UserRepository(db)
     token_data = verify_token(token)
-    user = await repo.find_by_id(token_data.user_id)
+    user = await repo.find_by_id(token_data.user_id, projection=PRINCIPAL_FIELDS)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
-    return user
+    principal_cache.set(token, token_data, user)
+    return dict(user)
 
 
 async def optional_current_user(
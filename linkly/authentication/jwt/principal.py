@@ -0,0 +1,107 @@
+"""
+Per-worker cache of authenticated principals.
+
+``get_current_user`` used to decode the JWT and read the user from Mongo on
+every authenticated request. Entries here are keyed by a digest of the token
+(the token itself is never kept) and hold the decoded claims plus a slim
+projection of the user, for ``PRINCIPAL_CACHE_TTL`` seconds or until the
+token expires, whichever comes first.
+
+Code that modifies or deletes a user awaits ``principal_cache.invalidate``.
+It drops the user's tokens from this worker and publishes the user id on
+``INVALIDATION_CHANNEL``; ``principal_invalidation_listener``, supervised by
+the scheduler on every worker, drops them everywhere else. The change is
+visible on the next request to any worker.
+"""
+
+import hashlib
+import time
+
+from linkly.database import redis_client
+from linkly.models.users import TokenData
+from linkly.settings import settings
+from linkly.utils.lru import LRUCache
+
+# all that request handlers read from the current user; never the password
+PRINCIPAL_FIELDS = {"_id": 1, "name": 1, "email": 1, "oauth": 1}
+
+INVALIDATION_CHANNEL = "linkly:principal-invalidate"
+
+
+def token_digest(token: str) -> str:
+    return hashlib.blake2b(token.encode(), digest_size=16).hexdigest()
+
+
+class PrincipalCache:
+    def __init__(self, maxsize: int, ttl: int):
+        self.ttl = ttl
+        self.entries = LRUCache(maxsize=maxsize, ttl=ttl)
+
+    def get(self, token: str) -> tuple[TokenData, dict] | None:
+        return self.entries.get(token_digest(token))
+
+    def set(self, token: str, claims: TokenData, user: dict) -> None:
+        ttl = self.ttl
+        if claims.exp is not None:
+            ttl = min(ttl, claims.exp - time.time())
+        if ttl > 0:
+            self.entries.set(token_digest(token), (claims, user), ttl=ttl)
+
+    async def invalidate(self, user_id) -> int:
+        """
+        Drop every cached token of ``user_id`` in every worker. Returns how
+        many were dropped in this one.
+        """
+        dropped = self.invalidate_user(user_id)
+        try:
+            await redis_client.publish(INVALIDATION_CHANNEL, str(user_id))
+        except Exception as e:
+            print(f"[!] Principal invalidation failed for {user_id}: {e}")
+        return dropped
+
+    def invalidate_user(self, user_id) -> int:
+        """
+        Drop every cached token of ``user_id`` in this worker. Returns how
+        many were dropped.
+        """
+        user_id = str(user_id)
+        stale = [
+            key
+            for key, (claims, _) in self.entries.items()
+            if claims.user_id == user_id
+        ]
+        for key in stale:
+            self.entries.pop(key)
+        return len(stale)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def stats(self) -> dict:
+        return self.entries.stats()
+
+
+principal_cache = PrincipalCache(
+    maxsize=settings.PRINCIPAL_CACHE_SIZE, ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+
+async def principal_invalidation_listener(redis_client):
+    """
+    Drop the tokens of users published by other workers.
+    Supervised by the scheduler, which restarts it when the connection drops.
+    """
+    pubsub = redis_client.pubsub()
+    try:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        # invalidations published while nobody was listening are lost
+        principal_cache.clear()
+
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                user_id = message["data"]
+                if isinstance(user_id, bytes):
+                    user_id = user_id.decode()
+                principal_cache.invalidate_user(user_id)
+    finally:
+        await pubsub.aclose()
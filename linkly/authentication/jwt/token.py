@@ -28,7 +28,7 @@ def verify_token(token: str):
         user_id = payload.get("sub")
         if user_id is None:
             raise
-        return TokenData(user_id=user_id)
+        return TokenData(user_id=user_id, exp=payload.get("exp"))
     except InvalidTokenError:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token"
@@ -1,5 +1,6 @@
 from authlib.integrations.starlette_client import OAuth
 
+from linkly.services.upstreams import upstreams
 from linkly.settings import settings
 
 oauth = OAuth()
@@ -22,3 +23,11 @@ oauth.register(
     api_base_url="https://api.github.com/",
     client_kwargs={"scope": "user:email"},
 )
+
+# profile lookups after the token exchange go through the shared http pools
+google_api = upstreams.register("google", "https://www.googleapis.com/oauth2/v1/")
+github_api = upstreams.register("github", "https://api.github.com/")
+
+
+def bearer(token: dict) -> dict:
+    return {"Authorization": f"Bearer {token['access_token']}"}
@@ -0,0 +1,58 @@
+"""
+Consume the click stream: geolocate, dedup and store clicks out of the web
+process. Run as many as needed; they share the work through one consumer
+group. SIGTERM or Ctrl-C finishes the batch in hand and exits.
+
+usage: linkly-analytics-worker [--consumer NAME] [--batch 500]
+       python -m linkly.commands.analytics_worker
+"""
+
+import argparse
+import asyncio
+import signal
+import sys
+
+from linkly.database import get_db_instance
+from linkly.services.click_stream import analytics_worker
+from linkly.services.counters import rollup_counters
+from linkly.services.metrics import metrics_exporter
+from linkly.services.upstreams import upstreams
+
+
+async def run() -> None:
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, analytics_worker.stop)
+
+    db = get_db_instance()
+    await rollup_counters.start(db)
+    await metrics_exporter.start()
+    try:
+        await analytics_worker.run(db)
+    finally:
+        await metrics_exporter.stop()
+        await rollup_counters.stop()
+        await upstreams.aclose()
+    print(
+        f"[✔] Analytics worker stopped after {analytics_worker.processed} clicks "
+        f"({analytics_worker.counted} counted, {analytics_worker.dead} dead-lettered)"
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--consumer", help="consumer name, defaults to hostname:pid")
+    parser.add_argument("--batch", type=int, help="entries read per batch")
+    args = parser.parse_args(argv)
+
+    if args.consumer:
+        analytics_worker.consumer = args.consumer
+    if args.batch:
+        analytics_worker.batch_size = args.batch
+
+    asyncio.run(run())
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
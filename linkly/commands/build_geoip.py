@@ -0,0 +1,49 @@
+"""
+Compile a CSV dump of IP ranges into the binary format read by
+``linkly.utils.geoip.GeoIPDatabase``.
+
+The CSV needs a header row. By default the columns ``start_ip``, ``end_ip``,
+``city`` and ``country`` are used and every other column is ignored.
+
+usage: python -m linkly.commands.build_geoip ranges.csv geoip.bin
+"""
+
+import argparse
+import csv
+
+from linkly.utils.geoip import build_database, format_location
+
+
+def read_ranges(path: str, start: str, end: str, city: str, country: str):
+    with open(path, newline="", encoding="utf-8") as f:
+        for row in csv.DictReader(f):
+            yield (
+                row[start].strip(),
+                row[end].strip(),
+                format_location(row.get(city), row.get(country)),
+            )
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("source", help="CSV file with one IP range per row")
+    parser.add_argument("output", help="path of the database file to write")
+    parser.add_argument("--start-column", default="start_ip")
+    parser.add_argument("--end-column", default="end_ip")
+    parser.add_argument("--city-column", default="city")
+    parser.add_argument("--country-column", default="country")
+    args = parser.parse_args(argv)
+
+    rows = read_ranges(
+        args.source,
+        args.start_column,
+        args.end_column,
+        args.city_column,
+        args.country_column,
+    )
+    count = build_database(rows, args.output)
+    print(f"[✔] Wrote {count} ranges to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
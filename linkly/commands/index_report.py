@@ -0,0 +1,94 @@
+"""
+Compare the indexes that exist in Mongo with the registry in
+``linkly.indexes`` and with ``$indexStats`` usage counters.
+
+Each index is reported as one of:
+
+* ``missing``  - in the registry but not in the database
+* ``unused``   - exists but has not served a query since the counters were
+  last reset (a ``mongod`` restart resets them)
+* ``extra``    - exists but is not in the registry
+* ``ok``       - in the registry, present and used
+
+usage: python -m linkly.commands.index_report [--apply]
+"""
+
+import argparse
+import asyncio
+
+from linkly.database import get_db_instance
+from linkly.indexes import INDEXES, by_collection, ensure_indexes
+
+
+async def index_usage(db_cm, collection: str) -> dict[str, int]:
+    """
+    Operations served per index name since the counters were last reset.
+    """
+    cursor = db_cm[collection].aggregate([{"$indexStats": {}}])
+    return {stat["name"]: stat["accesses"]["ops"] async for stat in cursor}
+
+
+async def index_report(db_cm) -> list[dict]:
+    rows = []
+    for collection, specs in by_collection(INDEXES).items():
+        usage = await index_usage(db_cm, collection)
+        expected = {spec.name for spec in specs}
+
+        for spec in specs:
+            if spec.name not in usage:
+                status = "missing"
+            elif usage[spec.name] == 0:
+                status = "unused"
+            else:
+                status = "ok"
+            rows.append(
+                {
+                    "collection": collection,
+                    "index": spec.name,
+                    "status": status,
+                    "ops": usage.get(spec.name),
+                }
+            )
+
+        for name, ops in usage.items():
+            if name != "_id_" and name not in expected:
+                rows.append(
+                    {
+                        "collection": collection,
+                        "index": name,
+                        "status": "unused" if ops == 0 else "extra",
+                        "ops": ops,
+                    }
+                )
+    return rows
+
+
+async def run(apply: bool = False) -> list[dict]:
+    db = get_db_instance()
+    if apply:
+        await ensure_indexes(db)
+    return await index_report(db)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--apply", action="store_true", help="build missing indexes before reporting"
+    )
+    args = parser.parse_args(argv)
+
+    rows = asyncio.run(run(args.apply))
+    for row in rows:
+        ops = "-" if row["ops"] is None else row["ops"]
+        print(
+            f"{row['status']:<8} {row['collection']:<24} {row['index']:<36} ops={ops}"
+        )
+
+    missing = sum(row["status"] == "missing" for row in rows)
+    unused = sum(row["status"] == "unused" for row in rows)
+    mark = "[!]" if missing else "[✔]"
+    print(f"{mark} {missing} missing, {unused} unused of {len(rows)} indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""
+Move legacy ``url_analytics`` documents (one document per link holding every
+click and fingerprint) into the bucketed layout (``url_analytics_buckets``),
+build their rollups and load their fingerprints into the visitor
+HyperLogLogs.
+
+Documents are streamed from a cursor one at a time, so memory stays bounded
+by the largest legacy document. Migrated documents are stamped with
+``migrated_at`` (or removed with ``--drop``) and skipped by the next run.
+A document interrupted halfway is migrated again without counting twice:
+its buckets are upserted under deterministic ids, its rollup increments
+only apply to rollups that do not list it in ``migrations`` yet, and the
+visitor HyperLogLogs ignore fingerprints they already hold.
+
+usage: python -m linkly.commands.migrate_analytics [--batch-size N] [--drop]
+"""
+
+import argparse
+import asyncio
+from datetime import datetime, timezone
+
+from pymongo import UpdateOne
+
+from linkly.database import get_db_instance
+from linkly.services.analytics import bucket_start, legacy_operations
+from linkly.services.counters import guarded_upserts
+from linkly.services.rollups import rollup_increments
+from linkly.services.visitors import add_visitors
+
+
+def legacy_rollups(doc: dict) -> list[UpdateOne]:
+    """
+    Rollup ``$inc`` upserts for a legacy document, applied once per rollup.
+    """
+    migration = f"legacy:{doc['_id']}"
+    clicks = [(doc["short_id"], click) for click in doc.get("click_details") or []]
+    return [
+        UpdateOne(
+            {
+                "short_id": short_id,
+                "period": period,
+                "bucket": bucket,
+                "migrations": {"$ne": migration},
+            },
+            {"$inc": counters, "$addToSet": {"migrations": migration}},
+            upsert=True,
+        )
+        for (short_id, period, bucket), counters in rollup_increments(clicks).items()
+    ]
+
+
+async def migrate_visitors(doc: dict) -> None:
+    await add_visitors(doc["short_id"], doc.get("finger_print") or [])
+
+    # legacy clicks carry ip and user agent, which is all a fingerprint is
+    per_day: dict = {}
+    for click in doc.get("click_details") or []:
+        fingerprint = f"{click.get('ip')}{click.get('user_agent')}".lower().strip()
+        per_day.setdefault(bucket_start(click["timestamp"], "day"), []).append(
+            fingerprint
+        )
+    for day, fingerprints in per_day.items():
+        await add_visitors(doc["short_id"], fingerprints, day)
+
+
+async def migrate(batch_size: int = 100, drop: bool = False) -> int:
+    db = get_db_instance()
+    cursor = db.url_analytics.find(
+        {"migrated_at": {"$exists": False}}, batch_size=batch_size
+    )
+
+    migrated = 0
+    async for doc in cursor:
+        buckets = legacy_operations(doc)
+        if buckets:
+            await db.url_analytics_buckets.bulk_write(buckets, ordered=False)
+            await guarded_upserts(db.url_rollups, legacy_rollups(doc))
+        await migrate_visitors(doc)
+
+        if drop:
+            await db.url_analytics.delete_one({"_id": doc["_id"]})
+        else:
+            await db.url_analytics.update_one(
+                {"_id": doc["_id"]},
+                {"$set": {"migrated_at": datetime.now(timezone.utc)}},
+            )
+        migrated += 1
+        print(f"[✔] Migrated {doc['short_id']} ({len(buckets)} buckets)")
+
+    return migrated
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--batch-size", type=int, default=100)
+    parser.add_argument(
+        "--drop", action="store_true", help="delete legacy documents once migrated"
+    )
+    args = parser.parse_args(argv)
+
+    count = asyncio.run(migrate(args.batch_size, args.drop))
+    print(f"[✔] Migrated {count} analytics documents")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Print a token for the ``X-Linkly-Profile`` header, signed with PROFILE_SECRET.
+
+A request carrying it is profiled, and it opens the /profiles endpoints,
+until it expires.
+
+usage: python -m linkly.commands.profile_token [--ttl 3600]
+"""
+
+import argparse
+import sys
+import time
+
+from linkly.services.profiling import sign_token
+from linkly.settings import settings
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--ttl", type=int, default=3600, help="seconds the token stays valid"
+    )
+    args = parser.parse_args(argv)
+
+    if not settings.PROFILE_SECRET:
+        print("[!] PROFILE_SECRET is not set")
+        return 1
+
+    print(sign_token(settings.PROFILE_SECRET, int(time.time()) + args.ttl))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,11 +1,51 @@
+import time
 from collections.abc import AsyncGenerator
 from contextlib import asynccontextmanager
 
+import redis.asyncio as redis
 from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorDatabase
+from pymongo import monitoring
 
 from linkly.settings import settings
+from linkly.utils.metrics import registry
 
-client = AsyncIOMotorClient(settings.MONGODB_URI)
+MONGO_SECONDS = registry.histogram(
+    "linkly_mongo_command_duration_seconds",
+    "Mongo command round trips by command",
+    labels=("command",),
+)
+REDIS_SECONDS = registry.histogram(
+    "linkly_redis_command_duration_seconds",
+    "Redis command round trips by command, pipelines excluded",
+    labels=("command",),
+)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    # called from motor's worker threads, the histogram is thread safe
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        MONGO_SECONDS.observe(event.duration_micros / 1e6, event.command_name)
+
+
+class TimedRedis(redis.Redis):
+    async def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return await super().execute_command(*args, **options)
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - start, str(args[0]))
+
+
+client = AsyncIOMotorClient(settings.MONGODB_URI, event_listeners=[MongoCommandTimer()])
+
+# one shared redis pool per worker (cache, expiry keys, pub/sub)
+redis_client = TimedRedis.from_url(settings.redis_url.replace("redis://", "rediss://"))
 
 
 async def get_db() -> AsyncGenerator[AsyncIOMotorDatabase, None]:
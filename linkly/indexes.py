@@ -0,0 +1,88 @@
+"""
+Declarative registry of every Mongo index the app relies on.
+
+``ensure_indexes`` is awaited from the app lifespan. ``create_indexes`` is a
+no-op for indexes that already exist with the same definition, so applying
+the registry on every start is cheap and idempotent. A collection whose
+index cannot be built (typically a unique index over data that still holds
+duplicates) is reported and skipped instead of stopping the app; run
+``python -m linkly.commands.index_report`` to see what is missing.
+
+Every query on a hot path should be served by one of these indexes:
+
+==========================  ===============================================
+query                       index
+==========================  ===============================================
+resolves_url / delete_url   urls (short_url) unique
+expiry cleanup              urls (short_id) unique
+get_user_urls / export      urls (user_id, created_at desc)
+UserRepository by email     users (email) unique
+UserRepository by name      users (name)
+analytics pages / export    url_analytics_buckets (short_id, bucket, _id)
+rollup upserts / summary    url_rollups (short_id, period, bucket) unique
+legacy analytics reads      url_analytics (short_id)
+==========================  ===============================================
+"""
+
+from dataclasses import dataclass
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure
+
+
+@dataclass(frozen=True)
+class IndexSpec:
+    collection: str
+    keys: tuple[tuple[str, int], ...]
+    unique: bool = False
+
+    @property
+    def name(self) -> str:
+        # same naming scheme mongo uses when no name is given
+        return "_".join(f"{field}_{direction}" for field, direction in self.keys)
+
+    def model(self) -> IndexModel:
+        return IndexModel(list(self.keys), name=self.name, unique=self.unique)
+
+
+INDEXES: tuple[IndexSpec, ...] = (
+    IndexSpec("urls", (("short_id", ASCENDING),), unique=True),
+    IndexSpec("urls", (("short_url", ASCENDING),), unique=True),
+    IndexSpec("urls", (("user_id", ASCENDING), ("created_at", DESCENDING))),
+    IndexSpec("users", (("email", ASCENDING),), unique=True),
+    IndexSpec("users", (("name", ASCENDING),)),
+    IndexSpec(
+        "url_analytics_buckets",
+        (("short_id", ASCENDING), ("bucket", ASCENDING), ("_id", ASCENDING)),
+    ),
+    IndexSpec(
+        "url_rollups",
+        (("short_id", ASCENDING), ("period", ASCENDING), ("bucket", ASCENDING)),
+        unique=True,
+    ),
+    IndexSpec("url_analytics", (("short_id", ASCENDING),)),
+)
+
+
+def by_collection(
+    specs: tuple[IndexSpec, ...] = INDEXES,
+) -> dict[str, list[IndexSpec]]:
+    grouped: dict[str, list[IndexSpec]] = {}
+    for spec in specs:
+        grouped.setdefault(spec.collection, []).append(spec)
+    return grouped
+
+
+async def ensure_indexes(db_cm, specs: tuple[IndexSpec, ...] = INDEXES) -> list[str]:
+    """
+    Create every index in ``specs``. Each index is its own ``createIndexes``
+    call so one that cannot be built does not hold back the others. Returns
+    the names of the indexes that are in place.
+    """
+    created = []
+    for spec in specs:
+        try:
+            created += await db_cm[spec.collection].create_indexes([spec.model()])
+        except OperationFailure as e:
+            print(f"[!] Could not build index {spec.name} on {spec.collection}: {e}")
+    return created
@@ -1,4 +1,13 @@
-from linkly import app
+from linkly import app as api
+from linkly.services.fastpath import RedirectFastPath
+from linkly.services.metrics import MetricsMiddleware
+from linkly.services.profiling import ProfilingMiddleware
+from linkly.settings import settings
+
+# `uvicorn linkly.main:app` serves the api behind the redirect fast path;
+# metrics and profiling wrap both, outermost, so they see every request
+app = RedirectFastPath(api) if settings.REDIRECT_FAST_PATH else api
+app = ProfilingMiddleware(MetricsMiddleware(app))
 
 # from fastapi import FastAPI
 # from app.routes import shortner
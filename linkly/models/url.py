@@ -36,6 +36,10 @@ class ClickInfo(BaseModel):
 
 
 class UrlAnalytics(BaseModel):
+    """
+    Legacy single document layout, only read by the analytics migration.
+    """
+
     id: ObjectId = Field(default_factory=ObjectId, alias="_id")
     short_id: str
     clicks: int = 0
@@ -45,3 +49,23 @@ class UrlAnalytics(BaseModel):
     class Config:
         arbitrary_types_allowed = True
         json_encoders = {ObjectId: str, datetime: lambda v: v.isoformat()}
+
+
+class AnalyticsBucket(BaseModel):
+    """
+    Clicks of one short url within one hour/day. A period can span several
+    documents once ``count`` reaches ``ANALYTICS_BUCKET_CAP``.
+    """
+
+    id: ObjectId = Field(default_factory=ObjectId, alias="_id")
+    short_id: str
+    bucket: datetime
+    count: int = 0
+    clicks: int = 0
+    click_details: List[ClickInfo] = []
+    first_click: Optional[datetime] = None
+    last_click: Optional[datetime] = None
+
+    class Config:
+        arbitrary_types_allowed = True
+        json_encoders = {ObjectId: str, datetime: lambda v: v.isoformat()}
@@ -42,3 +42,4 @@ class Token(BaseModel):
 
 class TokenData(BaseModel):
     user_id: Optional[str] = None
+    exp: Optional[int] = None
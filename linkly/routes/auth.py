@@ -8,7 +8,7 @@ from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from linkly.authentication.jwt.oauth2 import get_current_user
 from linkly.authentication.jwt.token import create_access_token
-from linkly.authentication.oauth import oauth
+from linkly.authentication.oauth import bearer, github_api, google_api, oauth
 from linkly.database import get_db_instance as get_db
 from linkly.models.users import Token, UserOut, UserRegister
 from linkly.services.auth import UserRepository
@@ -37,7 +37,9 @@ async def login(
 ):
     repo = UserRepository(db)
     user = await repo.find_by_email(form_data.username)
-    if not user or not repo.verify_password(form_data.password, user["password"]):
+    if not user or not await repo.verify_password(
+        form_data.password, user["password"], user["_id"]
+    ):
         raise HTTPException(status_code=401, detail="Invalid credentials")
 
     access_token = create_access_token(str(user["_id"]))
@@ -56,12 +58,12 @@ async def auth_github_callback(request: Request, db: AsyncIOMotorDatabase = Depe
     try:
         token = await oauth.github.authorize_access_token(request)
 
-        github_user_resp = await oauth.github.get("user", token=token)
+        github_user_resp = await github_api.get("user", headers=bearer(token))
         profile = github_user_resp.json()
 
         email = profile.get("email")
         if not email:
-            emails_resp = await oauth.github.get("user/emails", token=token)
+            emails_resp = await github_api.get("user/emails", headers=bearer(token))
             emails = emails_resp.json()
             email = next((e["email"] for e in emails if e["primary"] and e["verified"]), None)
 
@@ -95,7 +97,7 @@ async def auth_google_callback(request: Request, db: AsyncIOMotorDatabase = Depe
         token = await oauth.google.authorize_access_token(request)
         
 
-        user_info_resp = await oauth.google.get("userinfo", token=token)
+        user_info_resp = await google_api.get("userinfo", headers=bearer(token))
         user_info = user_info_resp.json()
 
 
@@ -0,0 +1,19 @@
+from fastapi import APIRouter
+from fastapi.responses import PlainTextResponse
+
+from linkly.services.metrics import metrics_exporter
+from linkly.utils.metrics import render
+
+router = APIRouter(tags=["Metrics"])
+
+
+@router.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """
+    Prometheus text format. In ``METRICS_MODE=redis`` the counters of every
+    live worker are summed up.
+    """
+    snapshot = await metrics_exporter.collect()
+    return PlainTextResponse(
+        render(snapshot), media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
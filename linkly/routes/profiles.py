@@ -0,0 +1,84 @@
+from typing import Literal
+from urllib.parse import quote
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query, status
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, Response
+
+from linkly.services.profiling import profiling, verify_token
+from linkly.utils.profiler import to_collapsed, to_speedscope, to_svg
+
+router = APIRouter(prefix="/profiles", tags=["Profiling"])
+
+
+def require_profile_token(x_linkly_profile: str | None = Header(default=None)):
+    if not profiling.enabled:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profiling is disabled"
+        )
+    if not verify_token(profiling.secret, x_linkly_profile):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Invalid or expired profile token",
+        )
+
+
+@router.get("", dependencies=[Depends(require_profile_token)])
+async def list_profiles(
+    route: str | None = None, limit: int = Query(default=50, ge=1, le=1000)
+):
+    """
+    Recent profiles of every worker on this host, newest first. Filter by route
+    template, e.g. `route=/{short_id}`.
+    """
+    return {
+        "sample_rate": profiling.sample_rate,
+        "profiles": [
+            {**info.__dict__, "url": f"/profiles/files/{quote(info.name, safe='')}"}
+            for info in profiling.store.recent(route, limit)
+        ],
+    }
+
+
+@router.get("/flamegraph", dependencies=[Depends(require_profile_token)])
+async def flamegraph(
+    route: str | None = None,
+    limit: int = Query(default=50, ge=1, le=1000),
+    format: Literal["svg", "collapsed", "speedscope"] = "svg",
+):
+    """
+    The latest `limit` profiles (of `route`) merged into one flame graph.
+    """
+    profiles = profiling.store.recent(route, limit)
+    if not profiles:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="No profiles recorded"
+        )
+    stacks = profiling.store.aggregate(profiles)
+    title = f"{route or 'all routes'}, {len(profiles)} requests"
+    if format == "collapsed":
+        return PlainTextResponse(to_collapsed(stacks))
+    if format == "speedscope":
+        return JSONResponse(to_speedscope(stacks, title, profiling.store.interval))
+    return Response(to_svg(stacks, title), media_type="image/svg+xml")
+
+
+@router.get("/files/{name}", dependencies=[Depends(require_profile_token)])
+async def download_profile(name: str):
+    path = profiling.store.path(name)
+    if path is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found"
+        )
+    return FileResponse(path, filename=name)
+
+
+@router.put("/sampling", dependencies=[Depends(require_profile_token)])
+async def set_sample_rate(
+    rate: float = Query(ge=0, le=1), ttl: int = Query(default=600, ge=1, le=86400)
+):
+    """
+    Profile `rate` of all requests on every worker for the next `ttl` seconds.
+    Workers pick the change up within `PROFILE_REFRESH_INTERVAL` seconds.
+    """
+    await profiling.set_sample_rate(rate, ttl)
+    return {"sample_rate": rate, "ttl": ttl}
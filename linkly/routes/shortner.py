@@ -2,33 +2,41 @@
 This module contains APIs used in our product
 """
 
+from datetime import datetime
 from typing import Optional
 
-import httpx
 from fastapi import (
     APIRouter,
-    BackgroundTasks,
     Depends,
     HTTPException,
+    Query,
     Request,
     Response,
     status,
 )
-from fastapi.responses import RedirectResponse
+from fastapi.responses import RedirectResponse, StreamingResponse
 from fastapi_cache.decorator import cache
 from motor.motor_asyncio import AsyncIOMotorDatabase
 
 from linkly.authentication.jwt.oauth2 import get_current_user, optional_current_user
 from linkly.database import get_db, get_db_instance
-from linkly.schemas import UrlRequest, UrlResponse
+from linkly.schemas import BatchUrlResponse, UrlRequest, UrlResponse
+from linkly.services.analytics import capture_click
+from linkly.services.clicks import click_queue
+from linkly.services.counters import rollup_counters
+from linkly.services.export import MEDIA_TYPES, ExportFormat, export_clicks
+from linkly.services.qr import QRFormat, etag_matches, qr_cache
+from linkly.services.rollups import Dimension, Period, rollup_summary
 from linkly.services.shortner import (
     delete_url,
+    ensure_owner,
     get_url_analytics,
     resolves_url,
     shorten_url,
-    url_analytics,
+    shorten_urls,
 )
 from linkly.settings import settings
+from linkly.utils.qrcode import DataTooLong, ErrorCorrection
 
 router = APIRouter(tags=["Url"])
 
@@ -46,21 +54,40 @@ async def create_short_url(
     )
 
 
+@router.post("/shorten/batch", response_model=BatchUrlResponse)
+async def create_short_urls(
+    data: list[UrlRequest],
+    db: AsyncIOMotorDatabase = Depends(get_db),
+    user: Optional[dict] = Depends(optional_current_user),
+):
+    """
+    Shorten many urls in one request. Every item gets its own result; items
+    that could not be stored carry an `error` instead of a `short_url`.
+    """
+    user_id = user["_id"] if user else None
+    results = await shorten_urls(
+        [(item.original_url, item.expiry) for item in data], db, user_id
+    )
+    failed = sum(result["error"] is not None for result in results)
+    return BatchUrlResponse(
+        created=len(results) - failed, failed=failed, results=results
+    )
+
+
 @router.get("/{short_id}")
 async def redirect_to_original(
     short_id: str,
     request: Request,
-    background_tasks: BackgroundTasks,
     db: AsyncIOMotorDatabase = Depends(get_db_instance),
 ):
     """
     Take the short url and redirect to the original url destination.
-    Also track analytics in background
+    The click is queued and written to analytics in batches.
     """
     try:
         short_url = settings.LOCAL_HOST + f"/{short_id}"
         original_url = await resolves_url(short_url, db)
-        background_tasks.add_task(url_analytics, short_url, request, get_db_instance())
+        await click_queue.put(capture_click(short_url, request))
         return RedirectResponse(url=original_url)
     except Exception as e:
         raise HTTPException(
@@ -76,11 +103,16 @@ async def view_url_analytics(
     utm_source: str | None = None,
     utm_medium: str | None = None,
     utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = Query(default=100, ge=1, le=1000),
     user: dict = Depends(get_current_user),
     db_cm: AsyncIOMotorDatabase = Depends(get_db),
 ):
     """
-    Endpoint that gives the json data related to the Url, optionally filtered by UTM parameters.
+    Endpoint that gives the json data related to the Url, optionally filtered by UTM parameters
+    and a date range. Clicks are paginated, pass `next_cursor` back as `cursor` for the next page.
     """
     short_url = settings.LOCAL_HOST + f"/{short_id}"
     response = await get_url_analytics(
@@ -89,10 +121,78 @@ async def view_url_analytics(
         utm_source=utm_source,
         utm_medium=utm_medium,
         utm_campaign=utm_campaign,
+        start=start,
+        end=end,
+        cursor=cursor,
+        limit=limit,
     )
     return response
 
 
+@router.get("/analytics/{short_id}/summary")
+@cache(expire=60)
+async def view_url_analytics_summary(
+    short_id: str,
+    dimension: Dimension = "utm_source",
+    days: int = Query(default=30, ge=1, le=365),
+    period: Period = "day",
+    user: dict = Depends(get_current_user),
+    db_cm: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """
+    Endpoint that gives clicks per UTM value or location over the last `days` days,
+    answered from the precomputed rollups plus the counters not flushed to them yet.
+    """
+    short_url = settings.LOCAL_HOST + f"/{short_id}"
+    await ensure_owner(short_url, user["_id"], db_cm)
+    live = await rollup_counters.live(short_url, period)
+    return await rollup_summary(short_url, db_cm, dimension, days, period, live)
+
+
+@router.get("/export/analytics")
+async def export_url_analytics(
+    short_id: str | None = None,
+    format: ExportFormat = "ndjson",
+    utm_source: str | None = None,
+    utm_medium: str | None = None,
+    utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    batch_size: int = Query(default=settings.EXPORT_BATCH_SIZE, ge=1, le=10000),
+    user: dict = Depends(get_current_user),
+    db_cm: AsyncIOMotorDatabase = Depends(get_db),
+):
+    """
+    Endpoint that streams raw clicks as NDJSON or CSV, for one short_id or
+    (without short_id) for every link of the current user.
+    """
+    if short_id:
+        short_url = settings.LOCAL_HOST + f"/{short_id}"
+        await ensure_owner(short_url, user["_id"], db_cm)
+        short_urls = [short_url]
+    else:
+        cursor = db_cm.urls.find({"user_id": user["_id"]}, {"short_url": 1})
+        short_urls = [url["short_url"] async for url in cursor]
+
+    body = export_clicks(
+        db_cm,
+        short_urls,
+        format,
+        batch_size,
+        utm_source=utm_source,
+        utm_medium=utm_medium,
+        utm_campaign=utm_campaign,
+        start=start,
+        end=end,
+    )
+    filename = f"linkly-analytics-{short_id or 'all'}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
 @router.get("/delete/{short_id}")
 async def delete_content(short_id: str, db_cm: AsyncIOMotorDatabase = Depends(get_db)):
     """
@@ -104,17 +204,27 @@ async def delete_content(short_id: str, db_cm: AsyncIOMotorDatabase = Depends(ge
 
 
 @router.get("/create-qr-code/{short_id}")
-async def generate_qr(short_id: str):
+async def generate_qr(
+    short_id: str,
+    request: Request,
+    format: QRFormat = "png",
+    size: int = Query(default=150, ge=21, le=2048),
+    margin: int = Query(default=4, ge=0, le=16),
+    ecc: ErrorCorrection = "M",
+):
     """
-    Endpoint that generates the qr code of the url
+    Endpoint that generates the qr code of the url, `size` pixels wide.
+    Images are rendered locally and cached; send `If-None-Match` to revalidate.
     """
-    short_url = short_url = settings.LOCAL_HOST + f"/{short_id}"
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(settings.QR_CODE_API + short_url)
-            if response.status_code == 200:
-                return Response(content=response.content, media_type="image/png")
-            else:
-                raise Exception(f"Failed to get qr: status-{response.status_code}")
-    except Exception as e:
-        raise Exception(f"QR generation failed: {e}")
+        image = await qr_cache.get(short_id, format, size, margin, ecc)
+    except DataTooLong as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    headers = {
+        "ETag": image.etag,
+        "Cache-Control": f"public, max-age={settings.QR_MAX_AGE}",
+    }
+    if etag_matches(request.headers.get("if-none-match"), image.etag):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=image.content, media_type=image.media_type, headers=headers)
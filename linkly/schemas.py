@@ -1,4 +1,4 @@
-from typing import Optional
+from typing import List, Optional
 
 from pydantic import BaseModel
 
@@ -12,3 +12,16 @@ class UrlResponse(BaseModel):
     short_url: str
     original_url: str
     expiry: Optional[int]
+
+
+class BatchUrlResult(BaseModel):
+    original_url: str
+    short_url: Optional[str] = None
+    expiry: Optional[int] = None
+    error: Optional[str] = None
+
+
+class BatchUrlResponse(BaseModel):
+    created: int
+    failed: int
+    results: List[BatchUrlResult]
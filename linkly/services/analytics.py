@@ -0,0 +1,382 @@
+"""
+Click capture and the bucketed analytics storage layout.
+
+Clicks are stored with the bucket pattern: one document in
+``url_analytics_buckets`` per short url per hour (or day, see
+``ANALYTICS_BUCKET_SIZE``), holding at most ``ANALYTICS_BUCKET_CAP`` clicks
+plus a precomputed ``clicks`` counter. A busy bucket simply spills into a new
+document for the same period, so no document grows without bound and every
+write appends to a small document.
+
+Repeat clicks are dropped and unique visitors counted in Redis before
+anything reaches Mongo, see ``linkly.services.visitors``. Counters per UTM
+value and location are kept up to date in the same flush, see
+``linkly.services.rollups``, incremented in Redis first and written to Mongo
+behind, see ``linkly.services.counters``.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+from datetime import datetime, timezone
+
+from bson import ObjectId
+from fastapi import Request
+from pymongo import ASCENDING, UpdateOne
+
+from linkly.services.counters import rollup_counters
+from linkly.services.rollups import period_start
+from linkly.services.upstreams import upstreams
+from linkly.services.visitors import dedup_clicks
+from linkly.settings import settings
+from linkly.utils.geoip import MISSING, GeoIPResolver, format_location
+
+geoip = GeoIPResolver.open(settings.GEOIP_DB_PATH, settings.GEOIP_CACHE_SIZE)
+geoip_api = upstreams.register("geoip")
+
+
+def click_fingerprint(ip: str, user_agent: str) -> str:
+    return f"{ip}{user_agent}".lower().strip()
+
+
+def capture_click(short_url: str, request: Request) -> dict:
+    """
+    Snapshot everything analytics needs from the request, so the click can be
+    processed after the response has been sent.
+    """
+    header = request.headers.get("user-agent", "unknown")
+    user_ip = request.client.host
+    if user_ip == "127.0.0.1":
+        user_ip = "8.8.8.8"
+
+    return {
+        "short_id": short_url,
+        "fingerprint": click_fingerprint(user_ip, header),
+        "click": {
+            "user_agent": header,
+            "ip": user_ip,
+            "timestamp": datetime.now(timezone.utc),
+            "location": None,
+            "utm_source": request.query_params.get("utm_source"),
+            "utm_medium": request.query_params.get("utm_medium"),
+            "utm_campaign": request.query_params.get("utm_campaign"),
+        },
+    }
+
+
+async def lookup_location(ip: str) -> str | None:
+    """
+    Resolve ``ip`` from the offline geoip database, falling back to
+    ``IP_DETAILS_URL`` only when the local data has no answer.
+    """
+    location = geoip.lookup(ip)
+    if location is not MISSING:
+        return location
+    if not settings.GEOIP_HTTP_FALLBACK:
+        return None
+
+    try:
+        r = await geoip_api.get(settings.IP_DETAILS_URL + f"/{ip}")
+        if r.status_code == 200:
+            data = r.json()
+            location = format_location(data.get("city"), data.get("country"))
+            geoip.remember(ip, location)
+            return location
+    except Exception:
+        pass
+    return None
+
+
+def bucket_start(timestamp: datetime, size: str | None = None) -> datetime:
+    return period_start(timestamp, size or settings.ANALYTICS_BUCKET_SIZE)
+
+
+def bucket_operations(
+    clicks: list[tuple[str, dict]], cap: int | None = None
+) -> list[UpdateOne]:
+    """
+    Build one upsert per (short url, bucket) chunk. The filter only matches a
+    bucket document that still has room for the whole chunk; when none does,
+    the upsert starts a new document for the same period.
+    """
+    cap = cap or settings.ANALYTICS_BUCKET_CAP
+    grouped: dict[tuple[str, datetime], list[dict]] = {}
+    for short_id, click in clicks:
+        key = (short_id, bucket_start(click["timestamp"]))
+        grouped.setdefault(key, []).append(click)
+
+    operations = []
+    for (short_id, bucket), bucket_clicks in grouped.items():
+        for i in range(0, len(bucket_clicks), cap):
+            chunk = bucket_clicks[i : i + cap]
+            operations.append(
+                UpdateOne(
+                    {
+                        "short_id": short_id,
+                        "bucket": bucket,
+                        "count": {"$lte": cap - len(chunk)},
+                    },
+                    {
+                        "$inc": {"count": len(chunk), "clicks": len(chunk)},
+                        "$push": {"click_details": {"$each": chunk}},
+                        "$min": {"first_click": chunk[0]["timestamp"]},
+                        "$max": {"last_click": chunk[-1]["timestamp"]},
+                    },
+                    upsert=True,
+                )
+            )
+    return operations
+
+
+async def record_clicks(events: list[dict], db_cm) -> int:
+    """
+    Store a batch of captured clicks. Returns the number of clicks counted.
+    """
+    events = await dedup_clicks(events)
+    if not events:
+        return 0
+
+    # geolocate only the clicks that survived dedup
+    clicks = [event["click"] for event in events]
+    locations = await asyncio.gather(*(lookup_location(c["ip"]) for c in clicks))
+    for click, location in zip(clicks, locations):
+        click["location"] = location
+
+    pairs = [(event["short_id"], event["click"]) for event in events]
+    await db_cm.url_analytics_buckets.bulk_write(
+        bucket_operations(pairs), ordered=False
+    )
+    await rollup_counters.add(pairs, db_cm)
+    return len(events)
+
+
+def encode_cursor(bucket: datetime, doc_id: ObjectId, index: int) -> str:
+    """
+    Opaque continuation token pointing at the last click of a page.
+    """
+    raw = json.dumps([bucket.isoformat(), str(doc_id), index]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token: str) -> tuple[datetime, ObjectId, int]:
+    """
+    Inverse of ``encode_cursor``. Raises ``ValueError`` for a bad token.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        bucket, doc_id, index = json.loads(raw)
+        return datetime.fromisoformat(bucket), ObjectId(doc_id), int(index)
+    except Exception as e:
+        raise ValueError("Invalid cursor") from e
+
+
+def click_filter(
+    utm_source: str | None = None,
+    utm_medium: str | None = None,
+    utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> dict | None:
+    """
+    ``$filter`` condition that keeps matching clicks inside a bucket, or None
+    when every click matches.
+    """
+    conditions = [
+        {"$eq": [f"$$click.{field}", value]}
+        for field, value in (
+            ("utm_source", utm_source),
+            ("utm_medium", utm_medium),
+            ("utm_campaign", utm_campaign),
+        )
+        if value
+    ]
+    if start:
+        conditions.append({"$gte": ["$$click.timestamp", start]})
+    if end:
+        conditions.append({"$lte": ["$$click.timestamp", end]})
+    if not conditions:
+        return None
+    return conditions[0] if len(conditions) == 1 else {"$and": conditions}
+
+
+def bucket_match(
+    short_url: str | list[str],
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> dict:
+    if isinstance(short_url, list):
+        match: dict = {"short_id": {"$in": short_url}}
+    else:
+        match = {"short_id": short_url}
+    if start or end:
+        match["bucket"] = {}
+    if start:
+        match["bucket"]["$gte"] = bucket_start(start)
+    if end:
+        match["bucket"]["$lte"] = end
+    return match
+
+
+def unwind_clicks_stages(condition: dict | None) -> list[dict]:
+    """
+    Trim each bucket's click array down to the clicks matching ``condition``
+    and emit one document per surviving click (position in ``i``).
+    """
+    stages = []
+    if condition:
+        stages.append(
+            {
+                "$project": {
+                    "short_id": 1,
+                    "bucket": 1,
+                    "click_details": {
+                        "$filter": {
+                            "input": "$click_details",
+                            "as": "click",
+                            "cond": condition,
+                        }
+                    },
+                }
+            }
+        )
+    stages.append({"$unwind": {"path": "$click_details", "includeArrayIndex": "i"}})
+    return stages
+
+
+def analytics_page_pipeline(
+    short_url: str,
+    limit: int,
+    utm_source: str | None = None,
+    utm_medium: str | None = None,
+    utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    after: tuple[datetime, ObjectId, int] | None = None,
+) -> list[dict]:
+    """
+    Aggregation returning at most ``limit + 1`` clicks (the extra one tells the
+    caller another page exists), ordered by (bucket, _id, position). Buckets
+    before the cursor are skipped through the (short_id, bucket, _id) index and
+    only the surviving clicks of each bucket are unwound.
+    """
+    match = bucket_match(short_url, start, end)
+    if after:
+        # the cursor came from a page of this same query, so it is >= start
+        match.setdefault("bucket", {})["$gte"] = after[0]
+
+    pipeline: list[dict] = [
+        {"$match": match},
+        {"$sort": {"bucket": ASCENDING, "_id": ASCENDING}},
+    ]
+
+    pipeline += unwind_clicks_stages(
+        click_filter(utm_source, utm_medium, utm_campaign, start, end)
+    )
+
+    if after:
+        bucket, doc_id, index = after
+        pipeline.append(
+            {
+                "$match": {
+                    "$or": [
+                        {"bucket": {"$gt": bucket}},
+                        {"bucket": bucket, "_id": {"$gt": doc_id}},
+                        {"bucket": bucket, "_id": doc_id, "i": {"$gt": index}},
+                    ]
+                }
+            }
+        )
+
+    pipeline += [
+        {"$limit": limit + 1},
+        {"$project": {"bucket": 1, "i": 1, "click": "$click_details"}},
+    ]
+    return pipeline
+
+
+def analytics_totals_pipeline(
+    short_url: str,
+    utm_source: str | None = None,
+    utm_medium: str | None = None,
+    utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> list[dict]:
+    """
+    Aggregation returning one row per bucket period: every click stored in it
+    (``clicks``, from the bucket counters) and the clicks matching the filters
+    (``matched``). Without filters only the counters are read.
+    """
+    condition = click_filter(utm_source, utm_medium, utm_campaign, start, end)
+    matched = "$clicks"
+    if condition:
+        matched = {
+            "$size": {
+                "$filter": {
+                    "input": "$click_details",
+                    "as": "click",
+                    "cond": condition,
+                }
+            }
+        }
+    return [
+        {"$match": bucket_match(short_url, start, end)},
+        {
+            "$group": {
+                "_id": "$bucket",
+                "clicks": {"$sum": "$clicks"},
+                "matched": {"$sum": matched},
+            }
+        },
+        {"$sort": {"_id": ASCENDING}},
+    ]
+
+
+def legacy_bucket_id(doc: dict, bucket: datetime, chunk: int, first_click) -> ObjectId:
+    """
+    The same ``_id`` every time a legacy chunk is migrated. The time part is
+    the first click, so chunks keep their order within a bucket.
+    """
+    if first_click.tzinfo is None:
+        first_click = first_click.replace(tzinfo=timezone.utc)
+    seconds = int(first_click.timestamp()).to_bytes(4, "big")
+    seed = f"{doc.get('_id', doc['short_id'])}|{bucket.isoformat()}|{chunk}"
+    return ObjectId(seconds + hashlib.sha1(seed.encode()).digest()[:8])
+
+
+def legacy_operations(doc: dict) -> list[UpdateOne]:
+    """
+    Translate one legacy ``url_analytics`` document into bucket upserts.
+    Each chunk gets a deterministic ``_id``, so writing it again changes
+    nothing. Used by ``linkly.commands.migrate_analytics``.
+    """
+    short_id = doc["short_id"]
+    cap = settings.ANALYTICS_BUCKET_CAP
+    grouped: dict[datetime, list[dict]] = {}
+    for click in doc.get("click_details") or []:
+        grouped.setdefault(bucket_start(click["timestamp"]), []).append(click)
+
+    buckets = []
+    for bucket, clicks in sorted(grouped.items()):
+        clicks.sort(key=lambda c: c["timestamp"])
+        for i in range(0, len(clicks), cap):
+            chunk = clicks[i : i + cap]
+            buckets.append(
+                UpdateOne(
+                    {"_id": legacy_bucket_id(doc, bucket, i, chunk[0]["timestamp"])},
+                    {
+                        "$set": {
+                            "short_id": short_id,
+                            "bucket": bucket,
+                            "count": len(chunk),
+                            "clicks": len(chunk),
+                            "click_details": chunk,
+                            "first_click": chunk[0]["timestamp"],
+                            "last_click": chunk[-1]["timestamp"],
+                        }
+                    },
+                    upsert=True,
+                )
+            )
+    return buckets
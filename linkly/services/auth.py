@@ -1,12 +1,11 @@
 from bson import ObjectId
 from motor.motor_asyncio import AsyncIOMotorDatabase
-from passlib.context import CryptContext
 from pydantic import EmailStr
+from pymongo import DESCENDING
 
+from linkly.services.passwords import password_hasher
 from linkly.utils.dtype import MongoUser
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 
 class UserRepository:
     def __init__(self, db: AsyncIOMotorDatabase):
@@ -18,8 +17,14 @@ class UserRepository:
     async def find_by_email(self, email: EmailStr):
         return await self.db.users.find_one({"email": email})
 
-    async def find_by_id(self, user_id: str):
-        return await self.db.users.find_one({"_id": ObjectId(user_id)})
+    async def find_by_id(self, user_id: str, projection: dict | None = None):
+        return await self.db.users.find_one({"_id": ObjectId(user_id)}, projection)
+
+    async def create_user(self, name: str, email: EmailStr, password: str):
+        hashed = await password_hasher.hash(password)
+        new_user = MongoUser(name=name, email=email, password=hashed)
+        result = await self.db.users.insert_one(new_user.dict(by_alias=True))
+        return result.inserted_id
 
     # for oauth login - fixed to return the inserted document with _id
     async def create_oauth_user(self, name: str, email: EmailStr):
@@ -35,13 +40,30 @@ class UserRepository:
             return user
         return await self.create_oauth_user(name, email)
 
-    def verify_password(self, plain_password: str, hashed_password: str | None) -> bool:
+    async def verify_password(
+        self, plain_password: str, hashed_password: str | None, user_id=None
+    ) -> bool:
+        """
+        Check the password off the event loop. When ``user_id`` is given and
+        the stored hash uses an outdated cost, it is replaced on the spot.
+        """
         if not hashed_password:
             return False
-        return pwd_context.verify(plain_password, hashed_password)
+        matches, new_hash = await password_hasher.verify(
+            plain_password, hashed_password
+        )
+        if matches and new_hash and user_id is not None:
+            await self.db.users.update_one(
+                {"_id": ObjectId(user_id)}, {"$set": {"password": new_hash}}
+            )
+        return matches
 
     async def get_user_urls(self, user_id: ObjectId):
-        cursor = self.db.urls.find({"user_id": ObjectId(user_id)})
+        # served by the (user_id, created_at) index, newest first
+        cursor = self.db.urls.find(
+            {"user_id": ObjectId(user_id)},
+            {"_id": 0, "original_url": 1, "short_id": 1, "created_at": 1, "expiry": 1},
+        ).sort("created_at", DESCENDING)
         return [
             {
                 "original_url": url["original_url"],
@@ -0,0 +1,278 @@
+"""
+Durable click stream and the out-of-process analytics worker.
+
+With ``CLICK_INGEST=stream`` the web workers do not geolocate or store
+clicks. Each batch of the click queue is appended to the Redis Stream
+``CLICK_STREAM_KEY`` with one pipelined ``XADD`` per click, as a compact
+entry::
+
+    s=<short url> ip=<ip> ua=<user agent> t=<epoch ms> [us=.. um=.. uc=..]
+
+``linkly-analytics-worker`` processes consume the stream through the
+``CLICK_STREAM_GROUP`` consumer group. Each worker reads batches of up to
+``CLICK_STREAM_BATCH`` entries, runs the usual ``record_clicks`` (dedup,
+geolocation, bucket and rollup writes) and ``XACK``s the batch once it is
+stored. Start more workers to scale out; the group spreads entries over
+them.
+
+Delivery is at least once:
+
+* a batch that fails is not acknowledged and stays pending;
+* entries pending for more than ``CLICK_STREAM_CLAIM_IDLE`` seconds, from a
+  failed batch or a worker that died, are claimed by whichever worker looks
+  next and processed again;
+* entries delivered ``CLICK_STREAM_MAX_DELIVERIES`` times, or that cannot be
+  decoded, are copied to ``{CLICK_STREAM_KEY}:dead`` and acknowledged.
+
+The stream entry id is stored in the click dedup key, so a redelivered
+click is still counted once, see ``linkly.services.visitors``.
+
+The stream is capped at roughly ``CLICK_STREAM_MAXLEN`` entries; workers
+that stay down long enough for the cap to be reached lose the oldest clicks.
+"""
+
+import asyncio
+import os
+import socket
+from datetime import datetime, timezone
+
+from redis.exceptions import ResponseError
+
+from linkly.database import redis_client
+from linkly.services.analytics import click_fingerprint, record_clicks
+from linkly.settings import settings
+
+_UTM = (("us", "utm_source"), ("um", "utm_medium"), ("uc", "utm_campaign"))
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def encode_click(event: dict) -> dict[str, str]:
+    click = event["click"]
+    fields = {
+        "s": event["short_id"],
+        "ip": click["ip"],
+        "ua": click["user_agent"],
+        "t": str(int(click["timestamp"].timestamp() * 1000)),
+    }
+    for short, name in _UTM:
+        if click.get(name) is not None:
+            fields[short] = click[name]
+    return fields
+
+
+def decode_click(entry_id: str, fields: dict) -> dict:
+    """
+    Stream entry -> the event ``capture_click`` builds, plus its ``id``.
+    Raises ``KeyError`` or ``ValueError`` for a malformed entry.
+    """
+    fields = {_text(k): _text(v) for k, v in fields.items()}
+    ip, user_agent = fields["ip"], fields["ua"]
+    return {
+        "id": entry_id,
+        "short_id": fields["s"],
+        "fingerprint": click_fingerprint(ip, user_agent),
+        "click": {
+            "user_agent": user_agent,
+            "ip": ip,
+            "timestamp": datetime.fromtimestamp(int(fields["t"]) / 1000, timezone.utc),
+            "location": None,
+            **{name: fields.get(short) for short, name in _UTM},
+        },
+    }
+
+
+async def append_clicks(events: list[dict]) -> int:
+    """
+    Append captured clicks to the stream. Returns the number appended.
+    """
+    pipe = redis_client.pipeline(transaction=False)
+    for event in events:
+        pipe.xadd(
+            settings.CLICK_STREAM_KEY,
+            encode_click(event),
+            maxlen=settings.CLICK_STREAM_MAXLEN,
+            approximate=True,
+        )
+    await pipe.execute()
+    return len(events)
+
+
+class AnalyticsWorker:
+    def __init__(
+        self,
+        stream: str,
+        group: str,
+        consumer: str | None,
+        batch_size: int,
+        block: float,
+        claim_idle: float,
+        max_deliveries: int,
+    ):
+        self.stream = stream
+        self.group = group
+        self.consumer = consumer or f"{socket.gethostname()}:{os.getpid()}"
+        self.batch_size = batch_size
+        self.block = block
+        self.claim_idle = claim_idle
+        self.max_deliveries = max_deliveries
+        self.dead_stream = f"{stream}:dead"
+        self.processed = 0
+        self.counted = 0
+        self.reclaimed = 0
+        self.dead = 0
+        self._stopping = False
+
+    async def ensure_group(self) -> None:
+        try:
+            await redis_client.xgroup_create(
+                self.stream, self.group, id="0", mkstream=True
+            )
+            print(f"[✔] Created consumer group {self.group} on {self.stream}")
+        except ResponseError as e:
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def read(self) -> list[tuple[str, dict]]:
+        """
+        New entries for this consumer, waiting up to ``block`` seconds.
+        """
+        response = await redis_client.xreadgroup(
+            self.group,
+            self.consumer,
+            {self.stream: ">"},
+            count=self.batch_size,
+            block=int(self.block * 1000),
+        )
+        entries = [
+            (_text(entry_id), fields)
+            for _, stream_entries in response or []
+            for entry_id, fields in stream_entries
+        ]
+        return await self._drop_trimmed(entries)
+
+    async def reclaim(self) -> list[tuple[str, dict]]:
+        """
+        Take over entries other consumers left pending for too long, and
+        dead-letter the ones delivered too often.
+        """
+        idle = int(self.claim_idle * 1000)
+        pending = await redis_client.xpending_range(
+            self.stream, self.group, "-", "+", self.batch_size, idle=idle
+        )
+        if not pending:
+            return []
+
+        deliveries = {_text(p["message_id"]): p["times_delivered"] for p in pending}
+        claimed = await redis_client.xclaim(
+            self.stream, self.group, self.consumer, idle, list(deliveries)
+        )
+        entries, exhausted = [], []
+        claimed = [(_text(entry_id), fields) for entry_id, fields in claimed]
+        for entry_id, fields in await self._drop_trimmed(claimed):
+            if deliveries.get(entry_id, 0) >= self.max_deliveries:
+                exhausted.append((entry_id, fields))
+            else:
+                entries.append((entry_id, fields))
+        if exhausted:
+            await self.dead_letter(exhausted)
+        self.reclaimed += len(entries)
+        return entries
+
+    async def _drop_trimmed(
+        self, entries: list[tuple[str, dict | None]]
+    ) -> list[tuple[str, dict]]:
+        """
+        Acknowledge entries trimmed by ``MAXLEN`` while pending, which come
+        back without fields. Left pending they would fill every ``reclaim``
+        batch, which always starts at the oldest pending id.
+        """
+        trimmed = [entry_id for entry_id, fields in entries if not fields]
+        if trimmed:
+            await redis_client.xack(self.stream, self.group, *trimmed)
+            print(f"[!] Dropped {len(trimmed)} click entries trimmed before processing")
+        return [(entry_id, fields) for entry_id, fields in entries if fields]
+
+    async def dead_letter(self, entries: list[tuple[str, dict]]) -> None:
+        pipe = redis_client.pipeline(transaction=True)
+        for entry_id, fields in entries:
+            pipe.xadd(self.dead_stream, {**fields, "id": entry_id})
+        pipe.xack(self.stream, self.group, *(entry_id for entry_id, _ in entries))
+        await pipe.execute()
+        self.dead += len(entries)
+        print(f"[!] Moved {len(entries)} click entries to {self.dead_stream}")
+
+    async def process(self, entries: list[tuple[str, dict]], db_cm) -> None:
+        """
+        Store a batch and acknowledge it. A failed batch stays pending.
+        """
+        events, malformed = [], []
+        for entry_id, fields in entries:
+            try:
+                events.append(decode_click(entry_id, fields))
+            except (KeyError, ValueError):
+                malformed.append((entry_id, fields))
+        if malformed:
+            await self.dead_letter(malformed)
+        if not events:
+            return
+
+        self.counted += await record_clicks(events, db_cm)
+        await redis_client.xack(
+            self.stream, self.group, *(event["id"] for event in events)
+        )
+        self.processed += len(events)
+
+    async def run(self, db_cm) -> None:
+        """
+        Consume until ``stop`` is called. The batch in hand is finished first.
+        """
+        await self.ensure_group()
+        print(f"[✔] Analytics worker {self.consumer} reading {self.stream}")
+        loop = asyncio.get_running_loop()
+        next_reclaim = 0.0
+        while not self._stopping:
+            try:
+                entries = []
+                if loop.time() >= next_reclaim:
+                    entries = await self.reclaim()
+                    next_reclaim = loop.time() + self.claim_idle / 2
+                if not entries:
+                    entries = await self.read()
+                if entries:
+                    await self.process(entries, db_cm)
+            except Exception as e:
+                print(f"[!] Analytics worker batch failed: {e}")
+                await asyncio.sleep(self.block)
+        await self.leave()
+
+    def stop(self) -> None:
+        self._stopping = True
+
+    async def leave(self) -> None:
+        """
+        Drop this consumer from the group unless it still owns pending entries.
+        """
+        try:
+            owned = await redis_client.xpending_range(
+                self.stream, self.group, "-", "+", 1, consumername=self.consumer
+            )
+            if not owned:
+                await redis_client.xgroup_delconsumer(
+                    self.stream, self.group, self.consumer
+                )
+        except Exception as e:
+            print(f"[!] Could not leave consumer group: {e}")
+
+
+analytics_worker = AnalyticsWorker(
+    stream=settings.CLICK_STREAM_KEY,
+    group=settings.CLICK_STREAM_GROUP,
+    consumer=settings.CLICK_STREAM_CONSUMER,
+    batch_size=settings.CLICK_STREAM_BATCH,
+    block=settings.CLICK_STREAM_BLOCK,
+    claim_idle=settings.CLICK_STREAM_CLAIM_IDLE,
+    max_deliveries=settings.CLICK_STREAM_MAX_DELIVERIES,
+)
@@ -0,0 +1,144 @@
+"""
+Batched click ingestion.
+
+Redirects put a captured click on an in-process asyncio queue and return
+immediately. A single consumer task per worker drains the queue and flushes
+whenever ``CLICK_BATCH_SIZE`` clicks are waiting or ``CLICK_FLUSH_INTERVAL``
+seconds have passed since the first one arrived. Each flush is handed to
+``record_clicks`` which costs two unordered ``bulk_write`` calls (visitor
+dedup and bucket appends) for the whole batch.
+
+When the queue is full, producers wait up to ``CLICK_ENQUEUE_TIMEOUT`` seconds
+for room and then drop the click, so a slow Mongo cannot stall redirects.
+
+With ``CLICK_INGEST=stream`` a flush only appends the batch to the click
+stream and the analytics workers do the rest, see
+``linkly.services.click_stream``. If the append fails the batch is recorded
+here as before.
+"""
+
+import asyncio
+import time
+from datetime import datetime, timezone
+
+from linkly.services.analytics import record_clicks
+from linkly.services.click_stream import append_clicks
+from linkly.settings import settings
+
+_STOP = object()
+
+
+class ClickQueue:
+    def __init__(
+        self,
+        maxsize: int,
+        batch_size: int,
+        flush_interval: float,
+        enqueue_timeout: float,
+        mode: str = "inline",
+    ):
+        self.maxsize = maxsize
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.enqueue_timeout = enqueue_timeout
+        self.mode = mode
+        self.dropped = 0
+        self.flushed = 0
+        # seconds the oldest click of the last batch waited, and its flush time
+        self.lag = 0.0
+        self.flush_seconds = 0.0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._db = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def qsize(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    async def start(self, db_cm) -> None:
+        self._db = db_cm
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._task = asyncio.create_task(self._run())
+
+    async def put(self, event: dict) -> bool:
+        """
+        Enqueue a click. Returns False when the click was dropped.
+        """
+        if not self.running:
+            self.dropped += 1
+            return False
+        try:
+            self._queue.put_nowait(event)
+            return True
+        except asyncio.QueueFull:
+            pass
+        try:
+            await asyncio.wait_for(self._queue.put(event), self.enqueue_timeout)
+            return True
+        except asyncio.TimeoutError:
+            self.dropped += 1
+            return False
+
+    async def stop(self) -> None:
+        """
+        Flush everything already queued, then stop the consumer.
+        """
+        if not self.running:
+            return
+        await self._queue.put(_STOP)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        stopping = False
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    event = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if event is _STOP:
+                    stopping = True
+                    break
+                batch.append(event)
+
+            await self._flush(batch)
+
+    async def _flush(self, batch: list[dict]) -> None:
+        oldest = batch[0]["click"]["timestamp"]
+        self.lag = (datetime.now(timezone.utc) - oldest).total_seconds()
+        start = time.perf_counter()
+        try:
+            if self.mode == "stream":
+                try:
+                    self.flushed += await append_clicks(batch)
+                    return
+                except Exception as e:
+                    print(f"[!] Click stream unavailable, recording inline: {e}")
+            self.flushed += await record_clicks(batch, self._db)
+        except Exception as e:
+            print(f"[!] Failed to flush {len(batch)} clicks: {e}")
+        finally:
+            self.flush_seconds = time.perf_counter() - start
+
+
+click_queue = ClickQueue(
+    maxsize=settings.CLICK_QUEUE_SIZE,
+    batch_size=settings.CLICK_BATCH_SIZE,
+    flush_interval=settings.CLICK_FLUSH_INTERVAL,
+    enqueue_timeout=settings.CLICK_ENQUEUE_TIMEOUT,
+    mode=settings.CLICK_INGEST,
+)
@@ -0,0 +1,304 @@
+"""
+Write-behind rollup counters.
+
+Flushed click batches do not ``$inc`` ``url_rollups`` themselves. They
+``HINCRBY`` one Redis hash per short url, ``rollups:{short_url}``, in a
+single MULTI per batch, and add the hash to the ``rollups:dirty`` set.
+Field names are ``{period}|{bucket}|{counter}``, the counter being the
+same field name the Mongo document uses (``clicks``, ``utm_source.google``,
+...). A burst of clicks only costs Redis increments; Mongo sees at most one
+update per link and bucket per flush interval.
+
+Every worker runs a flusher that moves the deltas to Mongo:
+
+1. Handoff: in one MULTI, a dirty hash is removed from ``rollups:dirty`` and
+   RENAMEd to ``rollups:{short_url}|{handoff id}``, which is added to the
+   ``rollups:pending`` sorted set. Clicks arriving afterwards start a fresh
+   hash, so nothing is lost between reading and deleting.
+2. The pending hash is applied with one ``bulk_write`` of ``$inc`` upserts.
+   Each update only matches a document whose ``handoffs`` list does not
+   contain the handoff id yet, and appends it. Two handoffs creating the same
+   rollup at once both insert and one hits the unique index; its updates are
+   retried once, now that the document exists, see ``guarded_upserts``.
+3. The pending hash is deleted.
+
+A flusher that dies between 1 and 3 leaves its pending hashes behind; any
+worker retries them after ``ROLLUP_RECOVER_AFTER`` seconds. Retrying a
+hash that was already applied is a no-op: the guarded upsert finds no
+document and its insert is rejected by the unique rollup index. That holds
+as long as the handoff id is still in the document's ``handoffs`` list, so
+the list keeps every handoff a document can receive before the retry: two
+per flush interval of each of the ``ROLLUP_FLUSHERS`` processes (web and
+analytics workers) over ``ROLLUP_RECOVER_AFTER`` seconds plus one interval.
+Set ``ROLLUP_FLUSHERS`` to at least the number of processes running.
+
+``live`` returns the counters of a link that are still in Redis, so
+summaries stay exact between flushes. It reads the link's hash and its
+pending hashes, listed in ``rollups:{short_url}|handoffs``, and nothing of
+other links. With ``ROLLUP_WRITE_BEHIND=false``
+or when Redis is down, batches are written to Mongo directly.
+"""
+
+import asyncio
+import math
+import time
+import uuid
+from datetime import datetime
+
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+
+from linkly.database import redis_client
+from linkly.services.rollups import rollup_increments, rollup_operations
+from linkly.settings import settings
+
+DIRTY_KEY = "rollups:dirty"
+PENDING_KEY = "rollups:pending"
+
+DUPLICATE_KEY = 11000
+
+
+def counter_key(short_url: str) -> str:
+    return f"rollups:{short_url}"
+
+
+def handoffs_key(key: str) -> str:
+    """
+    Set of the pending hashes of one counter hash, read by ``live``.
+    """
+    return f"{key}|handoffs"
+
+
+def _text(value) -> str:
+    return value.decode() if isinstance(value, bytes) else value
+
+
+def parse_deltas(raw: dict) -> dict[tuple[str, datetime], dict[str, int]]:
+    """
+    ``HGETALL`` of a counter hash -> counters per (period, bucket).
+    """
+    deltas: dict[tuple[str, datetime], dict[str, int]] = {}
+    for field, count in raw.items():
+        period, bucket, counter = _text(field).split("|", 2)
+        key = (period, datetime.fromisoformat(bucket))
+        deltas.setdefault(key, {})[counter] = int(count)
+    return deltas
+
+
+async def guarded_upserts(collection, operations: list[UpdateOne]) -> None:
+    """
+    ``bulk_write`` upserts whose filter carries a guard next to the unique
+    index keys, such as ``handoffs: {$ne: id}``. Mongo does not retry those
+    on a duplicate key, which means either that the guard held (the update
+    was applied before) or that a concurrent upsert inserted the document
+    first. The failed updates are retried once: the document exists by then,
+    so the guard alone decides, and a second duplicate key is an update that
+    was applied before.
+    """
+    for _ in range(2):
+        if not operations:
+            return
+        try:
+            await collection.bulk_write(operations, ordered=False)
+            return
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if any(error.get("code") != DUPLICATE_KEY for error in errors):
+                raise
+            operations = [operations[error["index"]] for error in errors]
+
+
+class RollupCounters:
+    def __init__(
+        self,
+        write_behind: bool,
+        flush_interval: float,
+        batch_size: int,
+        recover_after: float,
+        flushers: int,
+    ):
+        self.write_behind = write_behind
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.recover_after = recover_after
+        # handoff ids remembered per rollup document, enough to cover retries
+        self.history = 2 * flushers * (math.ceil(recover_after / flush_interval) + 1)
+        self.flushed = 0
+        self._task: asyncio.Task | None = None
+        self._db = None
+
+    async def add(self, clicks: list[tuple[str, dict]], db_cm) -> None:
+        """
+        Count ``(short url, click)`` pairs.
+        """
+        if self.write_behind:
+            pipe = redis_client.pipeline(transaction=True)
+            for (short_id, period, bucket), counters in rollup_increments(
+                clicks
+            ).items():
+                key = counter_key(short_id)
+                for counter, count in counters.items():
+                    pipe.hincrby(key, f"{period}|{bucket.isoformat()}|{counter}", count)
+                pipe.sadd(DIRTY_KEY, key)
+            try:
+                await pipe.execute()
+                return
+            except Exception as e:
+                # the MULTI did not apply, nothing is counted twice
+                print(f"[!] Rollup counters unavailable, writing to mongo: {e}")
+        await db_cm.url_rollups.bulk_write(rollup_operations(clicks), ordered=False)
+
+    async def live(self, short_url: str, period: str) -> dict[datetime, dict[str, int]]:
+        """
+        Counters of ``short_url`` not flushed to Mongo yet, per bucket.
+        """
+        if not self.write_behind:
+            return {}
+        key = counter_key(short_url)
+        try:
+            pending = await redis_client.smembers(handoffs_key(key))
+            names = [key, *map(_text, pending)]
+            pipe = redis_client.pipeline(transaction=False)
+            for name in names:
+                pipe.hgetall(name)
+            hashes = await pipe.execute()
+        except Exception as e:
+            print(f"[!] Reading live rollup counters failed: {e}")
+            return {}
+
+        live: dict[datetime, dict[str, int]] = {}
+        for raw in hashes:
+            for (p, bucket), counters in parse_deltas(raw or {}).items():
+                if p != period:
+                    continue
+                merged = live.setdefault(bucket, {})
+                for counter, count in counters.items():
+                    merged[counter] = merged.get(counter, 0) + count
+        return live
+
+    async def handoff(self) -> list[str]:
+        """
+        Move up to ``batch_size`` dirty hashes to pending names.
+        """
+        keys = [
+            _text(key)
+            for key in await redis_client.srandmember(DIRTY_KEY, self.batch_size)
+        ]
+        if not keys:
+            return []
+
+        handoff = uuid.uuid4().hex[:16]
+        now = time.time()
+        pipe = redis_client.pipeline(transaction=True)
+        pending = []
+        for key in keys:
+            name = f"{key}|{handoff}"
+            pending.append(name)
+            pipe.srem(DIRTY_KEY, key)
+            pipe.rename(key, name)
+            pipe.zadd(PENDING_KEY, {name: now})
+            pipe.sadd(handoffs_key(key), name)
+        results = await pipe.execute(raise_on_error=False)
+
+        moved, missing = [], []
+        for name, renamed in zip(pending, results[1::4]):
+            # a failed RENAME means another flusher took this hash first
+            if isinstance(renamed, Exception):
+                missing.append(name)
+            else:
+                moved.append(name)
+        if missing:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.zrem(PENDING_KEY, *missing)
+            for name in missing:
+                pipe.srem(handoffs_key(name.rpartition("|")[0]), name)
+            await pipe.execute()
+        return moved
+
+    async def apply(self, name: str, db_cm) -> None:
+        """
+        Write one pending hash to Mongo and drop it.
+        """
+        key, _, handoff = name.rpartition("|")
+        short_url = key.removeprefix("rollups:")
+        operations = [
+            UpdateOne(
+                {
+                    "short_id": short_url,
+                    "period": period,
+                    "bucket": bucket,
+                    "handoffs": {"$ne": handoff},
+                },
+                {
+                    "$inc": counters,
+                    "$push": {
+                        "handoffs": {"$each": [handoff], "$slice": -self.history}
+                    },
+                },
+                upsert=True,
+            )
+            for (period, bucket), counters in parse_deltas(
+                await redis_client.hgetall(name)
+            ).items()
+        ]
+        await guarded_upserts(db_cm.url_rollups, operations)
+
+        pipe = redis_client.pipeline(transaction=True)
+        pipe.delete(name)
+        pipe.zrem(PENDING_KEY, name)
+        pipe.srem(handoffs_key(key), name)
+        await pipe.execute()
+        self.flushed += 1
+
+    async def flush(self, db_cm) -> int:
+        """
+        Hand off dirty hashes, retry abandoned ones and apply both.
+        Returns the number of hashes written.
+        """
+        names = await self.handoff()
+        abandoned = await redis_client.zrangebyscore(
+            PENDING_KEY, "-inf", time.time() - self.recover_after
+        )
+        names += [_text(name) for name in abandoned]
+        for name in names:
+            await self.apply(name, db_cm)
+        return len(names)
+
+    async def start(self, db_cm) -> None:
+        self._db = db_cm
+        if self.write_behind:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop the flusher after one last flush.
+        """
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        try:
+            await self.flush(self._db)
+        except Exception as e:
+            print(f"[!] Final rollup flush failed: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush(self._db)
+            except Exception as e:
+                print(f"[!] Rollup flush failed: {e}")
+
+
+rollup_counters = RollupCounters(
+    write_behind=settings.ROLLUP_WRITE_BEHIND,
+    flush_interval=settings.ROLLUP_FLUSH_INTERVAL,
+    batch_size=settings.ROLLUP_FLUSH_BATCH,
+    recover_after=settings.ROLLUP_RECOVER_AFTER,
+    flushers=settings.ROLLUP_FLUSHERS,
+)
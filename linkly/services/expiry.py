@@ -0,0 +1,150 @@
+"""
+Link expiry.
+
+Links with an ``expiry`` are scheduled in the Redis sorted set
+``EXPIRY_SCHEDULE`` (member: short id, score: unix time the link expires).
+The set is the source of truth, so a link that expires while no worker is
+running is simply still due the next time anyone looks.
+
+``ExpirySweeper.tick`` is a periodic job of the scheduler, so it runs every
+``EXPIRY_SWEEP_INTERVAL`` seconds on one worker only, see
+``linkly.services.scheduler``. A tick reads up to ``EXPIRY_SWEEP_BATCH`` due
+ids, removes them with one ``delete_many``, evicts them from the redirect
+cache and unschedules them, repeating until nothing is due. A link deleted
+by hand stays scheduled until its time comes, which is harmless.
+
+The first tick in a process is the startup catch-up, run once per
+deployment. It schedules links created before this module existed, which
+only had a volatile ``expire:{short_id}`` key, and repairs ``created_at``
+of links written as ``datetime.utcnow().timestamp()``: that reads the UTC
+time as local time, so it is off by the UTC offset of the host that created
+the link. The repaired value is the creation time of the document's
+ObjectId.
+"""
+
+import time
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from linkly.database import redis_client
+from linkly.services.redirect_cache import redirect_cache
+from linkly.settings import settings
+
+EXPIRY_SCHEDULE = "linkly:expiry"
+# set once legacy links have been repaired and copied into the schedule;
+# v2 also repairs created_at, so it runs again where v1 already has
+EXPIRY_BACKFILLED = "linkly:expiry:backfilled:v2"
+# created_at further than this from the ObjectId time was skewed by a UTC offset
+CREATED_AT_SKEW = 60
+
+
+def created_at(url: dict) -> int:
+    """
+    Unix creation time of a url document, from its ObjectId when it has one.
+    """
+    stored = url.get("created_at")
+    if not isinstance(url.get("_id"), ObjectId):
+        return stored
+    created = int(url["_id"].generation_time.timestamp())
+    if stored is not None and abs(stored - created) < CREATED_AT_SKEW:
+        return stored
+    return created
+
+
+async def schedule_expiries(items: list[tuple[str, int]]) -> None:
+    """
+    Schedule ``(short_id, seconds from now)`` pairs with a single ``ZADD``.
+    """
+    now = time.time()
+    mapping = {short_id: now + expiry for short_id, expiry in items if expiry}
+    if mapping:
+        await redis_client.zadd(EXPIRY_SCHEDULE, mapping)
+
+
+class ExpirySweeper:
+    def __init__(self, batch_size: int):
+        self.batch_size = batch_size
+        self.expired = 0
+        self._caught_up = False
+        self._db = None
+
+    async def tick(self, db_cm) -> None:
+        self._db = db_cm
+        if not self._caught_up:
+            await self.backfill()
+            self._caught_up = True
+        await self.sweep()
+
+    async def sweep(self, now: float | None = None) -> int:
+        """
+        Delete every link due by ``now``, one batch at a time. Returns the
+        number of links removed from the schedule.
+        """
+        now = time.time() if now is None else now
+        swept = 0
+        while True:
+            due = await redis_client.zrangebyscore(
+                EXPIRY_SCHEDULE, "-inf", now, start=0, num=self.batch_size
+            )
+            if not due:
+                break
+            short_ids = [s.decode() if isinstance(s, bytes) else s for s in due]
+
+            result = await self._db.urls.delete_many({"short_id": {"$in": short_ids}})
+            await redirect_cache.invalidate_many(
+                [settings.LOCAL_HOST + f"/{short_id}" for short_id in short_ids]
+            )
+            # only unschedule once the links are really gone
+            await redis_client.zrem(EXPIRY_SCHEDULE, *short_ids)
+
+            swept += len(short_ids)
+            self.expired += result.deleted_count
+            print(f"[✔] Deleted {result.deleted_count} expired links")
+            if len(short_ids) < self.batch_size:
+                break
+        return swept
+
+    async def backfill(self) -> int:
+        """
+        Repair ``created_at`` and schedule every link with an expiry. Runs
+        once per deployment. Returns the number of links scheduled.
+        """
+        if await redis_client.get(EXPIRY_BACKFILLED):
+            return 0
+
+        cursor = self._db.urls.find({}, {"short_id": 1, "created_at": 1, "expiry": 1})
+        mapping, repairs = {}, []
+        scheduled = repaired = 0
+        async for url in cursor:
+            created = created_at(url)
+            if created != url.get("created_at"):
+                repairs.append(
+                    UpdateOne({"_id": url["_id"]}, {"$set": {"created_at": created}})
+                )
+            if url.get("expiry"):
+                mapping[url["short_id"]] = created + url["expiry"]
+            if len(mapping) >= self.batch_size or len(repairs) >= self.batch_size:
+                scheduled += await self._schedule(mapping)
+                repaired += await self._repair(repairs)
+                mapping, repairs = {}, []
+        scheduled += await self._schedule(mapping)
+        repaired += await self._repair(repairs)
+
+        await redis_client.set(EXPIRY_BACKFILLED, 1)
+        print(f"[✔] Scheduled {scheduled} links for expiry, repaired {repaired}")
+        return scheduled
+
+    async def _schedule(self, mapping: dict[str, int]) -> int:
+        # overwrites schedules computed from a skewed created_at
+        if mapping:
+            await redis_client.zadd(EXPIRY_SCHEDULE, mapping)
+        return len(mapping)
+
+    async def _repair(self, repairs: list[UpdateOne]) -> int:
+        if repairs:
+            await self._db.urls.bulk_write(repairs, ordered=False)
+        return len(repairs)
+
+
+expiry_sweeper = ExpirySweeper(batch_size=settings.EXPIRY_SWEEP_BATCH)
@@ -0,0 +1,115 @@
+"""
+Streaming export of raw click analytics as NDJSON or CSV.
+
+Clicks are read from an aggregation cursor ``EXPORT_BATCH_SIZE`` documents at
+a time and written out as soon as a batch is formatted, so the memory used by
+an export does not depend on how many clicks it contains.
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from typing import AsyncIterator, Literal
+
+from pymongo import ASCENDING
+
+from linkly.services.analytics import bucket_match, click_filter, unwind_clicks_stages
+from linkly.settings import settings
+
+ExportFormat = Literal["ndjson", "csv"]
+
+EXPORT_FIELDS = (
+    "short_id",
+    "timestamp",
+    "ip",
+    "user_agent",
+    "location",
+    "utm_source",
+    "utm_medium",
+    "utm_campaign",
+)
+
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def export_pipeline(
+    short_urls: list[str],
+    utm_source: str | None = None,
+    utm_medium: str | None = None,
+    utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+) -> list[dict]:
+    return [
+        {"$match": bucket_match(short_urls, start, end)},
+        {"$sort": {"short_id": ASCENDING, "bucket": ASCENDING, "_id": ASCENDING}},
+        *unwind_clicks_stages(
+            click_filter(utm_source, utm_medium, utm_campaign, start, end)
+        ),
+        {
+            "$project": {
+                "_id": 0,
+                "short_id": 1,
+                **{field: f"$click_details.{field}" for field in EXPORT_FIELDS[1:]},
+            }
+        },
+    ]
+
+
+async def iter_click_batches(
+    db_cm, pipeline: list[dict], batch_size: int
+) -> AsyncIterator[list[dict]]:
+    cursor = db_cm.url_analytics_buckets.aggregate(pipeline, batchSize=batch_size)
+    batch = []
+    async for row in cursor:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _value(row: dict, field: str):
+    value = row.get(field)
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+async def ndjson_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    async for batch in batches:
+        yield "".join(
+            json.dumps({field: _value(row, field) for field in EXPORT_FIELDS}) + "\n"
+            for row in batch
+        ).encode()
+
+
+async def csv_chunks(batches: AsyncIterator[list[dict]]) -> AsyncIterator[bytes]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    async for batch in batches:
+        for row in batch:
+            writer.writerow([_value(row, field) for field in EXPORT_FIELDS])
+        yield buffer.getvalue().encode()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        # header only, nothing matched
+        yield buffer.getvalue().encode()
+
+
+def export_clicks(
+    db_cm,
+    short_urls: list[str],
+    fmt: ExportFormat = "ndjson",
+    batch_size: int = settings.EXPORT_BATCH_SIZE,
+    **filters,
+) -> AsyncIterator[bytes]:
+    """
+    Body iterator for a ``StreamingResponse``.
+    """
+    batches = iter_click_batches(
+        db_cm, export_pipeline(short_urls, **filters), batch_size
+    )
+    return csv_chunks(batches) if fmt == "csv" else ndjson_chunks(batches)
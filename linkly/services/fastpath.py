@@ -0,0 +1,100 @@
+"""
+Raw ASGI fast path for ``GET /{short_id}``.
+
+``RedirectFastPath`` wraps the FastAPI app and answers plain redirects
+itself: no middleware stack, no dependency injection, no request or response
+objects. It resolves the short url through the usual cache layers, queues
+the click and writes a 307.
+
+Anything it is not sure about goes to the FastAPI app unchanged:
+
+* other methods, paths with more than one segment, and single segment paths
+  that are routes of their own (``/me``, ``/metrics``, ``/docs``...);
+* requests with an ``Origin`` header, which need the CORS headers;
+* unknown or expired short urls and lookup errors, so they get the same
+  error response as before.
+
+The matched route is put in the scope, so metrics and profiles label fast
+path requests ``/{short_id}`` like routed ones.
+"""
+
+from urllib.parse import quote
+
+from fastapi import FastAPI, HTTPException
+from starlette.requests import Request
+
+from linkly.database import get_db_instance
+from linkly.services.analytics import capture_click
+from linkly.services.clicks import click_queue
+from linkly.services.shortner import resolves_url
+from linkly.settings import settings
+from linkly.utils.asgi import iter_routes
+
+REDIRECT_ROUTE = "/{short_id}"
+
+# same characters as starlette's RedirectResponse leaves unquoted
+_SAFE = ":/%#?=@[]!$&'()*+,;"
+_BODY = {"type": "http.response.body", "body": b""}
+
+
+class RedirectFastPath:
+    def __init__(self, app: FastAPI):
+        self.app = app
+        self.handled = 0
+        self._route = None
+        self._reserved: frozenset[str] | None = None
+
+    def _prepare(self) -> None:
+        # routes are all registered once the first request comes in
+        reserved = set()
+        for path, route in iter_routes(self.app.routes):
+            if path == REDIRECT_ROUTE and "GET" in getattr(route, "methods", ()):
+                self._route = route
+            elif path.count("/") == 1 and "{" not in path:
+                reserved.add(path)
+        self._reserved = frozenset(reserved)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope["method"] != "GET":
+            await self.app(scope, receive, send)
+            return
+
+        if self._reserved is None:
+            self._prepare()
+        path = scope["path"]
+        if (
+            self._route is None
+            or len(path) < 2
+            or path.find("/", 1) != -1
+            or path in self._reserved
+            or any(name == b"origin" for name, _ in scope["headers"])
+        ):
+            await self.app(scope, receive, send)
+            return
+
+        short_url = settings.LOCAL_HOST + path
+        try:
+            original_url = await resolves_url(short_url, get_db_instance())
+        except HTTPException:
+            original_url = None
+        except Exception as e:
+            print(f"[!] Fast path lookup of {short_url} failed: {e}")
+            original_url = None
+        if original_url is None:
+            await self.app(scope, receive, send)
+            return
+
+        scope["route"] = self._route
+        await click_queue.put(capture_click(short_url, Request(scope)))
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 307,
+                "headers": [
+                    (b"content-length", b"0"),
+                    (b"location", quote(original_url, safe=_SAFE).encode("latin-1")),
+                ],
+            }
+        )
+        await send(_BODY)
+        self.handled += 1
@@ -0,0 +1,346 @@
+"""
+Application metrics served on ``GET /metrics``.
+
+``MetricsMiddleware`` records, per route template (``/{short_id}``, not the
+requested path): request latency, status codes and requests in flight. The
+caches, the click queue, the expiry sweeper and the upstream pools already
+count what they do; collectors read those counters when ``/metrics`` is
+scraped, so the redirect path pays for nothing but the middleware.
+Mongo and Redis command latency is recorded in ``linkly/database.py``.
+
+Every uvicorn worker has its own counters. With ``METRICS_MODE=local`` a
+scrape only sees the worker that answered it. With ``METRICS_MODE=redis``
+each worker pushes its snapshot to ``metrics:worker:{id}`` every
+``METRICS_PUSH_INTERVAL`` seconds and ``/metrics`` merges the snapshots of
+every worker that pushed recently, whichever worker serves the scrape.
+Counters and histograms keep a ``worker`` label there: a restarted worker
+starts again from zero, and a summed total that drops would read as a
+counter reset to Prometheus. Aggregate with ``sum(rate(...))``.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import time
+
+from linkly.authentication.jwt.principal import principal_cache
+from linkly.database import redis_client
+from linkly.services.click_stream import analytics_worker
+from linkly.services.clicks import click_queue
+from linkly.services.counters import rollup_counters
+from linkly.services.expiry import expiry_sweeper
+from linkly.services.passwords import password_hasher
+from linkly.services.qr import qr_cache
+from linkly.services.redirect_cache import redirect_cache
+from linkly.services.scheduler import scheduler
+from linkly.services.upstreams import upstreams
+from linkly.settings import settings
+from linkly.utils.asgi import iter_routes
+from linkly.utils.metrics import label_worker, merge, registry
+
+WORKERS_KEY = "metrics:workers"
+
+HTTP_SECONDS = registry.histogram(
+    "linkly_http_request_duration_seconds",
+    "Request latency by route template",
+    labels=("method", "route"),
+)
+HTTP_REQUESTS = registry.counter(
+    "linkly_http_requests_total",
+    "Responses by route template and status code",
+    labels=("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = registry.gauge(
+    "linkly_http_requests_in_flight", "Requests being handled right now"
+)
+
+
+# endpoint -> route template, for starlette versions that do not put the
+# matched route in the scope
+_templates: dict = {}
+
+
+def route_template(scope) -> str:
+    """
+    ``/{short_id}`` rather than the requested path, once routing has run.
+    """
+    route = scope.get("route")
+    if route is not None:
+        return route.path
+    endpoint = scope.get("endpoint")
+    if endpoint is None:
+        return "unmatched"
+    template = _templates.get(endpoint)
+    if template is None:
+        template = "unmatched"
+        for path, candidate in iter_routes(scope["app"].routes):
+            if getattr(candidate, "endpoint", None) is endpoint:
+                template = path
+                break
+        _templates[endpoint] = template
+    return template
+
+
+class MetricsMiddleware:
+    """
+    Pure ASGI so the response body is streamed untouched.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            elapsed = time.perf_counter() - start
+            HTTP_IN_FLIGHT.dec()
+            route = route_template(scope)
+            HTTP_SECONDS.observe(elapsed, scope["method"], route)
+            HTTP_REQUESTS.inc(scope["method"], route, str(status))
+
+
+# ---- collectors over the counters the services already keep ----
+
+
+def _redirect_cache():
+    stats = redirect_cache.stats()
+    for tier in ("local", "redis"):
+        yield (tier, "hit"), stats[tier]["hits"]
+        yield (tier, "miss"), stats[tier]["misses"]
+
+
+def _caches():
+    for name, cache in (("principal", principal_cache), ("qr", qr_cache.local)):
+        stats = cache.stats()
+        yield (name, "hit"), stats["hits"]
+        yield (name, "miss"), stats["misses"]
+
+
+def _cache_sizes():
+    yield ("redirect",), len(redirect_cache.local)
+    yield ("principal",), principal_cache.stats()["size"]
+    yield ("qr",), len(qr_cache.local)
+
+
+def _password_hashes():
+    stats = password_hasher.stats()
+    for state in ("in_flight", "waiting", "rejected", "completed"):
+        yield (state,), stats[state]
+
+
+def _upstream_circuits():
+    states = {"closed": 0, "half-open": 1, "open": 2}
+    for name, stats in upstreams.stats().items():
+        yield (name,), states[stats["circuit"]]
+
+
+registry.collector(
+    "linkly_redirect_cache_lookups_total",
+    "Redirect cache lookups by tier; local misses fall through to redis, "
+    "redis misses to mongo",
+    _redirect_cache,
+    kind="counter",
+    labels=("tier", "result"),
+)
+registry.collector(
+    "linkly_cache_lookups_total",
+    "Lookups of the other in-process caches",
+    _caches,
+    kind="counter",
+    labels=("cache", "result"),
+)
+registry.collector(
+    "linkly_cache_entries",
+    "Entries held by the in-process caches",
+    _cache_sizes,
+    labels=("cache",),
+)
+registry.collector(
+    "linkly_click_queue_depth",
+    "Clicks waiting to be written",
+    lambda: [((), click_queue.qsize())],
+)
+registry.collector(
+    "linkly_click_queue_lag_seconds",
+    "Age of the oldest click in the last flushed batch",
+    lambda: [((), click_queue.lag)],
+    merge="max",
+)
+registry.collector(
+    "linkly_click_flush_duration_seconds",
+    "Duration of the last click batch write",
+    lambda: [((), click_queue.flush_seconds)],
+    merge="max",
+)
+registry.collector(
+    "linkly_clicks_total",
+    "Clicks written and dropped because the queue was full",
+    lambda: [(("flushed",), click_queue.flushed), (("dropped",), click_queue.dropped)],
+    kind="counter",
+    labels=("outcome",),
+)
+registry.collector(
+    "linkly_click_stream_entries_total",
+    "Click stream entries stored, counted after dedup, reclaimed and dead-lettered",
+    lambda: [
+        (("processed",), analytics_worker.processed),
+        (("counted",), analytics_worker.counted),
+        (("reclaimed",), analytics_worker.reclaimed),
+        (("dead",), analytics_worker.dead),
+    ],
+    kind="counter",
+    labels=("outcome",),
+)
+registry.collector(
+    "linkly_rollup_flushes_total",
+    "Rollup counter hashes written behind to mongo",
+    lambda: [((), rollup_counters.flushed)],
+    kind="counter",
+)
+registry.collector(
+    "linkly_expired_links_deleted_total",
+    "Links deleted by the expiry sweeper",
+    lambda: [((), expiry_sweeper.expired)],
+    kind="counter",
+)
+registry.collector(
+    "linkly_scheduler_leader",
+    "Workers holding the scheduler lease, should be 1",
+    lambda: [((), int(scheduler.is_leader))],
+)
+registry.collector(
+    "linkly_scheduler_job_runs_total",
+    "Periodic job runs on the leader, by job and outcome",
+    lambda: [
+        *(((name, "run"), count) for name, count in scheduler.runs.items()),
+        *(((name, "failed"), count) for name, count in scheduler.failures.items()),
+    ],
+    kind="counter",
+    labels=("job", "outcome"),
+)
+registry.collector(
+    "linkly_scheduler_restarts_total",
+    "Supervised background tasks restarted after failing or returning",
+    lambda: [((name,), count) for name, count in scheduler.restarts.items()],
+    kind="counter",
+    labels=("task",),
+)
+registry.collector(
+    "linkly_password_hashes",
+    "Password hashing pool: admitted, waiting for a slot, rejected, completed",
+    _password_hashes,
+    labels=("state",),
+)
+registry.collector(
+    "linkly_upstream_circuit_state",
+    "Circuit breaker per upstream: 0 closed, 1 half-open, 2 open",
+    _upstream_circuits,
+    labels=("upstream",),
+    merge="max",
+)
+
+
+class MetricsExporter:
+    def __init__(self, mode: str, interval: float):
+        self.mode = mode
+        self.interval = interval
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}"
+        self._task: asyncio.Task | None = None
+
+    @property
+    def shared(self) -> bool:
+        return self.mode == "redis"
+
+    @staticmethod
+    def _key(worker_id: str) -> str:
+        return f"metrics:worker:{worker_id}"
+
+    async def start(self) -> None:
+        if self.shared:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.push(registry.snapshot())
+            except Exception as e:
+                print(f"[!] Pushing metrics failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    async def push(self, snapshot: dict) -> None:
+        pipe = redis_client.pipeline(transaction=False)
+        pipe.set(
+            self._key(self.worker_id),
+            json.dumps(snapshot),
+            ex=max(1, int(self.interval * 3)),
+        )
+        pipe.zadd(WORKERS_KEY, {self.worker_id: time.time()})
+        await pipe.execute()
+
+    async def collect(self) -> dict:
+        """
+        Snapshot of this worker, or of every live worker in redis mode.
+        """
+        snapshot = registry.snapshot()
+        if not self.shared:
+            return snapshot
+
+        try:
+            await self.push(snapshot)
+            since = time.time() - self.interval * 3
+            await self._prune(since)
+            workers = [
+                w.decode() if isinstance(w, bytes) else w
+                for w in await redis_client.zrangebyscore(WORKERS_KEY, since, "+inf")
+            ]
+            others = [w for w in workers if w != self.worker_id]
+            pipe = redis_client.pipeline(transaction=False)
+            for worker in others:
+                pipe.get(self._key(worker))
+            raw = await pipe.execute() if others else []
+        except Exception as e:
+            print(f"[!] Reading worker metrics failed, serving this worker only: {e}")
+            return snapshot
+
+        snapshots = [label_worker(snapshot, self.worker_id)] + [
+            label_worker(json.loads(item), worker)
+            for worker, item in zip(others, raw)
+            if item
+        ]
+        return merge(snapshots)
+
+    async def _prune(self, since: float) -> None:
+        stale = await redis_client.zrangebyscore(WORKERS_KEY, "-inf", since)
+        if stale:
+            await redis_client.zrem(WORKERS_KEY, *stale)
+
+
+metrics_exporter = MetricsExporter(
+    mode=settings.METRICS_MODE, interval=settings.METRICS_PUSH_INTERVAL
+)
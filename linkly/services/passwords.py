@@ -0,0 +1,128 @@
+"""
+Password hashing off the event loop.
+
+bcrypt is deliberately slow (~250 ms at the default cost) and holds the
+worker's event loop for the whole computation when called inline, stalling
+every redirect served by that worker. ``PasswordHasher`` runs hashing and
+verification in a small process pool instead:
+
+* at most ``PASSWORD_HASH_WORKERS`` bcrypt computations run at once;
+* at most ``PASSWORD_MAX_PENDING`` may be admitted (running or queued); a
+  caller that cannot get a slot within ``PASSWORD_ADMIT_TIMEOUT`` seconds
+  gets a 503 instead of piling onto the queue;
+* ``verify`` also reports a new hash when the stored one was made with a
+  lower cost than ``BCRYPT_ROUNDS``, so hashes are upgraded on login.
+
+The pool is created on first use, after the server has forked its workers.
+"""
+
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor
+
+from fastapi import HTTPException, status
+from passlib.context import CryptContext
+
+from linkly.settings import settings
+
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=settings.BCRYPT_ROUNDS,
+    # hashes below the current cost are rehashed by verify_and_update
+    bcrypt__min_rounds=settings.BCRYPT_ROUNDS,
+)
+
+
+def _hash(password: str) -> str:
+    return pwd_context.hash(password)
+
+
+def _verify_and_update(password: str, hashed: str) -> tuple[bool, str | None]:
+    return pwd_context.verify_and_update(password, hashed)
+
+
+class PasswordHasher:
+    def __init__(
+        self,
+        workers: int,
+        max_pending: int,
+        admit_timeout: float,
+        executor: Executor | None = None,
+    ):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.admit_timeout = admit_timeout
+        self.waiting = 0
+        self.in_flight = 0
+        self.rejected = 0
+        self.completed = 0
+        self._executor = executor
+        self._slots: asyncio.Semaphore | None = None
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def _run(self, fn, *args):
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_pending)
+
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.admit_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many login attempts in progress, try again shortly",
+            )
+        finally:
+            self.waiting -= 1
+
+        self.in_flight += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._pool(), fn, *args)
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self._slots.release()
+
+    async def hash(self, password: str) -> str:
+        return await self._run(_hash, password)
+
+    async def verify(self, password: str, hashed: str) -> tuple[bool, str | None]:
+        """
+        Returns ``(matches, new_hash)``; ``new_hash`` is set when the stored
+        hash should be replaced.
+        """
+        return await self._run(_verify_and_update, password, hashed)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "waiting": self.waiting,
+            "in_flight": self.in_flight,
+            # admitted but waiting for a free pool process
+            "queued": max(0, self.in_flight - self.workers),
+            "rejected": self.rejected,
+            "completed": self.completed,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher(
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_MAX_PENDING,
+    admit_timeout=settings.PASSWORD_ADMIT_TIMEOUT,
+)
@@ -0,0 +1,287 @@
+"""
+On-demand request profiling.
+
+``ProfilingMiddleware`` profiles a request with ``linkly.utils.profiler``
+when either:
+
+* it is picked at random, ``PROFILE_SAMPLE_RATE`` of all requests; the rate
+  can be changed at runtime for every worker with ``PUT /profiles/sampling``,
+  and the change reverts after its ttl;
+* it carries a valid ``X-Linkly-Profile`` token, see ``sign_token`` and
+  ``python -m linkly.commands.profile_token``.
+
+Without ``PROFILE_SECRET`` only the configured rate applies and the profile
+endpoints are disabled. With a zero rate and no token, a request costs one
+comparison and, when a secret is set, one scan of its headers.
+
+Profiles are written to ``PROFILE_DIR`` after the response has been sent,
+as collapsed stacks or speedscope JSON (``PROFILE_FORMAT``). The file name
+carries the time, worker pid, method, duration and route template, so
+listing needs no index. Only the newest ``PROFILE_KEEP`` files are kept.
+"""
+
+import asyncio
+import hashlib
+import hmac
+import json
+import os
+import random
+import time
+from collections import Counter
+from dataclasses import dataclass
+from urllib.parse import quote, unquote
+
+from linkly.database import redis_client
+from linkly.services.metrics import route_template
+from linkly.settings import settings
+from linkly.utils.profiler import (
+    Sampler,
+    from_collapsed,
+    from_speedscope,
+    to_collapsed,
+    to_speedscope,
+)
+
+PROFILE_HEADER = b"x-linkly-profile"
+SAMPLE_RATE_KEY = "profiles:sample-rate"
+
+EXTENSIONS = {"collapsed": ".collapsed", "speedscope": ".speedscope.json"}
+
+
+def sign_token(secret: str, expires: int) -> str:
+    signature = hmac.new(secret.encode(), str(expires).encode(), hashlib.sha256)
+    return f"{expires}.{signature.hexdigest()}"
+
+
+def verify_token(secret: str | None, token: str | None) -> bool:
+    if not secret or not token:
+        return False
+    expires, _, _ = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(sign_token(secret, int(expires)), token)
+
+
+@dataclass(frozen=True)
+class ProfileInfo:
+    name: str
+    created: float
+    pid: int
+    method: str
+    route: str
+    duration_ms: float
+
+
+class ProfileStore:
+    def __init__(self, directory: str, fmt: str, keep: int, interval: float):
+        if fmt not in EXTENSIONS:
+            raise ValueError(f"Unknown profile format {fmt}")
+        self.directory = directory
+        self.fmt = fmt
+        self.keep = keep
+        self.interval = interval
+
+    def save(self, stacks: Counter, method: str, route: str, duration: float) -> str:
+        os.makedirs(self.directory, exist_ok=True)
+        # sortable by time, route quoted so it is one path segment
+        name = (
+            f"{int(time.time() * 1000):013d}-{os.getpid()}-{method}-"
+            f"{int(duration * 1e6)}-{quote(route, safe='')}{EXTENSIONS[self.fmt]}"
+        )
+        if self.fmt == "collapsed":
+            content = to_collapsed(stacks)
+        else:
+            title = f"{method} {route} {duration * 1000:.1f}ms"
+            content = json.dumps(to_speedscope(stacks, title, self.interval))
+        with open(os.path.join(self.directory, name), "w", encoding="utf-8") as f:
+            f.write(content)
+        self._trim()
+        return name
+
+    def _names(self) -> list[str]:
+        try:
+            names = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        return sorted(n for n in names if n.endswith(tuple(EXTENSIONS.values())))
+
+    def _trim(self) -> None:
+        for name in self._names()[: -self.keep or None]:
+            try:
+                os.remove(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                # another worker trimmed it first
+                pass
+
+    @staticmethod
+    def parse(name: str) -> ProfileInfo | None:
+        stem = name
+        for extension in EXTENSIONS.values():
+            stem = stem.removesuffix(extension)
+        try:
+            created, pid, method, duration, route = stem.split("-", 4)
+            return ProfileInfo(
+                name=name,
+                created=int(created) / 1000,
+                pid=int(pid),
+                method=method,
+                route=unquote(route),
+                duration_ms=int(duration) / 1000,
+            )
+        except ValueError:
+            return None
+
+    def recent(self, route: str | None = None, limit: int = 50) -> list[ProfileInfo]:
+        """
+        Newest first.
+        """
+        found = []
+        for name in reversed(self._names()):
+            info = self.parse(name)
+            if info is None or (route is not None and info.route != route):
+                continue
+            found.append(info)
+            if len(found) == limit:
+                break
+        return found
+
+    def path(self, name: str) -> str | None:
+        if self.parse(name) is None or os.path.basename(name) != name:
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.exists(path) else None
+
+    def load(self, name: str) -> Counter:
+        with open(os.path.join(self.directory, name), encoding="utf-8") as f:
+            if name.endswith(EXTENSIONS["collapsed"]):
+                return from_collapsed(f.read())
+            return from_speedscope(json.load(f), self.interval)
+
+    def aggregate(self, profiles: list[ProfileInfo]) -> Counter:
+        stacks = Counter()
+        for info in profiles:
+            try:
+                stacks.update(self.load(info.name))
+            except FileNotFoundError:
+                pass
+        return stacks
+
+
+class Profiling:
+    def __init__(
+        self,
+        sample_rate: float,
+        secret: str | None,
+        store: ProfileStore,
+        sampler: Sampler,
+        refresh_interval: float,
+    ):
+        self.default_rate = sample_rate
+        self.sample_rate = sample_rate
+        self.secret = secret
+        self.store = store
+        self.sampler = sampler
+        self.refresh_interval = refresh_interval
+        self.profiled = 0
+        self._task: asyncio.Task | None = None
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.secret)
+
+    def wanted(self, scope) -> bool:
+        if self.sample_rate and random.random() < self.sample_rate:
+            return True
+        if not self.secret:
+            return False
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER:
+                return verify_token(self.secret, value.decode("latin-1"))
+        return False
+
+    async def set_sample_rate(self, rate: float, ttl: int) -> None:
+        """
+        Change the rate of every worker for ``ttl`` seconds.
+        """
+        await redis_client.set(SAMPLE_RATE_KEY, str(rate), ex=ttl)
+        self.sample_rate = rate
+
+    async def refresh(self) -> None:
+        raw = await redis_client.get(SAMPLE_RATE_KEY)
+        self.sample_rate = self.default_rate if raw is None else float(raw)
+
+    async def start(self) -> None:
+        if self.enabled:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is None:
+            return
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception as e:
+                print(f"[!] Reading the profile sample rate failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
+
+    def save(self, stacks: Counter, method: str, route: str, duration: float) -> None:
+        try:
+            name = self.store.save(stacks, method, route, duration)
+            print(f"[✔] Profiled {method} {route} in {duration * 1000:.1f}ms: {name}")
+        except Exception as e:
+            print(f"[!] Writing profile failed: {e}")
+
+
+class ProfilingMiddleware:
+    """
+    Pure ASGI, outermost, so the other middleware shows up in profiles.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not profiling.wanted(scope):
+            await self.app(scope, receive, send)
+            return
+
+        task = asyncio.current_task()
+        profiling.sampler.begin(task)
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            duration = time.perf_counter() - start
+            profile = profiling.sampler.end(task)
+            profiling.profiled += 1
+            # the response is out; write the file off the event loop
+            asyncio.get_running_loop().run_in_executor(
+                None,
+                profiling.save,
+                profile.stacks,
+                scope["method"],
+                route_template(scope),
+                duration,
+            )
+
+
+profiling = Profiling(
+    sample_rate=settings.PROFILE_SAMPLE_RATE,
+    secret=settings.PROFILE_SECRET,
+    store=ProfileStore(
+        directory=settings.PROFILE_DIR,
+        fmt=settings.PROFILE_FORMAT,
+        keep=settings.PROFILE_KEEP,
+        interval=settings.PROFILE_INTERVAL,
+    ),
+    sampler=Sampler(interval=settings.PROFILE_INTERVAL),
+    refresh_interval=settings.PROFILE_REFRESH_INTERVAL,
+)
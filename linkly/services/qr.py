@@ -0,0 +1,167 @@
+"""
+QR code images of short urls, rendered in process and cached.
+
+A rendered image only depends on the short url and the render options, so it
+never changes. Images are kept in two tiers, like redirects:
+
+1. A bounded in-process LRU, private to each worker.
+2. Redis under ``qr:{short_id}:{format}:{size}:{margin}:{ecc}``, shared by
+   every worker.
+
+Encoding is pure Python and takes milliseconds to a few hundred milliseconds
+for the largest codes. That work holds the GIL, so a thread would still stall
+the event loop; renders run in a small process pool (``QR_RENDER_WORKERS``
+per worker, created on first use like the password hashing pool) and
+concurrent requests for the same image share one render. Each image carries an ``ETag`` (a digest of
+its bytes) for conditional GETs.
+"""
+
+import asyncio
+import hashlib
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Literal
+
+from linkly.database import redis_client
+from linkly.settings import settings
+from linkly.utils.lru import LRUCache
+from linkly.utils.metrics import registry
+from linkly.utils.qrcode import ErrorCorrection, QRCode
+from linkly.utils.singleflight import SingleFlight
+
+QRFormat = Literal["png", "svg"]
+
+MEDIA_TYPES = {"png": "image/png", "svg": "image/svg+xml"}
+
+QR_RENDER_SECONDS = registry.histogram(
+    "linkly_qr_render_duration_seconds",
+    "Time to encode and draw a QR code that was in neither cache tier",
+    labels=("format",),
+)
+
+
+@dataclass(frozen=True)
+class QRImage:
+    content: bytes
+    media_type: str
+    etag: str
+
+
+def qr_key(
+    short_id: str, fmt: QRFormat, size: int, margin: int, ecc: ErrorCorrection
+) -> str:
+    return f"qr:{short_id}:{fmt}:{size}:{margin}:{ecc}"
+
+
+def render_qr(
+    data: str, fmt: QRFormat, size: int, margin: int, ecc: ErrorCorrection
+) -> bytes:
+    """
+    Encode ``data`` and render it ``size`` pixels wide, rounded down to whole
+    pixels per module (at least one).
+    """
+    code = QRCode.encode(data, ecc)
+    scale = max(1, size // (code.size + 2 * margin))
+    if fmt == "svg":
+        return code.to_svg(scale=scale, margin=margin)
+    return code.to_png(scale=scale, margin=margin)
+
+
+def _image(fmt: QRFormat, content: bytes) -> QRImage:
+    digest = hashlib.blake2b(content, digest_size=16).hexdigest()
+    return QRImage(content, MEDIA_TYPES[fmt], f'"{digest}"')
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    ``If-None-Match`` check, weak tags included.
+    """
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+class QRCache:
+    def __init__(
+        self,
+        maxsize: int,
+        redis_ttl: int,
+        workers: int = 1,
+        executor: Executor | None = None,
+    ):
+        self.local = LRUCache(maxsize=maxsize)
+        self.redis_ttl = redis_ttl
+        self.workers = workers
+        self.renders = SingleFlight()
+        self.rendered = 0
+        self._executor = executor
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+            )
+        return self._executor
+
+    async def get(
+        self,
+        short_id: str,
+        fmt: QRFormat = "png",
+        size: int = 150,
+        margin: int = 4,
+        ecc: ErrorCorrection = "M",
+    ) -> QRImage:
+        key = qr_key(short_id, fmt, size, margin, ecc)
+        image = self.local.get(key)
+        if image is not None:
+            return image
+        return await self.renders.do(
+            key, lambda: self._load(key, short_id, fmt, size, margin, ecc)
+        )
+
+    async def _load(self, key, short_id, fmt, size, margin, ecc) -> QRImage:
+        try:
+            content = await redis_client.get(key)
+        except Exception:
+            # a broken redis only costs a render
+            content = None
+
+        if content is None:
+            short_url = settings.LOCAL_HOST + f"/{short_id}"
+            start = time.perf_counter()
+            loop = asyncio.get_running_loop()
+            content = await loop.run_in_executor(
+                self._pool(), render_qr, short_url, fmt, size, margin, ecc
+            )
+            QR_RENDER_SECONDS.observe(time.perf_counter() - start, fmt)
+            self.rendered += 1
+            try:
+                await redis_client.set(key, content, ex=self.redis_ttl)
+            except Exception as e:
+                print(f"[!] Caching qr code {key} failed: {e}")
+
+        image = _image(fmt, content)
+        self.local.set(key, image)
+        return image
+
+    def clear(self) -> None:
+        self.local.clear()
+
+    def stats(self) -> dict:
+        return {"local": self.local.stats(), "rendered": self.rendered}
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+qr_cache = QRCache(
+    maxsize=settings.QR_CACHE_SIZE,
+    redis_ttl=settings.QR_CACHE_TTL,
+    workers=settings.QR_RENDER_WORKERS,
+)
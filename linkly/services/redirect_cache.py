@@ -0,0 +1,269 @@
+"""
+Two-tier cache used by ``resolves_url``.
+
+1. A bounded in-process LRU, private to each worker.
+2. The fastapi-cache Redis backend, shared by every worker.
+
+Both tiers remember "not found" results as well, so probing unknown ids does
+not fall through to Mongo on every request. When a link is removed its short
+url is published on ``INVALIDATION_CHANNEL`` and every worker evicts it from
+its local tier.
+
+Each entry gets its own TTL:
+
+* it never outlives the link, so an expiring link stops redirecting from
+  cache the moment it expires;
+* it starts at the tier's base TTL and grows by one base TTL for every
+  ``REDIRECT_HOT_HITS`` hits the link got in this worker, up to
+  ``REDIRECT_CACHE_MAX_TTL``;
+* with ``REDIRECT_CACHE_MAX_TTL=0`` links without expiry are cached until
+  they are deleted.
+
+Redis values carry the link's expiry next to the url, so a worker filling
+its local tier from Redis derives the same bound. A local entry past its TTL
+is kept for ``REDIRECT_STALE_TTL`` more seconds and served as stale while
+``resolves_url`` refreshes it in the background.
+"""
+
+import json
+import time
+
+from fastapi_cache import FastAPICache
+
+from linkly.database import redis_client
+from linkly.settings import settings
+from linkly.utils.lru import LRUCache
+
+INVALIDATION_CHANNEL = "linkly:redirect-invalidate"
+
+# marker stored for short urls that do not exist
+NOT_FOUND = "__not_found__"
+
+
+class RedirectCache:
+    def __init__(
+        self,
+        maxsize: int,
+        ttl: int,
+        redis_ttl: int,
+        not_found_ttl: int,
+        max_ttl: int = 0,
+        hot_hits: int = 100,
+        stale_ttl: int = 0,
+    ):
+        # (value, fresh until) pairs, each stored with an explicit ttl
+        self.local = LRUCache(maxsize=maxsize)
+        self.local_ttl = ttl
+        self.redis_ttl = redis_ttl
+        self.not_found_ttl = not_found_ttl
+        self.max_ttl = max_ttl
+        self.hot_hits = hot_hits
+        self.stale_ttl = stale_ttl
+        # hits per short url seen by this worker
+        self.heat = LRUCache(maxsize=maxsize)
+        self.redis_hits = 0
+        self.redis_misses = 0
+
+    @staticmethod
+    def _backend():
+        # FastAPICache is initialised in the app lifespan; scripts and tests
+        # run without it and only get the local tier.
+        try:
+            return FastAPICache.get_backend()
+        except AssertionError:
+            return None
+
+    @staticmethod
+    def _key(short_url: str) -> str:
+        return f"{FastAPICache.get_prefix()}:redirect:{short_url}"
+
+    def lookup(self, short_url: str) -> tuple[str | None, bool]:
+        """
+        Local tier only. Returns ``(value, stale)``; a stale value may still
+        be served while it is refreshed in the background.
+        """
+        entry = self.local.get(short_url)
+        if entry is None:
+            return None, False
+        self._touch(short_url)
+        value, fresh_until = entry
+        return value, fresh_until is not None and fresh_until <= time.monotonic()
+
+    async def get(self, short_url: str) -> str | None:
+        """
+        Return the original url, ``NOT_FOUND`` for a cached miss or ``None``
+        when neither tier knows the short url.
+        """
+        value, _ = self.lookup(short_url)
+        if value is not None:
+            return value
+        return await self.get_shared(short_url)
+
+    async def get_shared(self, short_url: str) -> str | None:
+        """
+        Read the redis tier and refill the local one from it.
+        """
+        backend = self._backend()
+        if backend is None:
+            return None
+
+        try:
+            raw = await backend.get(self._key(short_url))
+        except Exception:
+            # a broken redis should degrade to mongo lookups, not 500s
+            raw = None
+
+        if raw is None:
+            self.redis_misses += 1
+            return None
+
+        self.redis_hits += 1
+        value, expires_at = self._decode(raw)
+        hits = self._touch(short_url)
+        self._set_local(short_url, value, expires_at, hits)
+        return value
+
+    async def set(
+        self, short_url: str, value: str, expires_at: float | None = None
+    ) -> None:
+        """
+        Cache ``value`` for ``short_url``. ``expires_at`` is the unix time the
+        link itself expires, if it does.
+        """
+        hits = self.heat.get(short_url, 0)
+        if not self._set_local(short_url, value, expires_at, hits):
+            return
+
+        backend = self._backend()
+        if backend is None:
+            return
+        expire = self.ttl_for(self.redis_ttl, value, expires_at, hits)
+        try:
+            await backend.set(
+                self._key(short_url),
+                json.dumps([value, expires_at]).encode(),
+                expire=None if expire is None else max(1, int(expire)),
+            )
+        except Exception:
+            pass
+
+    def _set_local(
+        self, short_url: str, value: str, expires_at: float | None, hits: int
+    ) -> bool:
+        ttl = self.ttl_for(self.local_ttl, value, expires_at, hits)
+        if ttl is None:
+            self.local.set(short_url, (value, None), ttl=None)
+            return True
+        if ttl <= 0:
+            return False
+
+        fresh_until = None
+        if self.stale_ttl and value != NOT_FOUND:
+            # keep serving for ``stale_ttl`` more seconds while refreshing,
+            # but never past the link's own expiry
+            fresh_until = time.monotonic() + ttl
+            ttl += self.stale_ttl
+            if expires_at is not None:
+                ttl = min(ttl, expires_at - time.time())
+        self.local.set(short_url, (value, fresh_until), ttl=ttl)
+        return True
+
+    def ttl_for(
+        self, base: int, value: str, expires_at: float | None, hits: int = 0
+    ) -> float | None:
+        """
+        Seconds ``value`` may be cached in a tier whose base TTL is ``base``,
+        or None to keep it until it is invalidated.
+        """
+        if value == NOT_FOUND:
+            return min(base, self.not_found_ttl)
+        if expires_at is None and not self.max_ttl:
+            return None
+
+        ttl = base * (1 + hits // self.hot_hits)
+        if self.max_ttl:
+            ttl = min(ttl, self.max_ttl)
+        if expires_at is not None:
+            ttl = min(ttl, expires_at - time.time())
+        return ttl
+
+    def _touch(self, short_url: str) -> int:
+        hits = self.heat.get(short_url, 0) + 1
+        self.heat.set(short_url, hits)
+        return hits
+
+    @staticmethod
+    def _decode(raw: bytes | str) -> tuple[str, float | None]:
+        raw = raw.decode() if isinstance(raw, bytes) else raw
+        try:
+            value, expires_at = json.loads(raw)
+            return value, expires_at
+        except ValueError:
+            # plain url written before entries carried their expiry
+            return raw, None
+
+    async def invalidate(self, short_url: str) -> None:
+        """
+        Drop ``short_url`` from both tiers and tell the other workers to do
+        the same.
+        """
+        await self.invalidate_many([short_url])
+
+    async def invalidate_many(self, short_urls: list[str]) -> None:
+        """
+        ``invalidate`` for a batch of short urls in a single redis round trip.
+        """
+        for short_url in short_urls:
+            self.local.pop(short_url)
+
+        if not short_urls or self._backend() is None:
+            return
+        try:
+            pipe = redis_client.pipeline(transaction=False)
+            pipe.delete(*(self._key(short_url) for short_url in short_urls))
+            for short_url in short_urls:
+                pipe.publish(INVALIDATION_CHANNEL, short_url)
+            await pipe.execute()
+        except Exception as e:
+            print(f"[!] Redirect cache invalidation failed for {short_urls}: {e}")
+
+    def evict_local(self, short_url: str) -> None:
+        self.local.pop(short_url)
+
+    def stats(self) -> dict:
+        return {
+            "local": self.local.stats(),
+            "redis": {"hits": self.redis_hits, "misses": self.redis_misses},
+        }
+
+
+redirect_cache = RedirectCache(
+    maxsize=settings.REDIRECT_CACHE_SIZE,
+    ttl=settings.REDIRECT_CACHE_TTL,
+    redis_ttl=settings.REDIRECT_CACHE_REDIS_TTL,
+    not_found_ttl=settings.REDIRECT_NOT_FOUND_TTL,
+    max_ttl=settings.REDIRECT_CACHE_MAX_TTL,
+    hot_hits=settings.REDIRECT_HOT_HITS,
+    stale_ttl=settings.REDIRECT_STALE_TTL,
+)
+
+
+async def redirect_invalidation_listener(redis_client):
+    """
+    Evict short urls published by other workers from the local tier.
+    Supervised by the scheduler, which restarts it when the connection drops.
+    """
+    pubsub = redis_client.pubsub()
+    try:
+        await pubsub.subscribe(INVALIDATION_CHANNEL)
+        # invalidations published while nobody was listening are lost
+        redirect_cache.local.clear()
+
+        async for message in pubsub.listen():
+            if message["type"] == "message":
+                short_url = message["data"]
+                if isinstance(short_url, bytes):
+                    short_url = short_url.decode()
+                redirect_cache.evict_local(short_url)
+    finally:
+        await pubsub.aclose()
@@ -0,0 +1,155 @@
+"""
+Incrementally maintained analytics rollups.
+
+Every flushed batch of clicks also ``$inc``-upserts one ``url_rollups``
+document per (short url, period, bucket) for both hourly and daily periods::
+
+    {
+        "short_id": "http://localhost:8000/abc12",
+        "period": "day",
+        "bucket": datetime(2025, 6, 23),
+        "clicks": 42,
+        "utm_source": {"google": 30, "(none)": 12},
+        "utm_medium": {...},
+        "utm_campaign": {...},
+        "location": {"Kathmandu, Nepal": 40, ...},
+    }
+
+Summaries ("clicks by source over the last 30 days") read only these
+documents, so their cost grows with the number of buckets in the window and
+not with the number of clicks.
+"""
+
+from datetime import datetime, timedelta, timezone
+from typing import Literal, get_args
+from urllib.parse import unquote
+
+from pymongo import UpdateOne
+
+Dimension = Literal["utm_source", "utm_medium", "utm_campaign", "location"]
+Period = Literal["hour", "day"]
+
+DIMENSIONS: tuple[str, ...] = get_args(Dimension)
+PERIODS: tuple[str, ...] = get_args(Period)
+
+# dimension value used for clicks that did not carry one
+NONE_VALUE = "(none)"
+
+
+def period_start(timestamp: datetime, period: str) -> datetime:
+    if period == "day":
+        return timestamp.replace(hour=0, minute=0, second=0, microsecond=0)
+    return timestamp.replace(minute=0, second=0, microsecond=0)
+
+
+def _naive(bucket: datetime) -> datetime:
+    # mongo hands datetimes back as naive UTC
+    if bucket.tzinfo is None:
+        return bucket
+    return bucket.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def encode_value(value: str | None) -> str:
+    """
+    Dimension values become field names, which may not contain "." or start
+    with "$", so those (and "%") are percent-encoded.
+    """
+    if value is None or value == "":
+        return NONE_VALUE
+    return value.replace("%", "%25").replace(".", "%2E").replace("$", "%24")
+
+
+def decode_value(key: str) -> str:
+    return unquote(key)
+
+
+def rollup_increments(
+    clicks: list[tuple[str, dict]],
+) -> dict[tuple[str, str, datetime], dict[str, int]]:
+    """
+    Fold ``(short url, click)`` pairs into counter increments per
+    (short url, period, bucket).
+    """
+    increments: dict[tuple[str, str, datetime], dict[str, int]] = {}
+    for short_id, click in clicks:
+        for period in PERIODS:
+            key = (short_id, period, period_start(click["timestamp"], period))
+            counters = increments.setdefault(key, {})
+            counters["clicks"] = counters.get("clicks", 0) + 1
+            for dimension in DIMENSIONS:
+                field = f"{dimension}.{encode_value(click.get(dimension))}"
+                counters[field] = counters.get(field, 0) + 1
+    return increments
+
+
+def rollup_operations(clicks: list[tuple[str, dict]]) -> list[UpdateOne]:
+    """
+    One ``$inc`` upsert per (short url, period, bucket).
+    """
+    return [
+        UpdateOne(
+            {"short_id": short_id, "period": period, "bucket": bucket},
+            {"$inc": counters},
+            upsert=True,
+        )
+        for (short_id, period, bucket), counters in rollup_increments(clicks).items()
+    ]
+
+
+async def rollup_summary(
+    short_url: str,
+    db_cm,
+    dimension: Dimension,
+    days: int = 30,
+    period: Period = "day",
+    live: dict[datetime, dict[str, int]] | None = None,
+) -> dict:
+    """
+    Total clicks, clicks per ``dimension`` value and a per bucket series over
+    the last ``days`` days. ``live`` holds counters per bucket that are not
+    in mongo yet, see ``linkly.services.counters``.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f"Unknown dimension {dimension}")
+
+    since = period_start(datetime.now(timezone.utc) - timedelta(days=days), period)
+    cursor = db_cm.url_rollups.find(
+        {"short_id": short_url, "period": period, "bucket": {"$gte": since}},
+        {"_id": 0, "bucket": 1, "clicks": 1, dimension: 1},
+    ).sort("bucket", 1)
+
+    # bucket -> {"clicks": n, "utm_source.google": n, ...}
+    counters: dict[datetime, dict[str, int]] = {}
+    async for doc in cursor:
+        flat = counters[_naive(doc["bucket"])] = {"clicks": doc.get("clicks", 0)}
+        for key, count in (doc.get(dimension) or {}).items():
+            flat[f"{dimension}.{key}"] = count
+    for bucket, deltas in (live or {}).items():
+        if _naive(bucket) < _naive(since):
+            continue
+        flat = counters.setdefault(_naive(bucket), {})
+        for field, count in deltas.items():
+            flat[field] = flat.get(field, 0) + count
+
+    total = 0
+    breakdown: dict[str, int] = {}
+    series = []
+    prefix = f"{dimension}."
+    for bucket, flat in sorted(counters.items()):
+        clicks = flat.get("clicks", 0)
+        total += clicks
+        series.append({"bucket": bucket.isoformat(), "clicks": clicks})
+        for field, count in flat.items():
+            if field.startswith(prefix):
+                value = decode_value(field[len(prefix) :])
+                breakdown[value] = breakdown.get(value, 0) + count
+
+    return {
+        "short_id": short_url,
+        "dimension": dimension,
+        "days": days,
+        "period": period,
+        "clicks": total,
+        "breakdown": dict(sorted(breakdown.items(), key=lambda kv: -kv[1])),
+        "series": series,
+    }
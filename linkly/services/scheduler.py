@@ -0,0 +1,243 @@
+"""
+Background jobs shared by all the workers of a deployment.
+
+Every uvicorn/gunicorn worker runs the same ``Scheduler``; what differs is
+what each one is allowed to run:
+
+* ``supervise(name, factory)``: a long running task every worker needs (the
+  redirect invalidation listener). It is restarted whenever it fails or
+  returns, after an exponential backoff with jitter between
+  ``SCHEDULER_RESTART_BACKOFF`` and ``SCHEDULER_MAX_BACKOFF`` seconds. The
+  backoff starts over once the task has stayed up for ``SCHEDULER_MAX_BACKOFF``
+  seconds.
+* ``every(name, interval, job)``: a periodic job (the expiry sweep) that must
+  run on exactly one worker. Only the leader runs it. The time of the last
+  run is kept in Redis, so a new leader carries on with the schedule instead
+  of running everything again at once.
+
+Leadership is a Redis lease, ``scheduler:leader``. The workers try to take
+it with ``SET NX EX SCHEDULER_LEASE_TTL`` and the holder renews it every
+third of the TTL. If the leader dies, another worker takes over within one
+TTL. While Redis cannot be reached nobody is leader and periodic jobs pause.
+
+``stop`` lets running jobs finish for up to ``SCHEDULER_SHUTDOWN_TIMEOUT``
+seconds, cancels the rest and gives the lease up, so the next leader does
+not wait for it to expire.
+"""
+
+import asyncio
+import random
+import time
+import uuid
+from typing import Awaitable, Callable
+
+from linkly.database import redis_client
+from linkly.settings import settings
+
+LEADER_KEY = "scheduler:leader"
+LAST_RUN_KEY = "scheduler:last-run"
+
+Job = Callable[[], Awaitable]
+
+
+class Lease:
+    """
+    A Redis key held by one owner at a time, until it expires or is released.
+    Renewal and release check the owner and act in one script, so a lease that
+    expired and was taken over in between is left alone.
+    """
+
+    RENEW = """
+        if redis.call("get", KEYS[1]) == ARGV[1] then
+            return redis.call("expire", KEYS[1], ARGV[2])
+        end
+        return 0
+    """
+    RELEASE = """
+        if redis.call("get", KEYS[1]) == ARGV[1] then
+            return redis.call("del", KEYS[1])
+        end
+        return 0
+    """
+
+    def __init__(self, key: str, ttl: int):
+        self.key = key
+        self.ttl = ttl
+        self.token = uuid.uuid4().hex
+
+    async def acquire(self) -> bool:
+        """
+        Take or renew the lease. Returns True while this owner holds it.
+        """
+        if await redis_client.set(self.key, self.token, nx=True, ex=self.ttl):
+            return True
+        return bool(
+            await redis_client.eval(self.RENEW, 1, self.key, self.token, self.ttl)
+        )
+
+    async def release(self) -> None:
+        try:
+            await redis_client.eval(self.RELEASE, 1, self.key, self.token)
+        except Exception:
+            pass
+
+
+class Scheduler:
+    def __init__(
+        self,
+        lease_ttl: int,
+        backoff: float,
+        max_backoff: float,
+        shutdown_timeout: float,
+    ):
+        self.lease = Lease(LEADER_KEY, lease_ttl)
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.shutdown_timeout = shutdown_timeout
+        self.is_leader = False
+        # name -> count, for the metrics endpoint
+        self.runs: dict[str, int] = {}
+        self.failures: dict[str, int] = {}
+        self.restarts: dict[str, int] = {}
+        self._supervised: dict[str, Job] = {}
+        self._periodic: dict[str, tuple[float, Job]] = {}
+        self._tasks: dict[str, asyncio.Task] = {}
+        self._stopping: asyncio.Event | None = None
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    def supervise(self, name: str, factory: Job) -> None:
+        """
+        Keep ``factory()`` running on every worker.
+        """
+        self._supervised[name] = factory
+        self.restarts.setdefault(name, 0)
+
+    def every(self, name: str, interval: float, job: Job) -> None:
+        """
+        Run ``job()`` every ``interval`` seconds on the leader only.
+        """
+        self._periodic[name] = (interval, job)
+        self.runs.setdefault(name, 0)
+        self.failures.setdefault(name, 0)
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._stopping = asyncio.Event()
+        # periodic jobs can start right away if nobody else leads
+        await self._check_lease()
+        self._tasks[LEADER_KEY] = asyncio.create_task(self._elect(), name=LEADER_KEY)
+        for name, factory in self._supervised.items():
+            self._tasks[name] = asyncio.create_task(
+                self._supervise(name, factory), name=name
+            )
+        for name, (interval, job) in self._periodic.items():
+            self._tasks[name] = asyncio.create_task(
+                self._every(name, interval, job), name=name
+            )
+
+    async def stop(self) -> None:
+        """
+        Let running jobs finish within the shutdown timeout, then cancel.
+        """
+        if not self.running:
+            return
+        self._stopping.set()
+        tasks = list(self._tasks.values())
+        # supervised tasks run until cancelled, nothing to wait for
+        for name in self._supervised:
+            self._tasks[name].cancel()
+        _, pending = await asyncio.wait(tasks, timeout=self.shutdown_timeout)
+        for task in pending:
+            print(f"[!] Cancelling {task.get_name()} after the shutdown timeout")
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks = {}
+        if self.is_leader:
+            self.is_leader = False
+            await self.lease.release()
+
+    async def _wait(self, seconds: float) -> bool:
+        """
+        Sleep up to ``seconds``. Returns True when the scheduler is stopping.
+        """
+        try:
+            await asyncio.wait_for(self._stopping.wait(), max(seconds, 0))
+        except asyncio.TimeoutError:
+            pass
+        return self._stopping.is_set()
+
+    async def _check_lease(self) -> None:
+        try:
+            leader = await self.lease.acquire()
+        except Exception as e:
+            print(f"[!] Scheduler lease check failed: {e}")
+            leader = False
+        if leader != self.is_leader:
+            print(
+                "[✔] This worker now runs the periodic jobs"
+                if leader
+                else "[!] This worker no longer runs the periodic jobs"
+            )
+            self.is_leader = leader
+
+    async def _elect(self) -> None:
+        while not await self._wait(self.lease.ttl / 3):
+            await self._check_lease()
+
+    async def _supervise(self, name: str, factory: Job) -> None:
+        loop = asyncio.get_running_loop()
+        failures = 0
+        while True:
+            started = loop.time()
+            try:
+                await factory()
+                print(f"[!] {name} returned, restarting it")
+            except Exception as e:
+                print(f"[!] {name} failed, restarting it: {e!r}")
+            if loop.time() - started >= self.max_backoff:
+                failures = 0
+            step = min(self.max_backoff, self.backoff * 2**failures)
+            failures += 1
+            self.restarts[name] += 1
+            if await self._wait(random.uniform(step / 2, step)):
+                return
+
+    async def _every(self, name: str, interval: float, job: Job) -> None:
+        while not self._stopping.is_set():
+            if not self.is_leader:
+                delay = self.lease.ttl / 3
+            else:
+                try:
+                    delay = await self._run_if_due(name, interval, job)
+                except Exception as e:
+                    print(f"[!] Scheduled job {name} failed: {e}")
+                    self.failures[name] += 1
+                    delay = interval
+            if await self._wait(delay):
+                return
+
+    async def _run_if_due(self, name: str, interval: float, job: Job) -> float:
+        """
+        Run ``job`` if its interval has passed. Returns seconds to the next run.
+        """
+        last = await redis_client.zscore(LAST_RUN_KEY, name)
+        now = time.time()
+        if last is not None and now - float(last) < interval:
+            return float(last) + interval - now
+        # recorded first, a run that crashes the worker is not retried at once
+        await redis_client.zadd(LAST_RUN_KEY, {name: now})
+        self.runs[name] += 1
+        await job()
+        return interval
+
+
+scheduler = Scheduler(
+    lease_ttl=settings.SCHEDULER_LEASE_TTL,
+    backoff=settings.SCHEDULER_RESTART_BACKOFF,
+    max_backoff=settings.SCHEDULER_MAX_BACKOFF,
+    shutdown_timeout=settings.SCHEDULER_SHUTDOWN_TIMEOUT,
+)
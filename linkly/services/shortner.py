@@ -2,21 +2,71 @@
 This module contains the service level logic for the api.
 """
 
-from datetime import datetime, timezone
+import asyncio
+import time
+from datetime import datetime
 
-import httpx
-import redis.asyncio as redis
 from fastapi import Depends, HTTPException, Request, status
-from fastapi_cache.decorator import cache
 from motor.motor_asyncio import AsyncIOMotorDatabase
+from pymongo.errors import BulkWriteError
 
-from linkly.database import get_db
+from linkly.database import get_db, get_db_instance, redis_client
+from linkly.services.analytics import (
+    analytics_page_pipeline,
+    analytics_totals_pipeline,
+    capture_click,
+    decode_cursor,
+    encode_cursor,
+    record_clicks,
+)
+from linkly.services.expiry import schedule_expiries
+from linkly.services.redirect_cache import NOT_FOUND, redirect_cache
+from linkly.services.visitors import unique_visitors
 from linkly.settings import settings
 from linkly.utils.dtype import PyObjectId
-from linkly.utils.encode_url import ShortIdGenerator
+from linkly.utils.encode_url import ShortIdAllocator, mongo_lease, redis_lease
+from linkly.utils.singleflight import SingleFlight
+
+short_ids = ShortIdAllocator(
+    lease=(
+        redis_lease(redis_client)
+        if settings.SHORT_ID_COUNTER == "redis"
+        else mongo_lease(get_db_instance)
+    ),
+    length=settings.SHORT_ID_LENGTH,
+    block_size=settings.SHORT_ID_BLOCK_SIZE,
+    secret=settings.SHORT_ID_SECRET,
+)
+
+# coalesces concurrent cache miss lookups of the same short url
+url_lookups = SingleFlight(
+    redis_client, prefix="redirect-lookup", lock_ttl=settings.REDIRECT_LOCK_TTL
+)
+# background refresh tasks of stale redirects, referenced until they finish
+_refreshing: set[asyncio.Task] = set()
+
+
+def url_document(
+    original_url: str,
+    short_id: str,
+    user_id: PyObjectId | str | None = None,
+    expiry: int | None = None,
+) -> dict:
+    url_doc = {
+        "original_url": original_url,
+        "short_id": short_id,
+        "short_url": settings.LOCAL_HOST + f"/{short_id}",
+        "user_id": PyObjectId(user_id),
+        "created_at": int(time.time()),
+        "expiry": expiry,
+    }
+
+    if user_id:
+        if isinstance(user_id, str):
+            user_id = PyObjectId(user_id)
+        url_doc["user_id"] = user_id  # only add if available
+    return url_doc
 
-redis_url = settings.redis_url.replace("redis://", "rediss://")
-redis_client = redis.from_url(redis_url)
 
 async def shorten_url(
     original_url: str,
@@ -25,109 +75,157 @@ async def shorten_url(
     expiry: int | None = None,
 ) -> str:
     try:
-        short_id = ShortIdGenerator.generate()[:5]
-        short_url = settings.LOCAL_HOST + f"/{short_id}"
-        created_at = int(datetime.utcnow().timestamp())
-
-        url_doc = {
-            "original_url": original_url,
-            "short_id": short_id,
-            "short_url": short_url,
-            "user_id": PyObjectId(user_id),
-            "created_at": created_at,
-            "expiry": expiry,
-        }
-
-        if user_id:
-            if isinstance(user_id, str):
-                user_id = PyObjectId(user_id)
-            url_doc["user_id"] = user_id  # only add if available
+        short_id = await short_ids.next_id()
+        url_doc = url_document(original_url, short_id, user_id, expiry)
+        short_url = url_doc["short_url"]
 
         await db_cm.urls.insert_one(url_doc)
+        # the id may have been probed before it existed
+        await redirect_cache.invalidate(short_url)
 
         if expiry:
-            await redis_client.set(f"expire:{short_id}", "1", ex=expiry)
+            await schedule_expiries([(short_id, expiry)])
 
         return short_url
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
 
-@cache(expire=180)
-async def resolves_url(short_url: str, db_cm):
+async def shorten_urls(
+    items: list[tuple[str, int | None]],
+    db_cm: AsyncIOMotorDatabase,
+    user_id: PyObjectId | str | None = None,
+) -> list[dict]:
     """
-    Accept the short url and return the original url
+    Batch version of ``shorten_url`` for ``(original_url, expiry)`` pairs.
+    Ids are allocated in one go, the documents written with one unordered
+    ``insert_many`` and every expiry scheduled with one ``ZADD``. Returns
+    one result per item, in order, with ``error`` set for items that failed.
     """
+    if len(items) > settings.SHORTEN_BATCH_LIMIT:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.SHORTEN_BATCH_LIMIT} urls per batch",
+        )
+    if not items:
+        return []
+
     try:
-        url_doc = await db_cm.urls.find_one({"short_url": short_url})
-        if not url_doc:
-            raise HTTPException(
-                status_code=status.HTTP_400_BAD_REQUEST,
-                detail={"error": f"{short_url} doenot exist in system"},
-            )
-        return url_doc["original_url"]
+        ids = await short_ids.allocate(len(items))
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
+    docs = [
+        url_document(original_url, short_id, user_id, expiry)
+        for (original_url, expiry), short_id in zip(items, ids)
+    ]
+    errors: dict[int, str] = {}
+    try:
+        await db_cm.urls.insert_many(docs, ordered=False)
+    except BulkWriteError as e:
+        for error in e.details.get("writeErrors", []):
+            errors[error["index"]] = error.get("errmsg", "write failed")
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-# TODO: somethiing is off need to rewrite whole anaytics logic
-async def url_analytics(short_url: str, request: Request, db_cm):
-    header = request.headers.get("user-agent", "unknown")
-    user_ip = request.client.host
-    if user_ip == "127.0.0.1":
-        user_ip = "8.8.8.8"
-
-    fingerprint = f"{user_ip}{header}".lower().strip()
+    created = [doc for i, doc in enumerate(docs) if i not in errors]
+    await redirect_cache.invalidate_many([doc["short_url"] for doc in created])
 
-    location = None
     try:
-        async with httpx.AsyncClient() as client:
-            r = await client.get(settings.IP_DETAILS_URL + f"/{user_ip}")
-            if r.status_code == 200:
-                data = r.json()
-                city = data.get("city", "")
-                country = data.get("country", "")
-                location = ", ".join(filter(None, [city, country])) or None
-    except Exception:
-        location = None
-
-    utm_source = request.query_params.get("utm_source")
-    utm_medium = request.query_params.get("utm_medium")
-    utm_campaign = request.query_params.get("utm_campaign")
-
-    click_info = {
-        "user_agent": header,
-        "ip": user_ip,
-        "timestamp": datetime.now(timezone.utc),
-        "location": location,
-        "utm_source": utm_source,
-        "utm_medium": utm_medium,
-        "utm_campaign": utm_campaign,
-    }
+        await schedule_expiries([(doc["short_id"], doc["expiry"]) for doc in created])
+    except Exception as e:
+        # the links exist, only their expiry is missing
+        print(f"[!] Scheduling expiry for {len(created)} urls failed: {e}")
+
+    return [
+        {
+            "original_url": doc["original_url"],
+            "short_url": None if i in errors else doc["short_url"],
+            "expiry": doc["expiry"],
+            "error": errors.get(i),
+        }
+        for i, doc in enumerate(docs)
+    ]
+
 
-    doc = await db_cm.url_analytics.find_one({"short_id": short_url})
+async def load_url(short_url: str, db_cm) -> str:
+    """
+    Cache miss path: the shared redis tier, then mongo. Returns the original
+    url or ``NOT_FOUND`` and leaves the result in both cache tiers.
+    """
+    original_url = await redirect_cache.get_shared(short_url)
+    if original_url is not None:
+        return original_url
 
-    if not doc:
-        await db_cm.url_analytics.insert_one(
-            {
-                "short_id": short_url,
-                "clicks": 1,
-                "finger_print": [fingerprint],
-                "click_details": [click_info],
-            }
+    try:
+        url_doc = await db_cm.urls.find_one(
+            {"short_url": short_url},
+            {"original_url": 1, "created_at": 1, "expiry": 1},
         )
+    except Exception as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    expires_at = None
+    if url_doc and url_doc.get("expiry"):
+        expires_at = url_doc["created_at"] + url_doc["expiry"]
+    if url_doc is None or (expires_at is not None and expires_at <= time.time()):
+        # expired links may linger until the next expiry sweep
+        original_url, expires_at = NOT_FOUND, None
     else:
-        if fingerprint not in (doc.get("finger_print") or []):
-            await db_cm.url_analytics.update_one(
-                {"short_id": short_url},
-                {
-                    "$inc": {"clicks": 1},
-                    "$addToSet": {"finger_print": fingerprint},
-                    "$push": {"click_details": click_info},
-                },
-            )
-        else:
-            pass
+        original_url = url_doc["original_url"]
+    await redirect_cache.set(short_url, original_url, expires_at)
+    return original_url
+
+
+async def fetch_url(short_url: str, db_cm) -> str:
+    """
+    ``load_url`` with at most one lookup per short url in flight, across
+    coroutines of this worker and (through a redis lock) across workers.
+    """
+    return await url_lookups.do(
+        short_url,
+        lambda: load_url(short_url, db_cm),
+        peek=lambda: redirect_cache.get_shared(short_url),
+    )
+
+
+def revalidate_url(short_url: str, db_cm) -> None:
+    """
+    Refresh a stale cache entry in the background.
+    """
+    if url_lookups.in_flight(short_url):
+        return
+    task = asyncio.create_task(fetch_url(short_url, db_cm))
+    _refreshing.add(task)
+    task.add_done_callback(_refreshing.discard)
+
+
+async def resolves_url(short_url: str, db_cm):
+    """
+    Accept the short url and return the original url.
+    Lookups go through the redirect cache (local LRU, then redis) before mongo.
+    Links past their expiry resolve like unknown ones.
+    """
+    original_url, stale = redirect_cache.lookup(short_url)
+    if original_url is None:
+        original_url = await fetch_url(short_url, db_cm)
+    elif stale:
+        revalidate_url(short_url, db_cm)
+
+    if original_url == NOT_FOUND:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail={"error": f"{short_url} doenot exist in system"},
+        )
+    return original_url
+
+
+async def url_analytics(short_url: str, request: Request, db_cm):
+    """
+    Record a single click. The redirect route batches clicks through
+    ``linkly.services.clicks.click_queue`` instead; this is the unbatched path.
+    """
+    await record_clicks([capture_click(short_url, request)], db_cm)
 
 
 async def get_url_analytics(
@@ -136,33 +234,118 @@ async def get_url_analytics(
     utm_source: str | None = None,
     utm_medium: str | None = None,
     utm_campaign: str | None = None,
+    start: datetime | None = None,
+    end: datetime | None = None,
+    cursor: str | None = None,
+    limit: int = 100,
 ):
-    analytics_doc = await db_cm.url_analytics.find_one({"short_id": short_url})
+    """
+    One page of clicks. Filtering and pagination run inside mongo; pass the
+    returned ``next_cursor`` back to get the next page. Link level counters
+    only come with the first page, which also runs one ``$group`` over the
+    link's buckets; later pages have them ``None`` and only read their clicks.
+    """
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor"
+        )
+
+    totals = {"clicks": None, "buckets": None, "unique_visitors": None}
+    if after is None:
+        totals = await analytics_totals(
+            short_url, db_cm, utm_source, utm_medium, utm_campaign, start, end
+        )
 
-    if not analytics_doc:
+    pipeline = analytics_page_pipeline(
+        short_url,
+        limit,
+        utm_source=utm_source,
+        utm_medium=utm_medium,
+        utm_campaign=utm_campaign,
+        start=start,
+        end=end,
+        after=after,
+    )
+    rows = await db_cm.url_analytics_buckets.aggregate(pipeline).to_list(None)
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        last = rows[-1]
+        next_cursor = encode_cursor(last["bucket"], last["_id"], last["i"])
+
+    click_details = []
+    for row in rows:
+        entry = row["click"]
+        entry["timestamp"] = entry["timestamp"].isoformat()
+        click_details.append(entry)
+
+    return {
+        "short_id": short_url,
+        "clicks": totals["clicks"],
+        "click_details": click_details,
+        "next_cursor": next_cursor,
+        "buckets": totals["buckets"],
+        "unique_visitors": totals["unique_visitors"],
+    }
+
+
+async def analytics_totals(
+    short_url: str,
+    db_cm,
+    utm_source: str | None,
+    utm_medium: str | None,
+    utm_campaign: str | None,
+    start: datetime | None,
+    end: datetime | None,
+) -> dict:
+    """
+    Link level counters for the first page, summed per bucket period inside
+    mongo.
+    """
+    pipeline = analytics_totals_pipeline(
+        short_url, utm_source, utm_medium, utm_campaign, start, end
+    )
+    periods = await db_cm.url_analytics_buckets.aggregate(pipeline).to_list(None)
+
+    if not periods and not await db_cm.url_analytics_buckets.find_one(
+        {"short_id": short_url}, {"_id": 1}
+    ):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail="Analytics data not found for this short URL",
         )
 
-    filtered_clicks = []
-    for entry in analytics_doc.get("click_details", []):
-        if utm_source and entry.get("utm_source") != utm_source:
-            continue
-        if utm_medium and entry.get("utm_medium") != utm_medium:
-            continue
-        if utm_campaign and entry.get("utm_campaign") != utm_campaign:
-            continue
-        filtered_clicks.append(entry)
-
-    analytics_doc["_id"] = str(analytics_doc["_id"])
-    for entry in filtered_clicks:
-        entry["timestamp"] = entry["timestamp"].isoformat()
+    return {
+        # clicks matching every filter, like click_details
+        "clicks": sum(period["matched"] for period in periods),
+        # all clicks per bucket in the date range, whatever the utm filters
+        "buckets": [
+            {"bucket": period["_id"].isoformat(), "clicks": period["clicks"]}
+            for period in periods
+        ],
+        # approximate (HyperLogLog), not affected by the utm filters
+        "unique_visitors": {
+            "all_time": await unique_visitors(short_url),
+            "last_30_days": await unique_visitors(short_url, days=30),
+        },
+    }
 
-    analytics_doc["click_details"] = filtered_clicks
-    analytics_doc["clicks"] = len(filtered_clicks)
 
-    return analytics_doc
+async def ensure_owner(short_url: str, user_id, db_cm) -> None:
+    """
+    404 unless ``short_url`` belongs to ``user_id``, so other users' links
+    look the same as missing ones.
+    """
+    owned = await db_cm.urls.find_one(
+        {"short_url": short_url, "user_id": user_id}, {"_id": 1}
+    )
+    if owned is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND, detail="Url not found"
+        )
 
 
 async def delete_url(short_url: str, db_cm):
@@ -177,4 +360,5 @@ async def delete_url(short_url: str, db_cm):
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Something went wrong",
         )
+    await redirect_cache.invalidate(short_url)
     return {"message": "Url data successfully erased"}
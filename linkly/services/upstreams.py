@@ -0,0 +1,277 @@
+"""
+Outbound HTTP calls to third party services ("upstreams").
+
+Every integration registers an ``Upstream`` once at import time and makes its
+calls through it instead of opening its own ``httpx.AsyncClient``. Each
+upstream has:
+
+* its own connection pool, created on first use and kept alive between
+  calls, with explicit connect / read timeouts;
+* at most ``HTTP_MAX_CONCURRENCY`` requests in flight; a caller that cannot
+  get a slot within the pool timeout fails fast with ``UpstreamBusy``;
+* retries with exponential backoff and full jitter for idempotent requests
+  that failed on the network or with a 502/503/504;
+* a circuit breaker: after ``HTTP_BREAKER_FAILURES`` consecutive failures
+  calls fail with ``CircuitOpen`` for ``HTTP_BREAKER_RESET`` seconds, then a
+  single trial call decides whether it closes again;
+* request counters and latency percentiles, see ``stats``.
+
+The pools are closed by the app lifespan through ``upstreams.aclose()``.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+
+import httpx
+
+from linkly.settings import settings
+from linkly.utils.metrics import registry
+
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+RETRY_STATUSES = {502, 503, 504}
+
+UPSTREAM_SECONDS = registry.histogram(
+    "linkly_upstream_request_duration_seconds",
+    "Outbound http attempts by upstream, retries counted separately",
+    labels=("upstream",),
+)
+
+
+class UpstreamError(Exception):
+    pass
+
+
+class CircuitOpen(UpstreamError):
+    pass
+
+
+class UpstreamBusy(UpstreamError):
+    pass
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int, reset_timeout: float):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: float | None = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return "open"
+        return "half-open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial:
+            # let exactly one call find out whether the upstream is back
+            self.trial = True
+            return True
+        return False
+
+    def success(self) -> None:
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self) -> None:
+        self.failures += 1
+        if self.trial or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self.trial = False
+
+
+class Upstream:
+    def __init__(
+        self,
+        name: str,
+        base_url: str = "",
+        connect_timeout: float = 2.0,
+        read_timeout: float = 5.0,
+        pool_timeout: float = 1.0,
+        max_concurrency: int = 20,
+        keepalive_expiry: float = 30.0,
+        retries: int = 2,
+        backoff: float = 0.1,
+        breaker: CircuitBreaker | None = None,
+        transport: httpx.AsyncBaseTransport | None = None,
+    ):
+        self.name = name
+        self.base_url = base_url
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=read_timeout,
+            pool=pool_timeout,
+        )
+        self.limits = httpx.Limits(
+            max_connections=max_concurrency,
+            max_keepalive_connections=max_concurrency,
+            keepalive_expiry=keepalive_expiry,
+        )
+        self.pool_timeout = pool_timeout
+        self.max_concurrency = max_concurrency
+        self.retries = retries
+        self.backoff = backoff
+        self.breaker = breaker or CircuitBreaker(5, 30.0)
+        self._transport = transport
+        self._client: httpx.AsyncClient | None = None
+        self._slots: asyncio.Semaphore | None = None
+
+        self.requests = 0
+        self.failures = 0
+        self.retried = 0
+        self.rejected = 0
+        self.in_flight = 0
+        self.latencies: deque[float] = deque(maxlen=1000)
+
+    def client(self) -> httpx.AsyncClient:
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                base_url=self.base_url,
+                timeout=self.timeout,
+                limits=self.limits,
+                transport=self._transport,
+            )
+        return self._client
+
+    async def request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """
+        ``httpx.AsyncClient.request`` through the pool, the concurrency limit,
+        retries and the circuit breaker. Responses with an error status are
+        returned, not raised; only 502/503/504 count as upstream failures.
+        """
+        if not self.breaker.allow():
+            self.rejected += 1
+            raise CircuitOpen(f"{self.name} is unavailable, circuit open")
+
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_concurrency)
+        try:
+            await asyncio.wait_for(self._slots.acquire(), self.pool_timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            # a trial call that never ran says nothing about the upstream
+            self.breaker.trial = False
+            raise UpstreamBusy(f"Too many requests to {self.name} in flight")
+
+        self.in_flight += 1
+        try:
+            response = await self._send(method, url, **kwargs)
+        except Exception:
+            self.failures += 1
+            self.breaker.failure()
+            raise
+        finally:
+            self.in_flight -= 1
+            self._slots.release()
+
+        if response.status_code in RETRY_STATUSES:
+            self.failures += 1
+            self.breaker.failure()
+        else:
+            self.breaker.success()
+        return response
+
+    async def _send(self, method: str, url: str, **kwargs) -> httpx.Response:
+        attempts = 1 + (self.retries if method.upper() in IDEMPOTENT_METHODS else 0)
+        for attempt in range(attempts):
+            if attempt:
+                self.retried += 1
+                # full jitter: anywhere between 0 and the exponential step
+                await asyncio.sleep(random.uniform(0, self.backoff * 2**attempt))
+
+            self.requests += 1
+            start = time.perf_counter()
+            try:
+                response = await self.client().request(method, url, **kwargs)
+            except httpx.TransportError:
+                if attempt == attempts - 1:
+                    raise
+                continue
+            finally:
+                elapsed = time.perf_counter() - start
+                self.latencies.append(elapsed)
+                UPSTREAM_SECONDS.observe(elapsed, self.name)
+
+            if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                return response
+            await response.aclose()
+
+    async def get(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("GET", url, **kwargs)
+
+    async def post(self, url: str, **kwargs) -> httpx.Response:
+        return await self.request("POST", url, **kwargs)
+
+    def stats(self) -> dict:
+        latencies = sorted(self.latencies)
+
+        def percentile(p: float) -> float | None:
+            if not latencies:
+                return None
+            index = min(len(latencies) - 1, int(p * len(latencies)))
+            return round(latencies[index] * 1000, 2)
+
+        return {
+            "requests": self.requests,
+            "failures": self.failures,
+            "retried": self.retried,
+            "rejected": self.rejected,
+            "in_flight": self.in_flight,
+            "circuit": self.breaker.state,
+            "latency_ms": {
+                "p50": percentile(0.5),
+                "p95": percentile(0.95),
+                "p99": percentile(0.99),
+                "max": percentile(1.0),
+            },
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+
+class Upstreams:
+    def __init__(self):
+        self._upstreams: dict[str, Upstream] = {}
+
+    def register(self, name: str, base_url: str = "", **options) -> Upstream:
+        """
+        Create the upstream ``name`` with the ``HTTP_*`` settings as defaults.
+        """
+        options.setdefault("connect_timeout", settings.HTTP_CONNECT_TIMEOUT)
+        options.setdefault("read_timeout", settings.HTTP_READ_TIMEOUT)
+        options.setdefault("pool_timeout", settings.HTTP_POOL_TIMEOUT)
+        options.setdefault("max_concurrency", settings.HTTP_MAX_CONCURRENCY)
+        options.setdefault("retries", settings.HTTP_RETRIES)
+        options.setdefault(
+            "breaker",
+            CircuitBreaker(settings.HTTP_BREAKER_FAILURES, settings.HTTP_BREAKER_RESET),
+        )
+        upstream = Upstream(name, base_url, **options)
+        self._upstreams[name] = upstream
+        return upstream
+
+    def get(self, name: str) -> Upstream:
+        return self._upstreams[name]
+
+    def stats(self) -> dict:
+        return {name: up.stats() for name, up in self._upstreams.items()}
+
+    async def aclose(self) -> None:
+        for upstream in self._upstreams.values():
+            await upstream.aclose()
+
+
+upstreams = Upstreams()
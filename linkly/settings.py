@@ -12,12 +12,65 @@ class Settings:
     LOCAL_HOST = os.getenv("LOCAL_HOST")
     BASE62 = os.getenv("BASE62")
 
+    # Short id allocation, see linkly/utils/encode_url.py
+    SHORT_ID_LENGTH = int(os.getenv("SHORT_ID_LENGTH", 6))
+    SHORT_ID_BLOCK_SIZE = int(os.getenv("SHORT_ID_BLOCK_SIZE", 1000))
+    SHORT_ID_COUNTER = os.getenv("SHORT_ID_COUNTER", "mongo")
+    # keyed permutation of ids; never change it once links exist
+    SHORT_ID_SECRET = os.getenv("SHORT_ID_SECRET")
+    # Link expiry sweeper, see linkly/services/expiry.py
+    EXPIRY_SWEEP_INTERVAL = float(os.getenv("EXPIRY_SWEEP_INTERVAL", 5))
+    EXPIRY_SWEEP_BATCH = int(os.getenv("EXPIRY_SWEEP_BATCH", 1000))
+    # Background job scheduler, see linkly/services/scheduler.py
+    SCHEDULER_LEASE_TTL = int(os.getenv("SCHEDULER_LEASE_TTL", 15))
+    SCHEDULER_RESTART_BACKOFF = float(os.getenv("SCHEDULER_RESTART_BACKOFF", 1.0))
+    SCHEDULER_MAX_BACKOFF = float(os.getenv("SCHEDULER_MAX_BACKOFF", 60))
+    SCHEDULER_SHUTDOWN_TIMEOUT = float(os.getenv("SCHEDULER_SHUTDOWN_TIMEOUT", 10))
+
+    # most urls accepted by one POST /shorten/batch
+    SHORTEN_BATCH_LIMIT = int(os.getenv("SHORTEN_BATCH_LIMIT", 10000))
+
     IP_DETAILS_URL = os.getenv("IP_DETAILS_URL")
-    QR_CODE_API = os.getenv("QR_CODE_API")
+    # offline geoip database, see linkly/commands/build_geoip.py
+    GEOIP_DB_PATH = os.getenv("GEOIP_DB_PATH")
+    GEOIP_CACHE_SIZE = int(os.getenv("GEOIP_CACHE_SIZE", 4096))
+    GEOIP_HTTP_FALLBACK = os.getenv("GEOIP_HTTP_FALLBACK", "true").lower() == "true"
+    # outbound http calls, see linkly/services/upstreams.py
+    HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", 2))
+    HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", 5))
+    HTTP_POOL_TIMEOUT = float(os.getenv("HTTP_POOL_TIMEOUT", 1))
+    HTTP_MAX_CONCURRENCY = int(os.getenv("HTTP_MAX_CONCURRENCY", 20))
+    HTTP_RETRIES = int(os.getenv("HTTP_RETRIES", 2))
+    HTTP_BREAKER_FAILURES = int(os.getenv("HTTP_BREAKER_FAILURES", 5))
+    HTTP_BREAKER_RESET = float(os.getenv("HTTP_BREAKER_RESET", 30))
+    # /metrics: "local" (this worker) or "redis" (every worker), see linkly/services/metrics.py
+    METRICS_MODE = os.getenv("METRICS_MODE", "local")
+    METRICS_PUSH_INTERVAL = float(os.getenv("METRICS_PUSH_INTERVAL", 10))
+    # request profiling, see linkly/services/profiling.py
+    PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", 0))
+    PROFILE_SECRET = os.getenv("PROFILE_SECRET")
+    PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+    PROFILE_FORMAT = os.getenv("PROFILE_FORMAT", "speedscope")
+    PROFILE_KEEP = int(os.getenv("PROFILE_KEEP", 200))
+    PROFILE_INTERVAL = float(os.getenv("PROFILE_INTERVAL", 0.005))
+    PROFILE_REFRESH_INTERVAL = float(os.getenv("PROFILE_REFRESH_INTERVAL", 5))
+    # rendered QR codes, see linkly/services/qr.py
+    QR_CACHE_SIZE = int(os.getenv("QR_CACHE_SIZE", 1024))
+    QR_CACHE_TTL = int(os.getenv("QR_CACHE_TTL", 7 * 86400))
+    QR_MAX_AGE = int(os.getenv("QR_MAX_AGE", 86400))
+    QR_RENDER_WORKERS = int(os.getenv("QR_RENDER_WORKERS", 1))
 
     secret = os.getenv("SECRET_KEY")
     algorithm = os.getenv("ALGORITHM")
     acess_token_expiry = os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES")
+    # bcrypt cost and the process pool it runs in, see linkly/services/passwords.py
+    BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", 12))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", 2))
+    PASSWORD_MAX_PENDING = int(os.getenv("PASSWORD_MAX_PENDING", 32))
+    PASSWORD_ADMIT_TIMEOUT = float(os.getenv("PASSWORD_ADMIT_TIMEOUT", 2))
+    # authenticated principal cache, see linkly/authentication/jwt/principal.py
+    PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", 10000))
+    PRINCIPAL_CACHE_TTL = int(os.getenv("PRINCIPAL_CACHE_TTL", 60))
 
     SESSION_SECRET = os.getenv("SESSION_SECRET")
 
@@ -27,5 +80,59 @@ class Settings:
     GITHUB_CLIENT_SECRET = os.getenv("GITHUB_CLIENT_SECRET")
 
     redis_url = os.getenv("REDIS_URL", "redis://localhost")
-    
+
+    # Redirect cache: in-process LRU in front of the shared Redis cache
+    REDIRECT_CACHE_SIZE = int(os.getenv("REDIRECT_CACHE_SIZE", 10000))
+    REDIRECT_CACHE_TTL = int(os.getenv("REDIRECT_CACHE_TTL", 60))
+    REDIRECT_CACHE_REDIS_TTL = int(os.getenv("REDIRECT_CACHE_REDIS_TTL", 180))
+    REDIRECT_NOT_FOUND_TTL = int(os.getenv("REDIRECT_NOT_FOUND_TTL", 30))
+    # ceiling for hot links, 0 caches links without expiry until deleted
+    REDIRECT_CACHE_MAX_TTL = int(os.getenv("REDIRECT_CACHE_MAX_TTL", 86400))
+    REDIRECT_HOT_HITS = int(os.getenv("REDIRECT_HOT_HITS", 100))
+    # serve-stale window while refreshing, and the cross-worker lookup lock
+    REDIRECT_STALE_TTL = int(os.getenv("REDIRECT_STALE_TTL", 30))
+    REDIRECT_LOCK_TTL = float(os.getenv("REDIRECT_LOCK_TTL", 2))
+
+    # Bucketed analytics storage: "hour" or "day" buckets, clicks per document
+    ANALYTICS_BUCKET_SIZE = os.getenv("ANALYTICS_BUCKET_SIZE", "hour")
+    ANALYTICS_BUCKET_CAP = int(os.getenv("ANALYTICS_BUCKET_CAP", 1000))
+
+    # Documents fetched per cursor batch when streaming analytics exports
+    EXPORT_BATCH_SIZE = int(os.getenv("EXPORT_BATCH_SIZE", 1000))
+
+    # Click dedup window and retention of the per-day visitor HyperLogLogs
+    CLICK_DEDUP_TTL = int(os.getenv("CLICK_DEDUP_TTL", 1800))
+    VISITOR_WINDOW_RETENTION_DAYS = int(os.getenv("VISITOR_WINDOW_RETENTION_DAYS", 90))
+
+    # answer GET /{short_id} ahead of the middleware stack, see linkly/services/fastpath.py
+    REDIRECT_FAST_PATH = os.getenv("REDIRECT_FAST_PATH", "true").lower() == "true"
+
+    # Click ingestion queue
+    CLICK_QUEUE_SIZE = int(os.getenv("CLICK_QUEUE_SIZE", 10000))
+    CLICK_BATCH_SIZE = int(os.getenv("CLICK_BATCH_SIZE", 500))
+    CLICK_FLUSH_INTERVAL = float(os.getenv("CLICK_FLUSH_INTERVAL", 1.0))
+    CLICK_ENQUEUE_TIMEOUT = float(os.getenv("CLICK_ENQUEUE_TIMEOUT", 0.05))
+
+    # "inline" records clicks in the web process, "stream" hands them to
+    # linkly-analytics-worker through a redis stream (only with workers running),
+    # see linkly/services/click_stream.py
+    CLICK_INGEST = os.getenv("CLICK_INGEST", "inline")
+    CLICK_STREAM_KEY = os.getenv("CLICK_STREAM_KEY", "clicks:stream")
+    CLICK_STREAM_GROUP = os.getenv("CLICK_STREAM_GROUP", "analytics")
+    CLICK_STREAM_CONSUMER = os.getenv("CLICK_STREAM_CONSUMER")
+    CLICK_STREAM_MAXLEN = int(os.getenv("CLICK_STREAM_MAXLEN", 1_000_000))
+    CLICK_STREAM_BATCH = int(os.getenv("CLICK_STREAM_BATCH", 500))
+    CLICK_STREAM_BLOCK = float(os.getenv("CLICK_STREAM_BLOCK", 1.0))
+    CLICK_STREAM_CLAIM_IDLE = float(os.getenv("CLICK_STREAM_CLAIM_IDLE", 60))
+    CLICK_STREAM_MAX_DELIVERIES = int(os.getenv("CLICK_STREAM_MAX_DELIVERIES", 5))
+
+    # Rollup counters kept in redis and flushed to mongo, see linkly/services/counters.py
+    ROLLUP_WRITE_BEHIND = os.getenv("ROLLUP_WRITE_BEHIND", "true").lower() == "true"
+    ROLLUP_FLUSH_INTERVAL = float(os.getenv("ROLLUP_FLUSH_INTERVAL", 5))
+    ROLLUP_FLUSH_BATCH = int(os.getenv("ROLLUP_FLUSH_BATCH", 500))
+    ROLLUP_RECOVER_AFTER = float(os.getenv("ROLLUP_RECOVER_AFTER", 60))
+    # processes flushing rollups (web + analytics workers); sizes the retry guard
+    ROLLUP_FLUSHERS = int(os.getenv("ROLLUP_FLUSHERS", 8))
+
+
 settings = Settings()
@@ -0,0 +1,221 @@
+"""
+Shared fixtures - an in-memory stand-in for the redis commands we use
+"""
+
+import time
+
+import pytest
+from redis.exceptions import ResponseError
+
+
+class FakePipeline:
+    def __init__(self, redis):
+        self.redis = redis
+        self.commands = []
+
+    def __getattr__(self, name):
+        def queue(*args, **kwargs):
+            self.commands.append((name, args, kwargs))
+            return self
+
+        return queue
+
+    async def execute(self, raise_on_error=True):
+        results = []
+        for name, args, kwargs in self.commands:
+            try:
+                results.append(await getattr(self.redis, name)(*args, **kwargs))
+            except Exception as e:
+                if raise_on_error:
+                    raise
+                results.append(e)
+        self.commands = []
+        return results
+
+
+class FakeRedis:
+    def __init__(self):
+        self.data = {}
+        self.ttl = {}
+        self.published = []
+        self.groups = {}
+
+    def pipeline(self, transaction=True):
+        return FakePipeline(self)
+
+    async def get(self, key):
+        return self.data.get(key)
+
+    async def set(self, key, value, nx=False, ex=None, px=None):
+        if nx and key in self.data:
+            return None
+        self.data[key] = value
+        if ex is not None or px is not None:
+            self.ttl[key] = ex if ex is not None else px / 1000
+        return True
+
+    async def delete(self, *keys):
+        return sum(self.data.pop(key, None) is not None for key in keys)
+
+    async def expire(self, key, seconds):
+        self.ttl[key] = seconds
+        return key in self.data
+
+    async def eval(self, script, numkeys, key, token, *args):
+        # only the owner-checked scripts of linkly.services.scheduler.Lease
+        if self.data.get(key) != token:
+            return 0
+        if 'redis.call("expire"' in script:
+            return int(await self.expire(key, *args))
+        return await self.delete(key)
+
+    async def publish(self, channel, message):
+        self.published.append((channel, message))
+        return 0
+
+    async def zadd(self, key, mapping, nx=False):
+        members = self.data.setdefault(key, {})
+        added = 0
+        for member, score in mapping.items():
+            if nx and member in members:
+                continue
+            added += member not in members
+            members[member] = score
+        return added
+
+    async def zscore(self, key, member):
+        return self.data.get(key, {}).get(member)
+
+    async def zrangebyscore(self, key, min, max, start=None, num=None):
+        low = float(min)
+        members = sorted(
+            (score, member)
+            for member, score in self.data.get(key, {}).items()
+            if low <= score <= float(max)
+        )
+        found = [member for _, member in members]
+        if start is not None:
+            found = found[start : start + num]
+        return found
+
+    async def zrem(self, key, *members):
+        stored = self.data.get(key, {})
+        return sum(stored.pop(member, None) is not None for member in members)
+
+    async def hincrby(self, key, field, amount=1):
+        fields = self.data.setdefault(key, {})
+        fields[field] = fields.get(field, 0) + amount
+        return fields[field]
+
+    async def hgetall(self, key):
+        return dict(self.data.get(key, {}))
+
+    async def sadd(self, key, *members):
+        stored = self.data.setdefault(key, set())
+        before = len(stored)
+        stored.update(members)
+        return len(stored) - before
+
+    async def srem(self, key, *members):
+        stored = self.data.get(key, set())
+        removed = len(stored & set(members))
+        stored.difference_update(members)
+        return removed
+
+    async def smembers(self, key):
+        return set(self.data.get(key, set()))
+
+    async def srandmember(self, key, number):
+        return list(self.data.get(key, set()))[:number]
+
+    async def rename(self, key, new):
+        if key not in self.data:
+            raise ValueError("no such key")
+        self.data[new] = self.data.pop(key)
+        return True
+
+    async def xadd(self, key, fields, maxlen=None, approximate=True):
+        entries = self.data.setdefault(key, [])
+        entry_id = f"{len(entries) + 1}-0"
+        entries.append((entry_id, dict(fields)))
+        return entry_id
+
+    async def xgroup_create(self, key, group, id="$", mkstream=False):
+        if (key, group) in self.groups:
+            raise ResponseError("BUSYGROUP Consumer Group name already exists")
+        self.data.setdefault(key, [])
+        self.groups[(key, group)] = {"delivered": 0, "pending": {}}
+        return True
+
+    async def xreadgroup(self, group, consumer, streams, count=None, block=None):
+        response = []
+        for key in streams:
+            state = self.groups[(key, group)]
+            entries = self.data[key][state["delivered"] :][:count]
+            state["delivered"] += len(entries)
+            for entry_id, _ in entries:
+                state["pending"][entry_id] = [consumer, time.monotonic(), 1]
+            if entries:
+                response.append([key, entries])
+        return response
+
+    async def xack(self, key, group, *ids):
+        pending = self.groups[(key, group)]["pending"]
+        return sum(pending.pop(entry_id, None) is not None for entry_id in ids)
+
+    async def xpending_range(
+        self, key, group, min, max, count, consumername=None, idle=None
+    ):
+        now = time.monotonic()
+        pending = self.groups[(key, group)]["pending"]
+        found = [
+            {
+                "message_id": entry_id,
+                "consumer": consumer,
+                "time_since_delivered": int((now - since) * 1000),
+                "times_delivered": delivered,
+            }
+            for entry_id, (consumer, since, delivered) in pending.items()
+            if consumername in (None, consumer)
+            and (idle is None or (now - since) * 1000 >= idle)
+        ]
+        return found[:count]
+
+    async def xclaim(self, key, group, consumer, min_idle_time, message_ids):
+        pending = self.groups[(key, group)]["pending"]
+        fields = dict(self.data[key])
+        claimed = []
+        for entry_id in message_ids:
+            if entry_id in pending:
+                pending[entry_id] = [
+                    consumer,
+                    time.monotonic(),
+                    pending[entry_id][2] + 1,
+                ]
+                # entries trimmed by MAXLEN come back without fields
+                claimed.append((entry_id, fields.get(entry_id)))
+        return claimed
+
+    async def xgroup_delconsumer(self, key, group, consumer):
+        return 0
+
+    async def pfadd(self, key, *values):
+        members = self.data.setdefault(key, set())
+        before = len(members)
+        members.update(values)
+        return int(len(members) != before)
+
+    async def pfcount(self, *keys):
+        return len(set().union(*(self.data.get(key, set()) for key in keys)))
+
+
+@pytest.fixture
+def fake_redis(monkeypatch):
+    redis = FakeRedis()
+    monkeypatch.setattr("linkly.services.visitors.redis_client", redis)
+    monkeypatch.setattr("linkly.services.expiry.redis_client", redis)
+    monkeypatch.setattr("linkly.services.counters.redis_client", redis)
+    monkeypatch.setattr("linkly.services.click_stream.redis_client", redis)
+    monkeypatch.setattr("linkly.services.scheduler.redis_client", redis)
+    monkeypatch.setattr("linkly.authentication.jwt.principal.redis_client", redis)
+    return redis
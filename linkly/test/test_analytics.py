@@ -0,0 +1,303 @@
+"""
+Bucketed analytics storage tests
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from linkly.commands.migrate_analytics import legacy_rollups
+from linkly.services.analytics import (
+    analytics_page_pipeline,
+    bucket_operations,
+    decode_cursor,
+    encode_cursor,
+    legacy_operations,
+    record_clicks,
+)
+from linkly.services.rollups import rollup_operations, rollup_summary
+from linkly.services.visitors import dedup_key, unique_visitors
+
+# ==================== FIXTURES ====================
+
+
+def make_click(hour: int, minute: int = 0) -> dict:
+    return {
+        "user_agent": "pytest-agent",
+        "ip": "8.8.8.8",
+        "timestamp": datetime(2025, 6, 23, hour, minute, tzinfo=timezone.utc),
+        "location": None,
+        "utm_source": None,
+        "utm_medium": None,
+        "utm_campaign": None,
+    }
+
+
+@pytest.fixture
+def mock_db_cm(fake_redis):
+    mock_db = MagicMock()
+    mock_db.url_analytics_buckets.bulk_write = AsyncMock(return_value=None)
+    mock_db.url_rollups.bulk_write = AsyncMock(return_value=None)
+    return mock_db
+
+
+# ==================== BUCKET TESTS ====================
+
+
+def test_bucket_operations_group_per_hour_and_spill():
+    clicks = [("http://localhost:8000/aaaaa", make_click(9, m)) for m in range(3)]
+    clicks.append(("http://localhost:8000/aaaaa", make_click(10)))
+
+    operations = bucket_operations(clicks, cap=2)
+
+    assert [op._doc["$inc"]["count"] for op in operations] == [2, 1, 1]
+    assert operations[0]._filter["bucket"] == datetime(
+        2025, 6, 23, 9, tzinfo=timezone.utc
+    )
+    # a chunk only lands in a bucket document with room for all of it
+    assert operations[0]._filter["count"] == {"$lte": 0}
+    assert operations[1]._filter["count"] == {"$lte": 1}
+    assert all(op._upsert for op in operations)
+
+
+@pytest.mark.asyncio
+async def test_record_clicks_drops_repeat_clicks(mock_db_cm, fake_redis):
+    events = [
+        {"short_id": "http://localhost:8000/aaaaa", "fingerprint": fp, "click": c}
+        for fp, c in (
+            ("fp1", make_click(9)),
+            ("fp2", make_click(9)),
+            ("fp1", make_click(9)),
+        )
+    ]
+    # fp2 clicked a moment ago, inside the dedup window
+    await fake_redis.set(dedup_key("http://localhost:8000/aaaaa", "fp2"), 1)
+
+    with patch(
+        "linkly.services.analytics.lookup_location", AsyncMock(return_value="X")
+    ):
+        counted = await record_clicks(events, mock_db_cm)
+
+    assert counted == 1
+    operation = mock_db_cm.url_analytics_buckets.bulk_write.call_args[0][0][0]
+    assert operation._doc["$push"]["click_details"]["$each"][0]["location"] == "X"
+
+
+@pytest.mark.asyncio
+async def test_unique_visitors_count_every_fingerprint(mock_db_cm, fake_redis):
+    events = [
+        {"short_id": "http://localhost:8000/aaaaa", "fingerprint": fp, "click": c}
+        for fp, c in (("fp1", make_click(9)), ("fp2", make_click(10)))
+    ]
+
+    with patch(
+        "linkly.services.analytics.lookup_location", AsyncMock(return_value=None)
+    ):
+        await record_clicks(events, mock_db_cm)
+        await record_clicks(events, mock_db_cm)
+
+    assert await unique_visitors("http://localhost:8000/aaaaa") == 2
+    daily = [
+        k for k in fake_redis.data if k.startswith("visitors:") and k[-8:].isdigit()
+    ]
+    assert len(daily) == 1
+
+
+# ==================== PAGINATION TESTS ====================
+
+
+def test_cursor_round_trip():
+    doc_id = ObjectId()
+    token = encode_cursor(datetime(2025, 6, 23, 9), doc_id, 41)
+
+    assert decode_cursor(token) == (datetime(2025, 6, 23, 9), doc_id, 41)
+    with pytest.raises(ValueError):
+        decode_cursor("not-a-cursor")
+
+
+def test_page_pipeline_pushes_filters_and_cursor_down():
+    doc_id = ObjectId()
+    after = (datetime(2025, 6, 23, 9), doc_id, 4)
+
+    pipeline = analytics_page_pipeline(
+        "http://localhost:8000/aaaaa", 50, utm_source="google", after=after
+    )
+
+    assert pipeline[0] == {
+        "$match": {
+            "short_id": "http://localhost:8000/aaaaa",
+            "bucket": {"$gte": datetime(2025, 6, 23, 9)},
+        }
+    }
+    project = pipeline[2]["$project"]["click_details"]["$filter"]
+    assert project["cond"] == {"$eq": ["$$click.utm_source", "google"]}
+    assert "$unwind" in pipeline[3]
+    assert pipeline[4]["$match"]["$or"][2] == {
+        "bucket": datetime(2025, 6, 23, 9),
+        "_id": doc_id,
+        "i": {"$gt": 4},
+    }
+    assert pipeline[5] == {"$limit": 51}
+
+
+@pytest.mark.asyncio
+async def test_get_url_analytics_returns_page_and_cursor(mock_db_cm):
+    bucket = datetime(2025, 6, 23, 9)
+    doc_id = ObjectId()
+    rows = [
+        {"_id": doc_id, "bucket": bucket, "i": i, "click": make_click(9, i)}
+        for i in range(3)
+    ]
+    pipelines, pages = [], iter([rows, rows[2:]])
+
+    def aggregate(pipeline):
+        pipelines.append(pipeline)
+        cursor = MagicMock()
+        if any("$group" in stage for stage in pipeline):
+            totals = [{"_id": bucket, "clicks": 3, "matched": 2}]
+            cursor.to_list = AsyncMock(return_value=totals)
+        else:
+            cursor.to_list = AsyncMock(return_value=next(pages))
+        return cursor
+
+    mock_db_cm.url_analytics_buckets.aggregate = MagicMock(side_effect=aggregate)
+
+    from linkly.services.shortner import get_url_analytics
+
+    page = await get_url_analytics(
+        "http://localhost:8000/aaaaa", mock_db_cm, utm_source="google", limit=2
+    )
+
+    # clicks follow the utm filters, the per bucket series does not
+    assert page["clicks"] == 2
+    assert page["buckets"] == [{"bucket": bucket.isoformat(), "clicks": 3}]
+    assert len(page["click_details"]) == 2
+    assert decode_cursor(page["next_cursor"]) == (bucket, doc_id, 1)
+    group = pipelines[0][1]["$group"]
+    assert group["matched"]["$sum"]["$size"]["$filter"]["cond"] == {
+        "$eq": ["$$click.utm_source", "google"]
+    }
+
+    # later pages skip the link level counters
+    pipelines.clear()
+    page = await get_url_analytics(
+        "http://localhost:8000/aaaaa", mock_db_cm, cursor=page["next_cursor"]
+    )
+    assert page["clicks"] is None and page["unique_visitors"] is None
+    assert len(pipelines) == 1
+
+    with pytest.raises(HTTPException):
+        await get_url_analytics("http://localhost:8000/aaaaa", mock_db_cm, cursor="x")
+
+
+# ==================== MIGRATION TESTS ====================
+
+
+def test_legacy_operations_split_document():
+    doc = {
+        "short_id": "http://localhost:8000/aaaaa",
+        "clicks": 3,
+        "finger_print": ["fp1", "fp2", "fp3"],
+        "click_details": [make_click(10), make_click(9, 30), make_click(9)],
+    }
+
+    buckets = legacy_operations(doc)
+
+    assert [b._doc["$set"]["clicks"] for b in buckets] == [2, 1]
+    assert buckets[0]._doc["$set"]["first_click"] == make_click(9)["timestamp"]
+    # a second run rewrites the same documents
+    assert [b._filter for b in legacy_operations(doc)] == [b._filter for b in buckets]
+    assert buckets[0]._filter["_id"] < buckets[1]._filter["_id"]
+
+
+def test_legacy_rollups_apply_once_per_document():
+    doc = {
+        "_id": ObjectId(),
+        "short_id": "http://localhost:8000/aaaaa",
+        "click_details": [make_click(9), make_click(9, 30)],
+    }
+
+    operations = legacy_rollups(doc)
+
+    assert sorted(op._filter["period"] for op in operations) == ["day", "hour"]
+    migration = operations[0]._filter["migrations"]["$ne"]
+    assert migration == f"legacy:{doc['_id']}"
+    assert operations[0]._doc["$addToSet"] == {"migrations": migration}
+    assert operations[0]._doc["$inc"]["clicks"] == 2
+
+
+# ==================== ROLLUP TESTS ====================
+
+
+def test_rollup_operations_fold_clicks_per_period():
+    clicks = [
+        ("http://localhost:8000/aaaaa", {**make_click(9), "utm_source": "google"}),
+        ("http://localhost:8000/aaaaa", {**make_click(9, 5), "utm_source": "a.b"}),
+        ("http://localhost:8000/aaaaa", {**make_click(10), "utm_source": "google"}),
+    ]
+
+    operations = rollup_operations(clicks)
+
+    # two hourly buckets and one daily bucket
+    assert sorted(op._filter["period"] for op in operations) == ["day", "hour", "hour"]
+    day = next(op for op in operations if op._filter["period"] == "day")
+    assert day._doc["$inc"]["clicks"] == 3
+    assert day._doc["$inc"]["utm_source.google"] == 2
+    assert day._doc["$inc"]["utm_source.a%2Eb"] == 1
+    assert day._doc["$inc"]["location.(none)"] == 3
+
+
+@pytest.mark.asyncio
+async def test_rollup_summary_merges_buckets(mock_db_cm):
+    docs = [
+        {"bucket": datetime(2025, 6, 22), "clicks": 2, "utm_source": {"google": 2}},
+        {
+            "bucket": datetime(2025, 6, 23),
+            "clicks": 3,
+            "utm_source": {"google": 1, "a%2Eb": 2},
+        },
+    ]
+
+    class Cursor:
+        def sort(self, *args):
+            return self
+
+        async def __aiter__(self):
+            for doc in docs:
+                yield doc
+
+    mock_db_cm.url_rollups.find = MagicMock(return_value=Cursor())
+
+    summary = await rollup_summary(
+        "http://localhost:8000/aaaaa", mock_db_cm, "utm_source"
+    )
+
+    assert summary["clicks"] == 5
+    assert summary["breakdown"] == {"google": 3, "a.b": 2}
+    assert [point["clicks"] for point in summary["series"]] == [2, 3]
+
+
+@pytest.mark.asyncio
+async def test_summary_of_another_users_link_is_not_found(mock_db_cm, monkeypatch):
+    from linkly.routes.shortner import view_url_analytics_summary
+
+    monkeypatch.setattr(
+        "linkly.routes.shortner.settings.LOCAL_HOST", "http://localhost:8000"
+    )
+    mock_db_cm.urls.find_one = AsyncMock(return_value=None)
+    mock_db_cm.url_rollups.find = MagicMock()
+    user = {"_id": ObjectId()}
+
+    with pytest.raises(HTTPException) as e:
+        # the undecorated endpoint, without the response cache
+        await view_url_analytics_summary.__wrapped__(
+            "aaaaa", "utm_source", 30, "day", user=user, db_cm=mock_db_cm
+        )
+
+    assert e.value.status_code == 404
+    query, _ = mock_db_cm.urls.find_one.await_args.args
+    assert query == {"short_url": "http://localhost:8000/aaaaa", "user_id": user["_id"]}
+    mock_db_cm.url_rollups.find.assert_not_called()
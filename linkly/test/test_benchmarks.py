@@ -0,0 +1,48 @@
+"""
+Load test harness smoke tests
+"""
+
+import random
+
+import pytest
+
+from benchmarks.compare import compare
+from benchmarks.run import HISTOGRAM_BOUNDS, Zipf, parse_mix, run_benchmark, summarize
+
+
+def test_zipf_prefers_low_ranks():
+    zipf = Zipf(list(range(100)), 1.2, random.Random(1))
+    samples = [zipf.sample() for _ in range(5000)]
+
+    assert samples.count(0) > samples.count(1) > samples.count(50)
+    assert set(samples) <= set(range(100))
+
+
+def test_summary_histogram_counts_every_sample():
+    summary = summarize([0.05, 0.3, 3.0, 3.0, 7000.0], elapsed=1.0)
+
+    assert summary["count"] == 5
+    assert summary["latency_ms"]["max"] == 7000.0
+    assert len(summary["histogram"]) == len(HISTOGRAM_BOUNDS) + 1
+    assert sum(count for _, count in summary["histogram"]) == 5
+    assert summary["histogram"][-1] == ["+Inf", 1]
+
+
+def test_parse_mix_rejects_unknown_operations():
+    assert parse_mix("redirect=8,me=2") == {"redirect": 8.0, "me": 2.0}
+    with pytest.raises(ValueError):
+        parse_mix("redirect=8,delete=2")
+
+
+@pytest.mark.asyncio
+async def test_in_process_run():
+    report = await run_benchmark(requests=200, concurrency=4, links=50, users=1, seed=3)
+    results = report["results"]
+
+    assert results["total"]["count"] == 200
+    assert results["total"]["errors"] == 0
+    assert set(results["redirect"]["statuses"]) == {"307"}
+    assert results["shorten"]["statuses"] == {"200": results["shorten"]["count"]}
+
+    rows = compare(report, report)
+    assert {row["change_pct"] for row in rows if row["change_pct"] is not None} == {0}
@@ -0,0 +1,166 @@
+"""
+Click stream and analytics worker tests
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from linkly.services.click_stream import (
+    AnalyticsWorker,
+    decode_click,
+    encode_click,
+)
+from linkly.services.clicks import ClickQueue
+from linkly.services.visitors import dedup_clicks
+
+STREAM = "clicks:stream"
+SHORT_URL = "http://localhost:8000/aaaaa"
+
+# ==================== FIXTURES ====================
+
+
+def make_event(ip: str = "8.8.8.8", source: str | None = "google") -> dict:
+    return {
+        "short_id": SHORT_URL,
+        "fingerprint": f"{ip}pytest-agent",
+        "click": {
+            "user_agent": "pytest-agent",
+            "ip": ip,
+            "timestamp": datetime(2025, 6, 23, 9, 30, 15, 123000, timezone.utc),
+            "location": None,
+            "utm_source": source,
+            "utm_medium": None,
+            "utm_campaign": None,
+        },
+    }
+
+
+def make_worker(name: str, claim_idle: float = 60) -> AnalyticsWorker:
+    return AnalyticsWorker(
+        stream=STREAM,
+        group="analytics",
+        consumer=name,
+        batch_size=100,
+        block=0,
+        claim_idle=claim_idle,
+        max_deliveries=2,
+    )
+
+
+@pytest.fixture
+def mock_record():
+    """Replace the storage layer; returns the number of clicks it was given"""
+
+    async def record(events, db_cm):
+        return len(events)
+
+    with patch(
+        "linkly.services.click_stream.record_clicks", AsyncMock(side_effect=record)
+    ) as mock:
+        yield mock
+
+
+async def append(fake_redis, *events) -> None:
+    queue = ClickQueue(10, 100, 60, 0, mode="stream")
+    await queue.start(MagicMock())
+    for event in events:
+        await queue.put(event)
+    await queue.stop()
+
+
+# ==================== TESTS ====================
+
+
+def test_click_round_trips_through_a_stream_entry():
+    event = make_event(source=None)
+
+    decoded = decode_click("1-0", encode_click(event))
+
+    assert decoded == {**event, "id": "1-0"}
+    assert "us" not in encode_click(event)
+
+
+@pytest.mark.asyncio
+async def test_queue_appends_and_worker_stores_and_acks(fake_redis, mock_record):
+    await append(fake_redis, make_event(), make_event("1.1.1.1"))
+    worker = make_worker("w1")
+    await worker.ensure_group()
+
+    await worker.process(await worker.read(), MagicMock())
+
+    (events, _), _ = mock_record.await_args
+    assert [event["click"]["ip"] for event in events] == ["8.8.8.8", "1.1.1.1"]
+    assert worker.processed == 2
+    assert await fake_redis.xpending_range(STREAM, "analytics", "-", "+", 10) == []
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_reclaimed_by_another_worker(fake_redis, mock_record):
+    await append(fake_redis, make_event())
+    crashed, healthy = make_worker("w1"), make_worker("w2", claim_idle=0)
+    await crashed.ensure_group()
+    await healthy.ensure_group()
+    mock_record.side_effect = ConnectionError("mongo down")
+    with pytest.raises(ConnectionError):
+        await crashed.process(await crashed.read(), MagicMock())
+    mock_record.side_effect = None
+    mock_record.return_value = 1
+
+    entries = await healthy.reclaim()
+    await healthy.process(entries, MagicMock())
+
+    assert healthy.reclaimed == 1
+    assert healthy.processed == 1
+    assert await fake_redis.xpending_range(STREAM, "analytics", "-", "+", 10) == []
+
+
+@pytest.mark.asyncio
+async def test_poison_entries_are_dead_lettered(fake_redis, mock_record):
+    await append(fake_redis, make_event())
+    await fake_redis.xadd(STREAM, {"s": SHORT_URL})
+    worker = make_worker("w1", claim_idle=0)
+    await worker.ensure_group()
+    mock_record.side_effect = ValueError("cannot store")
+
+    with pytest.raises(ValueError):
+        await worker.process(await worker.read(), MagicMock())
+    # second delivery fails too, the third is not attempted
+    with pytest.raises(ValueError):
+        await worker.process(await worker.reclaim(), MagicMock())
+    assert await worker.reclaim() == []
+
+    dead = fake_redis.data[f"{STREAM}:dead"]
+    assert [fields["id"] for _, fields in dead] == ["2-0", "1-0"]
+    assert worker.dead == 2
+    assert await fake_redis.xpending_range(STREAM, "analytics", "-", "+", 10) == []
+
+
+@pytest.mark.asyncio
+async def test_trimmed_pending_entries_are_acknowledged(fake_redis, mock_record):
+    await append(fake_redis, make_event(), make_event("1.1.1.1"))
+    crashed, healthy = make_worker("w1"), make_worker("w2", claim_idle=0)
+    await crashed.ensure_group()
+    await crashed.read()
+    # the stream hit MAXLEN before anyone processed the first entry
+    del fake_redis.data[STREAM][0]
+
+    entries = await healthy.reclaim()
+
+    assert [entry_id for entry_id, _ in entries] == ["2-0"]
+    assert [
+        p["message_id"]
+        for p in await fake_redis.xpending_range(STREAM, "analytics", "-", "+", 10)
+    ] == ["2-0"]
+
+
+@pytest.mark.asyncio
+async def test_redelivered_click_is_still_counted_once(fake_redis):
+    first = {**make_event(), "id": "1-0"}
+    repeat = {**make_event(), "id": "2-0"}
+
+    assert await dedup_clicks([first]) == [first]
+    # the worker died after dedup, the entry comes back
+    assert await dedup_clicks([first]) == [first]
+    assert await dedup_clicks([repeat]) == []
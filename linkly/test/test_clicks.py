@@ -0,0 +1,82 @@
+"""
+Click ingestion queue tests
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+
+from linkly.services.clicks import ClickQueue
+
+# ==================== FIXTURES ====================
+
+
+def make_event(short_id: str, fingerprint: str) -> dict:
+    return {
+        "short_id": short_id,
+        "fingerprint": fingerprint,
+        "click": {
+            "user_agent": "pytest-agent",
+            "ip": "8.8.8.8",
+            "timestamp": datetime.now(timezone.utc),
+            "location": None,
+            "utm_source": None,
+            "utm_medium": None,
+            "utm_campaign": None,
+        },
+    }
+
+
+@pytest.fixture
+def mock_record():
+    """Replace the storage layer; returns the number of clicks it was given"""
+
+    async def record(events, db_cm):
+        return len(events)
+
+    with patch(
+        "linkly.services.clicks.record_clicks", AsyncMock(side_effect=record)
+    ) as mock:
+        yield mock
+
+
+# ==================== QUEUE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_queue_drains_on_stop(mock_record):
+    queue = ClickQueue(maxsize=10, batch_size=100, flush_interval=60, enqueue_timeout=0)
+    await queue.start(MagicMock())
+
+    for fp in ("fp1", "fp2", "fp3"):
+        assert await queue.put(make_event("http://localhost:8000/aaaaa", fp))
+    await queue.stop()
+
+    assert queue.flushed == 3
+    mock_record.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_queue_flushes_on_batch_size(mock_record):
+    queue = ClickQueue(maxsize=10, batch_size=2, flush_interval=60, enqueue_timeout=0)
+    await queue.start(MagicMock())
+
+    for fp in ("fp1", "fp2", "fp3"):
+        await queue.put(make_event("http://localhost:8000/aaaaa", fp))
+    await queue.stop()
+
+    assert [len(c.args[0]) for c in mock_record.call_args_list] == [2, 1]
+
+
+@pytest.mark.asyncio
+async def test_queue_drops_when_full(mock_record):
+    queue = ClickQueue(maxsize=1, batch_size=100, flush_interval=60, enqueue_timeout=0)
+    await queue.start(MagicMock())
+
+    # the consumer has not run yet, so the second put finds the queue full
+    assert await queue.put(make_event("http://localhost:8000/aaaaa", "fp1"))
+    assert not await queue.put(make_event("http://localhost:8000/aaaaa", "fp2"))
+    assert queue.dropped == 1
+
+    await queue.stop()
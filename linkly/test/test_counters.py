@@ -0,0 +1,224 @@
+"""
+Write-behind rollup counter tests
+"""
+
+import asyncio
+from datetime import datetime, timedelta, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pymongo.errors import BulkWriteError
+
+from linkly.services.counters import (
+    DIRTY_KEY,
+    PENDING_KEY,
+    RollupCounters,
+    counter_key,
+)
+from linkly.services.rollups import rollup_summary
+
+SHORT_URL = "http://localhost:8000/aaaaa"
+
+# ==================== FIXTURES ====================
+
+
+def make_click(source: str | None = "google") -> dict:
+    return {
+        "ip": "8.8.8.8",
+        "timestamp": datetime.now(timezone.utc),
+        "location": None,
+        "utm_source": source,
+        "utm_medium": None,
+        "utm_campaign": None,
+    }
+
+
+@pytest.fixture
+def counters(fake_redis):
+    return RollupCounters(
+        write_behind=True,
+        flush_interval=60,
+        batch_size=100,
+        recover_after=60,
+        flushers=2,
+    )
+
+
+@pytest.fixture
+def mock_db_cm():
+    mock_db = MagicMock()
+    mock_db.url_rollups.bulk_write = AsyncMock(return_value=None)
+    return mock_db
+
+
+class RacyRollups:
+    """
+    ``url_rollups`` with its unique index, where concurrent upserts match
+    before either of them inserts.
+    """
+
+    def __init__(self):
+        self.docs = {}
+
+    async def bulk_write(self, operations, ordered=True):
+        found = [self.docs.get(self._key(op)) for op in operations]
+        await asyncio.sleep(0)  # the other flusher's bulk_write runs here
+        errors = []
+        for i, (op, doc) in enumerate(zip(operations, found)):
+            if doc is None or op._filter["handoffs"]["$ne"] in doc["handoffs"]:
+                # no match: the upsert inserts, unless the unique index forbids it
+                if self._key(op) in self.docs:
+                    errors.append({"index": i, "code": 11000})
+                    continue
+                doc = self.docs[self._key(op)] = {"handoffs": []}
+            for counter, count in op._doc["$inc"].items():
+                doc[counter] = doc.get(counter, 0) + count
+            doc["handoffs"] += op._doc["$push"]["handoffs"]["$each"]
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    @staticmethod
+    def _key(op) -> tuple:
+        return op._filter["short_id"], op._filter["period"], op._filter["bucket"]
+
+
+def written(mock_db_cm) -> list:
+    calls = mock_db_cm.url_rollups.bulk_write.await_args_list
+    return [op for call in calls for op in call.args[0]]
+
+
+# ==================== TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_clicks_are_counted_in_redis_and_flushed_once(counters, mock_db_cm):
+    await counters.add(
+        [(SHORT_URL, make_click()), (SHORT_URL, make_click())], mock_db_cm
+    )
+    await counters.add([(SHORT_URL, make_click(None))], mock_db_cm)
+
+    mock_db_cm.url_rollups.bulk_write.assert_not_awaited()
+    live = await counters.live(SHORT_URL, "day")
+    (bucket,) = live
+    assert live[bucket]["clicks"] == 3
+    assert live[bucket]["utm_source.google"] == 2
+
+    assert await counters.flush(mock_db_cm) == 1
+
+    operations = written(mock_db_cm)
+    # one update per period for the whole burst
+    assert sorted(op._filter["period"] for op in operations) == ["day", "hour"]
+    day = next(op for op in operations if op._filter["period"] == "day")
+    handoff = day._filter["handoffs"]["$ne"]
+    assert day._doc["$inc"]["clicks"] == 3
+    assert day._doc["$push"]["handoffs"]["$each"] == [handoff]
+    # 2 flushers, each handing off twice per interval until a retry at 60 + 60s
+    assert day._doc["$push"]["handoffs"]["$slice"] == -8
+    assert await counters.live(SHORT_URL, "day") == {}
+    assert await counters.flush(mock_db_cm) == 0
+
+
+@pytest.mark.asyncio
+async def test_clicks_go_to_mongo_when_redis_fails(counters, mock_db_cm, fake_redis):
+    fake_redis.hincrby = AsyncMock(side_effect=ConnectionError("redis down"))
+
+    await counters.add([(SHORT_URL, make_click())], mock_db_cm)
+
+    assert len(written(mock_db_cm)) == 2
+    assert DIRTY_KEY not in fake_redis.data
+
+
+@pytest.mark.asyncio
+async def test_hash_taken_by_another_flusher_is_skipped(counters, fake_redis):
+    await fake_redis.sadd(DIRTY_KEY, counter_key(SHORT_URL))
+
+    assert await counters.handoff() == []
+    assert fake_redis.data[PENDING_KEY] == {}
+
+
+@pytest.mark.asyncio
+async def test_abandoned_handoff_is_retried(counters, mock_db_cm, fake_redis):
+    await counters.add([(SHORT_URL, make_click())], mock_db_cm)
+    (name,) = await counters.handoff()
+    # the flusher died before writing, a later one picks the hash up
+    fake_redis.data[PENDING_KEY][name] -= 120
+    # the first attempt did reach mongo, the retry hits the unique index
+    mock_db_cm.url_rollups.bulk_write.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 0, "code": 11000}]}
+    )
+
+    assert await counters.flush(mock_db_cm) == 1
+
+    assert name not in fake_redis.data
+    assert fake_redis.data[PENDING_KEY] == {}
+
+
+@pytest.mark.asyncio
+async def test_concurrent_handoffs_creating_a_rollup_both_count(counters, fake_redis):
+    await counters.add([(SHORT_URL, make_click())], MagicMock())
+    (first,) = await counters.handoff()
+    await counters.add([(SHORT_URL, make_click())], MagicMock())
+    (second,) = await counters.handoff()
+    db = MagicMock(url_rollups=RacyRollups())
+    deltas = dict(fake_redis.data[first])
+
+    await asyncio.gather(counters.apply(first, db), counters.apply(second, db))
+    # a crashed flusher's retry of the first handoff changes nothing
+    fake_redis.data[first] = deltas
+    await counters.apply(first, db)
+
+    docs = db.url_rollups.docs.values()
+    assert [doc["clicks"] for doc in docs] == [2, 2]
+    assert first not in fake_redis.data
+
+
+@pytest.mark.asyncio
+async def test_live_reads_only_this_links_pending_hashes(counters, fake_redis):
+    other = "http://localhost:8000/bbbbb"
+    await counters.add([(SHORT_URL, make_click()), (other, make_click())], MagicMock())
+    await counters.handoff()
+    await counters.add([(SHORT_URL, make_click())], MagicMock())
+    fake_redis.hgetall = AsyncMock(side_effect=fake_redis.hgetall)
+
+    live = await counters.live(SHORT_URL, "day")
+
+    assert [counters["clicks"] for counters in live.values()] == [2]
+    read = {call.args[0] for call in fake_redis.hgetall.await_args_list}
+    assert not any(other in name for name in read)
+
+
+@pytest.mark.asyncio
+async def test_summary_includes_counters_not_flushed_yet(counters, mock_db_cm):
+    today = datetime.now(timezone.utc).replace(
+        hour=0, minute=0, second=0, microsecond=0
+    )
+    docs = [
+        {
+            "bucket": today.replace(tzinfo=None),
+            "clicks": 2,
+            "utm_source": {"google": 2},
+        }
+    ]
+
+    class Cursor:
+        def sort(self, *args):
+            return self
+
+        async def __aiter__(self):
+            for doc in docs:
+                yield doc
+
+    mock_db_cm.url_rollups.find = MagicMock(return_value=Cursor())
+    await counters.add([(SHORT_URL, make_click("mail"))], mock_db_cm)
+    old = {today - timedelta(days=90): {"clicks": 5}}
+
+    summary = await rollup_summary(
+        SHORT_URL,
+        mock_db_cm,
+        "utm_source",
+        live={**await counters.live(SHORT_URL, "day"), **old},
+    )
+
+    assert summary["clicks"] == 3
+    assert summary["breakdown"] == {"google": 2, "mail": 1}
+    assert len(summary["series"]) == 1
@@ -0,0 +1,83 @@
+"""
+Short id allocator tests
+"""
+
+import asyncio
+import string
+from unittest.mock import AsyncMock
+
+import pytest
+
+from linkly.utils.encode_url import IdPermutation, ShortIdAllocator, ShortIdGenerator
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture(autouse=True)
+def base62_alphabet(monkeypatch):
+    monkeypatch.setattr(
+        "linkly.utils.encode_url.settings.BASE62",
+        string.digits + string.ascii_uppercase + string.ascii_lowercase,
+    )
+
+
+def counter_lease():
+    """In-memory stand-in for the mongo/redis counter"""
+    state = {"seq": 0}
+
+    async def lease(count):
+        start = state["seq"]
+        state["seq"] += count
+        return start
+
+    return AsyncMock(side_effect=lease)
+
+
+# ==================== ENCODING TESTS ====================
+
+
+def test_base62_round_trip_with_padding():
+    encoded = ShortIdGenerator.encode_base62(61, length=4)
+
+    assert encoded == "000z"
+    assert ShortIdGenerator.decode_base62(encoded) == 61
+
+
+def test_permutation_is_a_bijection():
+    permutation = IdPermutation("secret", domain=1000)
+
+    permuted = [permutation.permute(i) for i in range(1000)]
+
+    assert sorted(permuted) == list(range(1000))
+    assert permuted[:5] != [0, 1, 2, 3, 4]
+    assert all(permutation.invert(p) == i for i, p in enumerate(permuted))
+
+
+# ==================== ALLOCATOR TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_allocator_leases_one_block_for_many_ids():
+    lease = counter_lease()
+    allocator = ShortIdAllocator(lease, length=6, block_size=100, secret="secret")
+
+    ids = [await allocator.next_id() for _ in range(100)]
+
+    assert len(set(ids)) == 100
+    assert all(len(short_id) == 6 for short_id in ids)
+    lease.assert_called_once_with(100)
+    assert allocator.decode(ids[42]) == 42
+
+
+@pytest.mark.asyncio
+async def test_allocator_batch_spans_blocks_without_duplicates():
+    lease = counter_lease()
+    allocator = ShortIdAllocator(lease, length=4, block_size=10)
+
+    first = await allocator.allocate(7)
+    rest, more = await asyncio.gather(allocator.allocate(25), allocator.allocate(3))
+
+    ids = first + rest + more
+    assert len(set(ids)) == 35
+    assert first[:2] == ["0000", "0001"]
+    assert lease.call_count == 3
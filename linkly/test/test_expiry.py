@@ -0,0 +1,133 @@
+"""
+Link expiry sweeper tests
+"""
+
+from datetime import datetime, timezone
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+
+from linkly.services.expiry import (
+    EXPIRY_BACKFILLED,
+    EXPIRY_SCHEDULE,
+    ExpirySweeper,
+    schedule_expiries,
+)
+from linkly.services.redirect_cache import redirect_cache
+
+# ==================== FIXTURES ====================
+
+
+class AsyncCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.docs:
+            raise StopAsyncIteration
+        return self.docs.pop(0)
+
+
+@pytest.fixture
+def mock_db_cm():
+    async def delete_many(query):
+        return MagicMock(deleted_count=len(query["short_id"]["$in"]))
+
+    mock_db = MagicMock()
+    mock_db.urls.delete_many = AsyncMock(side_effect=delete_many)
+    return mock_db
+
+
+@pytest.fixture
+def sweeper(mock_db_cm, fake_redis, monkeypatch):
+    monkeypatch.setattr(
+        "linkly.services.expiry.settings.LOCAL_HOST", "http://localhost:8000"
+    )
+    sweeper = ExpirySweeper(batch_size=2)
+    sweeper._db = mock_db_cm
+    return sweeper
+
+
+# ==================== SWEEP TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_sweep_deletes_due_links_in_batches(sweeper, mock_db_cm, fake_redis):
+    fake_redis.data[EXPIRY_SCHEDULE] = {"a": 10, "b": 20, "c": 30, "later": 1000}
+    await redirect_cache.set("http://localhost:8000/a", "https://example.com")
+
+    swept = await sweeper.sweep(now=100)
+
+    assert swept == 3
+    assert mock_db_cm.urls.delete_many.call_count == 2
+    first = mock_db_cm.urls.delete_many.call_args_list[0][0][0]
+    assert first == {"short_id": {"$in": ["a", "b"]}}
+    assert fake_redis.data[EXPIRY_SCHEDULE] == {"later": 1000}
+    assert "http://localhost:8000/a" not in redirect_cache.local
+
+
+@pytest.mark.asyncio
+async def test_schedule_expiries_skips_links_without_expiry(fake_redis):
+    await schedule_expiries([("a", 60), ("b", None)])
+
+    assert list(fake_redis.data[EXPIRY_SCHEDULE]) == ["a"]
+
+
+@pytest.mark.asyncio
+async def test_tick_backfills_once_then_sweeps(sweeper, mock_db_cm, fake_redis):
+    mock_db_cm.urls.find = MagicMock(return_value=AsyncCursor([]))
+    fake_redis.data[EXPIRY_SCHEDULE] = {"a": 10}
+
+    await sweeper.tick(mock_db_cm)
+    await sweeper.tick(mock_db_cm)
+
+    mock_db_cm.urls.find.assert_called_once()
+    assert fake_redis.data[EXPIRY_SCHEDULE] == {}
+    assert sweeper.expired == 1
+
+
+@pytest.mark.asyncio
+async def test_backfill_repairs_and_schedules_links_once(
+    sweeper, mock_db_cm, fake_redis
+):
+    created = datetime(2025, 6, 23, 9, 0, tzinfo=timezone.utc)
+    now = int(created.timestamp())
+    skewed_id, plain_id = ObjectId.from_datetime(created), ObjectId.from_datetime(
+        created
+    )
+    mock_db_cm.urls.find = MagicMock(
+        return_value=AsyncCursor(
+            [
+                # written by a host at UTC+2
+                {
+                    "_id": skewed_id,
+                    "short_id": "a",
+                    "created_at": now - 7200,
+                    "expiry": 60,
+                },
+                {
+                    "_id": plain_id,
+                    "short_id": "b",
+                    "created_at": now + 1,
+                    "expiry": None,
+                },
+                {"short_id": "c", "created_at": 2000, "expiry": 60},
+            ]
+        )
+    )
+    mock_db_cm.urls.bulk_write = AsyncMock()
+    fake_redis.data[EXPIRY_SCHEDULE] = {"a": now - 7140}
+
+    assert await sweeper.backfill() == 2
+    assert fake_redis.data[EXPIRY_SCHEDULE] == {"a": now + 60, "c": 2060}
+    (repair,) = mock_db_cm.urls.bulk_write.await_args.args[0]
+    assert repair._filter == {"_id": skewed_id}
+    assert repair._doc == {"$set": {"created_at": now}}
+    assert fake_redis.data[EXPIRY_BACKFILLED]
+
+    assert await sweeper.backfill() == 0
+    mock_db_cm.urls.find.assert_called_once()
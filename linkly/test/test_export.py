@@ -0,0 +1,124 @@
+"""
+Streaming analytics export tests
+"""
+
+import csv
+import io
+import json
+from datetime import datetime
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from linkly.routes.shortner import export_url_analytics
+from linkly.services.export import EXPORT_FIELDS, export_clicks, export_pipeline
+
+# ==================== FIXTURES ====================
+
+
+def make_row(i: int) -> dict:
+    return {
+        "short_id": "http://localhost:8000/aaaaa",
+        "timestamp": datetime(2025, 6, 23, 9, i),
+        "ip": "8.8.8.8",
+        "user_agent": "pytest-agent",
+        "location": "Kathmandu, Nepal",
+        "utm_source": "google" if i % 2 else None,
+    }
+
+
+class Cursor:
+    def __init__(self, rows):
+        self.rows = rows
+
+    async def __aiter__(self):
+        for row in self.rows:
+            yield row
+
+
+@pytest.fixture
+def mock_db_cm():
+    mock_db = MagicMock()
+    mock_db.url_analytics_buckets.aggregate = MagicMock(
+        return_value=Cursor([make_row(i) for i in range(5)])
+    )
+    return mock_db
+
+
+async def collect(body) -> list[bytes]:
+    return [chunk async for chunk in body]
+
+
+# ==================== EXPORT TESTS ====================
+
+
+def test_export_pipeline_covers_all_links():
+    pipeline = export_pipeline(
+        ["http://localhost:8000/aaaaa", "http://localhost:8000/bbbbb"],
+        utm_source="google",
+    )
+
+    assert pipeline[0]["$match"]["short_id"] == {
+        "$in": ["http://localhost:8000/aaaaa", "http://localhost:8000/bbbbb"]
+    }
+    assert "$filter" in pipeline[2]["$project"]["click_details"]
+    assert set(pipeline[-1]["$project"]) == {"_id", *EXPORT_FIELDS}
+
+
+@pytest.mark.asyncio
+async def test_ndjson_export_streams_per_batch(mock_db_cm):
+    chunks = await collect(
+        export_clicks(mock_db_cm, ["http://localhost:8000/aaaaa"], "ndjson", 2)
+    )
+
+    assert len(chunks) == 3
+    lines = b"".join(chunks).decode().splitlines()
+    assert json.loads(lines[1])["utm_source"] == "google"
+    assert json.loads(lines[0])["timestamp"] == "2025-06-23T09:00:00"
+    assert mock_db_cm.url_analytics_buckets.aggregate.call_args[1] == {"batchSize": 2}
+
+
+@pytest.mark.asyncio
+async def test_csv_export_has_header_and_rows(mock_db_cm):
+    chunks = await collect(
+        export_clicks(mock_db_cm, ["http://localhost:8000/aaaaa"], "csv", 10)
+    )
+
+    rows = list(csv.reader(io.StringIO(b"".join(chunks).decode())))
+    assert rows[0] == list(EXPORT_FIELDS)
+    assert len(rows) == 6
+    assert rows[1][4] == "Kathmandu, Nepal"
+
+
+@pytest.mark.asyncio
+async def test_csv_export_without_clicks_is_header_only(mock_db_cm):
+    mock_db_cm.url_analytics_buckets.aggregate.return_value = Cursor([])
+
+    chunks = await collect(export_clicks(mock_db_cm, [], "csv", 10))
+
+    assert b"".join(chunks).decode().strip() == ",".join(EXPORT_FIELDS)
+
+
+@pytest.mark.asyncio
+async def test_export_of_another_users_link_is_not_found(mock_db_cm, monkeypatch):
+    monkeypatch.setattr(
+        "linkly.routes.shortner.settings.LOCAL_HOST", "http://localhost:8000"
+    )
+    mock_db_cm.urls.find_one = AsyncMock(return_value=None)
+    user = {"_id": ObjectId()}
+
+    with pytest.raises(HTTPException) as e:
+        await export_url_analytics(
+            short_id="aaaaa",
+            format="ndjson",
+            batch_size=10,
+            user=user,
+            db_cm=mock_db_cm,
+        )
+
+    assert e.value.status_code == 404
+    query, _ = mock_db_cm.urls.find_one.await_args.args
+    assert query == {"short_url": "http://localhost:8000/aaaaa", "user_id": user["_id"]}
+    mock_db_cm.url_analytics_buckets.aggregate.assert_not_called()
@@ -0,0 +1,113 @@
+"""
+Redirect fast path tests
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import httpx
+import pytest
+from fastapi import APIRouter, FastAPI, HTTPException
+
+from linkly.services.fastpath import RedirectFastPath
+from linkly.services.metrics import HTTP_REQUESTS, MetricsMiddleware
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture
+def api():
+    """
+    Stand-in for the FastAPI app, tells which requests reached it.
+    """
+    api = FastAPI()
+    router = APIRouter()
+
+    @router.get("/metrics")
+    async def metrics():
+        return {"routed": "metrics"}
+
+    @router.get("/{short_id}")
+    async def redirect(short_id: str):
+        return {"routed": short_id}
+
+    api.include_router(router)
+    return api
+
+
+@pytest.fixture
+def resolve(monkeypatch):
+    async def resolves_url(short_url, db_cm):
+        if short_url.endswith("/missing"):
+            raise HTTPException(status_code=400)
+        return "https://example.com/landing page?a=1"
+
+    mock = AsyncMock(side_effect=resolves_url)
+    monkeypatch.setattr("linkly.services.fastpath.resolves_url", mock)
+    monkeypatch.setattr("linkly.services.fastpath.get_db_instance", MagicMock())
+    monkeypatch.setattr(
+        "linkly.services.fastpath.settings.LOCAL_HOST", "http://localhost:8000"
+    )
+    return mock
+
+
+@pytest.fixture
+def clicks(monkeypatch):
+    put = AsyncMock(return_value=True)
+    monkeypatch.setattr("linkly.services.fastpath.click_queue.put", put)
+    return put
+
+
+async def get(asgi_app, path: str, **headers) -> httpx.Response:
+    transport = httpx.ASGITransport(app=asgi_app, client=("10.0.0.1", 5000))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.get(path, headers={"user-agent": "pytest", **headers})
+
+
+# ==================== TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_redirect_is_answered_without_the_app(api, resolve, clicks):
+    fast = RedirectFastPath(api)
+
+    response = await get(fast, "/abc123?utm_source=mail")
+
+    assert response.status_code == 307
+    assert response.headers["location"] == "https://example.com/landing%20page?a=1"
+    assert fast.handled == 1
+    resolve.assert_awaited_once()
+    assert resolve.await_args.args[0] == "http://localhost:8000/abc123"
+    click = clicks.await_args.args[0]
+    assert click["short_id"] == "http://localhost:8000/abc123"
+    assert click["click"]["ip"] == "10.0.0.1"
+    assert click["click"]["utm_source"] == "mail"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "path, headers",
+    [
+        ("/metrics", {}),
+        ("/missing", {}),
+        ("/abc123/extra", {}),
+        ("/abc123", {"origin": "https://drona-gyawali.github.io"}),
+    ],
+)
+async def test_everything_else_goes_to_the_app(api, resolve, clicks, path, headers):
+    fast = RedirectFastPath(api)
+
+    response = await get(fast, path, **headers)
+
+    assert response.status_code in (200, 404)
+    assert fast.handled == 0
+    clicks.assert_not_awaited()
+
+
+@pytest.mark.asyncio
+async def test_fast_path_requests_are_labelled_by_route(api, resolve, clicks):
+    key = ("GET", "/{short_id}", "307")
+    before = HTTP_REQUESTS.values.get(key, 0)
+
+    await get(MetricsMiddleware(RedirectFastPath(api)), "/abc123")
+
+    assert HTTP_REQUESTS.values[key] - before == 1
@@ -0,0 +1,69 @@
+"""
+Offline GeoIP database tests
+"""
+
+import pytest
+
+from linkly.commands.build_geoip import read_ranges
+from linkly.utils.geoip import MISSING, GeoIPDatabase, GeoIPResolver, build_database
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture
+def geoip_path(tmp_path):
+    source = tmp_path / "ranges.csv"
+    source.write_text(
+        "start_ip,end_ip,country,city\n"
+        "8.8.8.0,8.8.8.255,United States,Mountain View\n"
+        "1.0.0.0,1.0.0.255,Australia,\n"
+        "27.34.0.0,27.34.127.255,Nepal,Kathmandu\n"
+        "2001:4860::,2001:4860:ffff:ffff:ffff:ffff:ffff:ffff,United States,\n"
+    )
+    path = tmp_path / "geoip.bin"
+    build_database(
+        read_ranges(str(source), "start_ip", "end_ip", "city", "country"), str(path)
+    )
+    return str(path)
+
+
+# ==================== DATABASE TESTS ====================
+
+
+def test_lookup_ipv4_ranges(geoip_path):
+    db = GeoIPDatabase(geoip_path)
+
+    assert db.lookup("8.8.8.8") == "Mountain View, United States"
+    assert db.lookup("27.34.127.255") == "Kathmandu, Nepal"
+    assert db.lookup("1.0.0.0") == "Australia"
+    assert db.lookup("8.8.9.0") is None
+    assert db.lookup("0.0.0.1") is None
+    db.close()
+
+
+def test_lookup_ipv6_and_mapped_ipv4(geoip_path):
+    db = GeoIPDatabase(geoip_path)
+
+    assert db.lookup("2001:4860:4860::8888") == "United States"
+    assert db.lookup("::ffff:8.8.8.8") == "Mountain View, United States"
+    assert db.lookup("2001:db8::1") is None
+    assert db.lookup("not-an-ip") is None
+    db.close()
+
+
+def test_build_rejects_overlapping_ranges(tmp_path):
+    rows = [("10.0.0.0", "10.0.0.255", "A"), ("10.0.0.128", "10.0.1.0", "B")]
+    with pytest.raises(ValueError):
+        build_database(rows, str(tmp_path / "geoip.bin"))
+
+
+# ==================== RESOLVER TESTS ====================
+
+
+def test_resolver_caches_and_reports_missing(geoip_path):
+    resolver = GeoIPResolver.open(geoip_path, cache_size=8)
+
+    assert resolver.lookup("8.8.8.8") == "Mountain View, United States"
+    assert resolver.lookup("8.8.8.8") == "Mountain View, United States"
+    assert resolver.cache.stats()["hits"] == 1
+    assert resolver.lookup("192.168.1.1") is MISSING
@@ -0,0 +1,92 @@
+"""
+Index registry and index report tests
+"""
+
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from linkly.commands.index_report import index_report
+from linkly.indexes import INDEXES, IndexSpec, ensure_indexes
+
+# ==================== FIXTURES ====================
+
+
+class AsyncCursor:
+    def __init__(self, docs):
+        self.docs = list(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self.docs:
+            raise StopAsyncIteration
+        return self.docs.pop(0)
+
+
+@pytest.fixture
+def mock_db_cm():
+    collections: dict[str, MagicMock] = {}
+
+    def collection(name):
+        if name not in collections:
+            mock = MagicMock()
+            mock.create_indexes = AsyncMock(
+                side_effect=lambda models: [m.document["name"] for m in models]
+            )
+            mock.aggregate = MagicMock(return_value=AsyncCursor([]))
+            collections[name] = mock
+        return collections[name]
+
+    db = MagicMock()
+    db.__getitem__.side_effect = collection
+    return db
+
+
+# ==================== REGISTRY TESTS ====================
+
+
+def test_index_names_follow_mongo_defaults():
+    spec = IndexSpec("urls", (("user_id", 1), ("created_at", -1)))
+
+    assert spec.name == "user_id_1_created_at_-1"
+    assert spec.model().document["key"] == {"user_id": 1, "created_at": -1}
+
+
+@pytest.mark.asyncio
+async def test_ensure_indexes_skips_indexes_that_fail(mock_db_cm):
+    mock_db_cm["urls"].create_indexes.side_effect = OperationFailure("E11000")
+
+    created = await ensure_indexes(mock_db_cm)
+
+    assert "email_1" in created
+    assert "short_url_1" not in created
+    assert len(created) == len([s for s in INDEXES if s.collection != "urls"])
+
+
+# ==================== REPORT TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_index_report_flags_missing_unused_and_extra(mock_db_cm):
+    mock_db_cm["users"].aggregate.return_value = AsyncCursor(
+        [
+            {"name": "_id_", "accesses": {"ops": 10}},
+            {"name": "email_1", "accesses": {"ops": 42}},
+            {"name": "name_1", "accesses": {"ops": 0}},
+            {"name": "oauth_1", "accesses": {"ops": 3}},
+        ]
+    )
+
+    rows = {
+        (row["collection"], row["index"]): row["status"]
+        for row in await index_report(mock_db_cm)
+    }
+
+    assert rows[("users", "email_1")] == "ok"
+    assert rows[("users", "name_1")] == "unused"
+    assert rows[("users", "oauth_1")] == "extra"
+    assert rows[("urls", "short_id_1")] == "missing"
+    assert ("users", "_id_") not in rows
@@ -0,0 +1,190 @@
+"""
+Metrics registry, middleware and cross-worker aggregation tests
+"""
+
+import json
+
+import httpx
+import pytest
+from fastapi import FastAPI, HTTPException
+
+from linkly import app
+from linkly.services.metrics import (
+    HTTP_REQUESTS,
+    HTTP_SECONDS,
+    WORKERS_KEY,
+    MetricsExporter,
+    MetricsMiddleware,
+)
+from linkly.utils.metrics import Registry, label_worker, merge, render
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture
+def small_app():
+    small = FastAPI()
+    small.add_middleware(MetricsMiddleware)
+
+    @small.get("/{short_id}")
+    async def redirect(short_id: str):
+        if short_id == "missing":
+            raise HTTPException(status_code=404)
+        return {"short_id": short_id}
+
+    return small
+
+
+@pytest.fixture
+def exporter(fake_redis, monkeypatch):
+    monkeypatch.setattr("linkly.services.metrics.redis_client", fake_redis)
+    return MetricsExporter(mode="redis", interval=10)
+
+
+async def get(asgi_app, path: str) -> httpx.Response:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.get(path)
+
+
+# ==================== REGISTRY TESTS ====================
+
+
+def test_render_histogram_is_cumulative():
+    registry = Registry()
+    latency = registry.histogram("latency_seconds", "Latency", ("route",), (0.1, 1))
+    for value in (0.05, 0.5, 0.5, 3):
+        latency.observe(value, "/a")
+
+    text = render(registry.snapshot())
+
+    assert "# TYPE latency_seconds histogram" in text
+    assert 'latency_seconds_bucket{route="/a",le="0.1"} 1' in text
+    assert 'latency_seconds_bucket{route="/a",le="1"} 3' in text
+    assert 'latency_seconds_bucket{route="/a",le="+Inf"} 4' in text
+    assert 'latency_seconds_count{route="/a"} 4' in text
+    assert 'latency_seconds_sum{route="/a"} 4.05' in text
+
+
+def test_merge_sums_counters_and_takes_max_of_max_gauges():
+    snapshots = []
+    for requests, lag in ((3, 0.5), (4, 2.0)):
+        registry = Registry()
+        registry.counter("requests_total", "Requests", ("status",)).inc(
+            "200", amount=requests
+        )
+        registry.collector("lag_seconds", "Lag", lambda: [((), lag)], merge="max")
+        registry.histogram("latency_seconds", "Latency", buckets=(1,)).observe(0.5)
+        snapshots.append(json.loads(json.dumps(registry.snapshot())))
+
+    merged = merge(snapshots)
+
+    assert merged["requests_total"]["samples"] == [[["200"], 7]]
+    assert merged["lag_seconds"]["samples"] == [[[], 2.0]]
+    assert merged["latency_seconds"]["samples"] == [[[], [2, 0, 1.0]]]
+
+
+def test_worker_label_keeps_counters_per_worker():
+    snapshots = []
+    for worker, requests in (("a:1", 3), ("b:1", 4)):
+        registry = Registry()
+        registry.counter("requests_total", "Requests", ("status",)).inc(
+            "200", amount=requests
+        )
+        registry.gauge("in_flight", "In flight").inc(amount=requests)
+        snapshots.append(label_worker(registry.snapshot(), worker))
+
+    merged = merge(snapshots)
+
+    # a restart of one worker only resets that worker's series
+    assert merged["requests_total"]["labels"] == ["status", "worker"]
+    assert merged["requests_total"]["samples"] == [
+        [["200", "a:1"], 3],
+        [["200", "b:1"], 4],
+    ]
+    assert merged["in_flight"]["samples"] == [[[], 7]]
+    assert 'requests_total{status="200",worker="b:1"} 4' in render(merged)
+
+
+def test_broken_collector_is_skipped():
+    registry = Registry()
+    registry.counter("ok_total", "Fine").inc()
+    registry.collector("broken", "Raises", lambda: 1 / 0)
+
+    assert set(registry.snapshot()) == {"ok_total"}
+
+
+# ==================== MIDDLEWARE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_middleware_labels_by_route_template(small_app):
+    key = ("GET", "/{short_id}", "200")
+    missing = ("GET", "/{short_id}", "404")
+    before = HTTP_REQUESTS.values.get(key, 0)
+    before_missing = HTTP_REQUESTS.values.get(missing, 0)
+
+    await get(small_app, "/abc123")
+    await get(small_app, "/xyz789")
+    await get(small_app, "/missing")
+
+    assert HTTP_REQUESTS.values[key] - before == 2
+    assert HTTP_REQUESTS.values[missing] - before_missing == 1
+    assert not any("abc123" in labels[1] for labels in HTTP_SECONDS.values)
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint_is_not_a_short_url():
+    response = await get(app, "/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    assert "# TYPE linkly_redirect_cache_lookups_total counter" in response.text
+    assert "linkly_click_queue_depth" in response.text
+
+
+# ==================== AGGREGATION TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_collect_merges_live_workers(exporter, fake_redis):
+    other = MetricsExporter(mode="redis", interval=10)
+    other.worker_id = "other:1"
+    registry = Registry()
+    requests = registry.counter(
+        "linkly_http_requests_total", "Responses", ("method", "route", "status")
+    )
+    requests.inc("GET", "/elsewhere", "200", amount=5)
+    await other.push(registry.snapshot())
+
+    snapshot = await exporter.collect()
+
+    samples = dict(
+        (tuple(labels), value)
+        for labels, value in snapshot["linkly_http_requests_total"]["samples"]
+    )
+    assert samples[("GET", "/elsewhere", "200", "other:1")] == 5
+    assert set(fake_redis.data[WORKERS_KEY]) == {"other:1", exporter.worker_id}
+    assert fake_redis.ttl[f"metrics:worker:{exporter.worker_id}"] == 30
+
+
+@pytest.mark.asyncio
+async def test_collect_drops_workers_that_stopped_pushing(exporter, fake_redis):
+    fake_redis.data[WORKERS_KEY] = {"gone:1": 0}
+    fake_redis.data["metrics:worker:gone:1"] = json.dumps({})
+
+    await exporter.collect()
+
+    assert "gone:1" not in fake_redis.data[WORKERS_KEY]
+
+
+@pytest.mark.asyncio
+async def test_collect_falls_back_to_local_without_redis(exporter, monkeypatch):
+    async def broken(*args, **kwargs):
+        raise ConnectionError("redis is down")
+
+    monkeypatch.setattr(exporter, "push", broken)
+
+    snapshot = await exporter.collect()
+
+    assert "linkly_http_requests_total" in snapshot
@@ -0,0 +1,93 @@
+"""
+Password hashing pool tests - a thread pool and low bcrypt cost keep them fast
+"""
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+from passlib.context import CryptContext
+
+from linkly.services.auth import UserRepository
+from linkly.services.passwords import PasswordHasher
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture
+def fast_context():
+    context = CryptContext(
+        schemes=["bcrypt"],
+        deprecated="auto",
+        bcrypt__default_rounds=5,
+        bcrypt__min_rounds=5,
+    )
+    with patch("linkly.services.passwords.pwd_context", context):
+        yield context
+
+
+@pytest.fixture
+def hasher(fast_context):
+    executor = ThreadPoolExecutor(max_workers=2)
+    hasher = PasswordHasher(
+        workers=2, max_pending=4, admit_timeout=1, executor=executor
+    )
+    with patch("linkly.services.auth.password_hasher", hasher):
+        yield hasher
+    hasher.shutdown()
+
+
+# ==================== HASHER TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_off_loop(hasher):
+    hashed = await hasher.hash("s3cret")
+
+    assert await hasher.verify("s3cret", hashed) == (True, None)
+    assert (await hasher.verify("wrong", hashed))[0] is False
+    assert hasher.stats()["completed"] == 3
+    assert hasher.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_admission_limit_rejects_when_full(hasher):
+    hasher._slots = asyncio.Semaphore(1)
+    await hasher._slots.acquire()  # another login holds the only slot
+
+    with pytest.raises(HTTPException) as exc:
+        await hasher.hash("s3cret")
+
+    assert exc.value.status_code == 503
+    assert hasher.stats()["rejected"] == 1
+    assert hasher.stats()["waiting"] == 0
+
+
+# ==================== REPOSITORY TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_login_upgrades_outdated_hash(hasher):
+    old = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("s3cret")
+    user_id = ObjectId()
+    db = MagicMock()
+    db.users.update_one = AsyncMock()
+
+    assert await UserRepository(db).verify_password("s3cret", old, user_id)
+
+    query, update = db.users.update_one.call_args[0]
+    assert query == {"_id": user_id}
+    assert update["$set"]["password"].startswith("$2b$05$")
+
+
+@pytest.mark.asyncio
+async def test_wrong_password_never_rehashes(hasher):
+    old = CryptContext(schemes=["bcrypt"], bcrypt__default_rounds=4).hash("s3cret")
+    db = MagicMock()
+    db.users.update_one = AsyncMock()
+
+    assert not await UserRepository(db).verify_password("nope", old, ObjectId())
+    db.users.update_one.assert_not_called()
@@ -0,0 +1,124 @@
+"""
+Authenticated principal cache tests
+"""
+
+from datetime import timedelta
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from bson import ObjectId
+from fastapi import HTTPException
+
+from linkly.authentication.jwt.oauth2 import get_current_user
+from linkly.authentication.jwt.principal import (
+    INVALIDATION_CHANNEL,
+    PrincipalCache,
+    principal_cache,
+    principal_invalidation_listener,
+)
+from linkly.authentication.jwt.token import create_access_token
+from linkly.models.users import TokenData
+
+USER_ID = ObjectId()
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture(autouse=True)
+def jwt_settings(monkeypatch):
+    monkeypatch.setattr("linkly.authentication.jwt.token.SECRET_KEY", "test-secret")
+    monkeypatch.setattr("linkly.authentication.jwt.token.ALGORITHM", "HS256")
+    principal_cache.clear()
+    yield
+    principal_cache.clear()
+
+
+@pytest.fixture
+def mock_db():
+    mock_db = MagicMock()
+    mock_db.users.find_one = AsyncMock(
+        return_value={"_id": USER_ID, "name": "ram", "email": "ram@example.com"}
+    )
+    return mock_db
+
+
+# ==================== CACHE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_current_user_read_from_mongo_once(mock_db):
+    token = create_access_token(str(USER_ID))
+    hits = principal_cache.stats()["hits"]
+
+    first = await get_current_user(token=token, db=mock_db)
+    second = await get_current_user(token=token, db=mock_db)
+
+    assert first == second
+    assert first["name"] == "ram"
+    mock_db.users.find_one.assert_called_once()
+    # slim projection, never the password hash
+    assert "password" not in mock_db.users.find_one.call_args[0][1]
+    assert principal_cache.stats()["hits"] == hits + 1
+
+
+@pytest.mark.asyncio
+async def test_invalid_token_is_not_cached(mock_db):
+    for _ in range(2):
+        with pytest.raises(HTTPException):
+            await get_current_user(token="not-a-jwt", db=mock_db)
+
+    assert principal_cache.stats()["size"] == 0
+
+
+@pytest.mark.asyncio
+async def test_invalidate_drops_tokens_and_tells_other_workers(mock_db, fake_redis):
+    token = create_access_token(str(USER_ID))
+    await get_current_user(token=token, db=mock_db)
+
+    assert await principal_cache.invalidate(USER_ID) == 1
+    await get_current_user(token=token, db=mock_db)
+
+    assert mock_db.users.find_one.call_count == 2
+    assert fake_redis.published == [(INVALIDATION_CHANNEL, str(USER_ID))]
+
+
+@pytest.mark.asyncio
+async def test_listener_drops_tokens_invalidated_elsewhere(mock_db):
+    token = create_access_token(str(USER_ID))
+    other = create_access_token(str(ObjectId()))
+
+    class PubSub:
+        async def subscribe(self, channel):
+            # cached before the listener (re)started, may have missed messages
+            await get_current_user(token=other, db=mock_db)
+            self.channel = channel
+
+        async def listen(self):
+            await get_current_user(token=token, db=mock_db)
+            yield {"type": "subscribe", "data": 1}
+            yield {"type": "message", "data": str(USER_ID).encode()}
+
+        async def aclose(self):
+            pass
+
+    redis = MagicMock(pubsub=MagicMock(return_value=PubSub()))
+    await principal_invalidation_listener(redis)
+
+    assert principal_cache.stats()["size"] == 0
+
+
+def test_entry_never_outlives_token():
+    cache = PrincipalCache(maxsize=10, ttl=60)
+
+    with (
+        patch("linkly.authentication.jwt.principal.time.time", return_value=1000),
+        patch("linkly.utils.lru.time.monotonic", return_value=0),
+    ):
+        cache.set("expired", TokenData(user_id="u", exp=999), {"_id": "u"})
+        cache.set("soon", TokenData(user_id="u", exp=1010), {"_id": "u"})
+
+    assert cache.get("expired") is None
+    with patch("linkly.utils.lru.time.monotonic", return_value=5):
+        assert cache.get("soon")[1] == {"_id": "u"}
+    with patch("linkly.utils.lru.time.monotonic", return_value=11):
+        assert cache.get("soon") is None
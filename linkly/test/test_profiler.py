@@ -0,0 +1,204 @@
+"""
+Sampling profiler and profiling middleware tests
+"""
+
+import asyncio
+import time
+from collections import Counter
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from linkly.services.profiling import (
+    ProfileStore,
+    ProfilingMiddleware,
+    profiling,
+    sign_token,
+    verify_token,
+)
+from linkly.utils.profiler import (
+    WAITING,
+    Sampler,
+    from_collapsed,
+    from_speedscope,
+    to_collapsed,
+    to_speedscope,
+    to_svg,
+)
+
+SECRET = "profile-secret"
+
+# ==================== FIXTURES ====================
+
+
+def spin(seconds: float) -> None:
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+async def slow_lookup() -> None:
+    await asyncio.sleep(0.05)
+
+
+async def handler() -> None:
+    await slow_lookup()
+    spin(0.05)
+
+
+async def profile(coro_fn) -> Counter:
+    sampler = Sampler(interval=0.001)
+    task = asyncio.create_task(coro_fn())
+    sampler.begin(task)
+    await task
+    return sampler.end(task).stacks
+
+
+@pytest.fixture
+def store(tmp_path):
+    return ProfileStore(str(tmp_path), "speedscope", keep=3, interval=0.005)
+
+
+@pytest.fixture
+def profiled_app(store, monkeypatch):
+    monkeypatch.setattr(profiling, "secret", SECRET)
+    monkeypatch.setattr(profiling, "store", store)
+    monkeypatch.setattr(profiling, "sample_rate", 0)
+
+    small = FastAPI()
+    small.add_middleware(ProfilingMiddleware)
+
+    @small.get("/{short_id}")
+    async def redirect(short_id: str):
+        await handler()
+        return {"short_id": short_id}
+
+    return small
+
+
+async def get(asgi_app, path: str, **headers) -> httpx.Response:
+    transport = httpx.ASGITransport(app=asgi_app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as c:
+        return await c.get(path, headers=headers)
+
+
+async def wait_for_profiles(store, count: int) -> list:
+    for _ in range(100):
+        found = store.recent()
+        if len(found) >= count:
+            return found
+        await asyncio.sleep(0.01)
+    return store.recent()
+
+
+# ==================== SAMPLER TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_sampler_records_waiting_and_running_stacks():
+    stacks = await profile(handler)
+
+    waiting = [s for s in stacks if s[-1] == WAITING]
+    running = [s for s in stacks if s[-1] != WAITING]
+    assert any(label.endswith(":slow_lookup") for s in waiting for label in s)
+    assert any(s[-1].endswith(":spin") for s in running)
+    # stacks start at the task, not in the event loop internals
+    assert all(s[0].endswith(":handler") for s in stacks)
+
+
+@pytest.mark.asyncio
+async def test_sampler_thread_stops_when_idle():
+    sampler = Sampler(interval=0.001)
+    task = asyncio.create_task(slow_lookup())
+    sampler.begin(task)
+    await task
+    sampler.end(task)
+    await asyncio.sleep(0.01)
+
+    assert sampler._thread is None
+
+
+# ==================== ENCODER TESTS ====================
+
+
+def test_collapsed_and_speedscope_round_trip():
+    stacks = Counter({("a", "b"): 3, ("a", "c", WAITING): 2})
+
+    assert from_collapsed(to_collapsed(stacks)) == stacks
+    document = to_speedscope(stacks, "GET /x", interval=0.005)
+    assert document["profiles"][0]["endValue"] == pytest.approx(25)
+    assert from_speedscope(document, interval=0.005) == stacks
+    assert to_svg(stacks, "GET /x").count("<rect") == 4
+
+
+# ==================== TOKEN TESTS ====================
+
+
+def test_verify_token():
+    valid = sign_token(SECRET, int(time.time()) + 60)
+
+    assert verify_token(SECRET, valid)
+    assert not verify_token("other", valid)
+    assert not verify_token(None, valid)
+    assert not verify_token(SECRET, sign_token(SECRET, int(time.time()) - 1))
+    tampered = valid[:-1] + ("1" if valid.endswith("0") else "0")
+    assert not verify_token(SECRET, tampered)
+    assert not verify_token(SECRET, "garbage")
+
+
+# ==================== STORE TESTS ====================
+
+
+def test_store_lists_newest_first_and_keeps_the_last_few(store):
+    for i in range(5):
+        store.save(Counter({("a",): i + 1}), "GET", f"/route{i % 2}", 0.01)
+        time.sleep(0.002)
+
+    recent = store.recent()
+    assert len(recent) == 3
+    assert [info.route for info in recent] == ["/route0", "/route1", "/route0"]
+    assert recent[0].duration_ms == 10
+    assert store.aggregate(store.recent("/route0"))[("a",)] == 5 + 3
+    assert store.path("../secrets.speedscope.json") is None
+
+
+# ==================== MIDDLEWARE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_only_signed_requests_are_profiled(profiled_app, store):
+    token = sign_token(SECRET, int(time.time()) + 60)
+
+    await get(profiled_app, "/abc123")
+    await get(profiled_app, "/abc123", **{"x-linkly-profile": "1.bad"})
+    await get(profiled_app, "/abc123", **{"x-linkly-profile": token})
+
+    recent = await wait_for_profiles(store, 1)
+    assert len(recent) == 1
+    assert recent[0].route == "/{short_id}"
+    stacks = store.aggregate(recent)
+    assert any(label.endswith(":spin") for stack in stacks for label in stack)
+
+
+@pytest.mark.asyncio
+async def test_sample_rate_profiles_without_token(profiled_app, store, monkeypatch):
+    monkeypatch.setattr(profiling, "sample_rate", 1.0)
+
+    await get(profiled_app, "/abc123")
+
+    assert len(await wait_for_profiles(store, 1)) == 1
+
+
+@pytest.mark.asyncio
+async def test_profile_endpoints_need_a_token(monkeypatch):
+    from linkly import app
+
+    monkeypatch.setattr(profiling, "secret", None)
+    assert (await get(app, "/profiles")).status_code == 404
+
+    monkeypatch.setattr(profiling, "secret", SECRET)
+    assert (await get(app, "/profiles")).status_code == 403
+    token = sign_token(SECRET, int(time.time()) + 60)
+    response = await get(app, "/profiles", **{"x-linkly-profile": token})
+    assert response.status_code == 200
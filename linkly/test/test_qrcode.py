@@ -0,0 +1,176 @@
+"""
+QR encoder and QR image cache tests - most renders use a thread pool to stay fast
+"""
+
+import struct
+import zlib
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from unittest.mock import MagicMock
+
+import pytest
+from fastapi import HTTPException
+
+from linkly.routes.shortner import generate_qr
+from linkly.services.qr import QRCache, etag_matches, qr_cache
+from linkly.utils.qrcode import ECC_FORMAT_BITS, DataTooLong, QRCode
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture
+def qr_redis(fake_redis, monkeypatch):
+    monkeypatch.setattr("linkly.services.qr.redis_client", fake_redis)
+    monkeypatch.setattr("linkly.services.qr.settings.LOCAL_HOST", "http://localhost")
+    monkeypatch.setattr(qr_cache, "_executor", ThreadPoolExecutor(max_workers=1))
+    qr_cache.clear()
+    yield fake_redis
+    qr_cache.clear()
+    qr_cache.shutdown()
+
+
+def read_format(modules) -> int:
+    # first copy of the format information, around the top left finder
+    bits = [modules[i][8] for i in range(6)] + [modules[7][8], modules[8][8]]
+    bits += [modules[8][7]] + [modules[8][14 - i] for i in range(9, 15)]
+    value = sum(bit << i for i, bit in enumerate(bits)) ^ 0x5412
+    return value >> 10
+
+
+# ==================== ENCODER TESTS ====================
+
+
+def test_smallest_version_is_chosen():
+    assert QRCode.encode("a", "L").version == 1
+    # version 1-L holds 17 bytes, version 1-H only 7
+    assert QRCode.encode("x" * 17, "L").version == 1
+    assert QRCode.encode("x" * 18, "L").version == 2
+    assert QRCode.encode("x" * 8, "H").version == 2
+    assert QRCode.encode("x" * 2953, "L").version == 40
+
+
+def test_data_too_long():
+    with pytest.raises(DataTooLong):
+        QRCode.encode("x" * 2954, "L")
+
+
+@pytest.mark.parametrize("ecc", ["L", "M", "Q", "H"])
+def test_format_information(ecc):
+    code = QRCode.encode("http://localhost:8000/abc123", ecc, mask=5)
+
+    assert code.size == code.version * 4 + 17
+    assert read_format(code.modules) == ECC_FORMAT_BITS[ecc] << 3 | 5
+    # finder pattern corners and the dark module
+    assert code.modules[0][0] and code.modules[0][-1] and code.modules[-1][0]
+    assert code.modules[code.size - 8][8]
+
+
+def test_png_output():
+    code = QRCode.encode("http://localhost:8000/abc123")
+    png = code.to_png(scale=2, margin=1)
+
+    assert png.startswith(b"\x89PNG\r\n\x1a\n")
+    width, height, depth, color = struct.unpack(">IIBB", png[16:26])
+    assert width == height == (code.size + 2) * 2
+    assert (depth, color) == (1, 0)
+
+    idat = png.index(b"IDAT")
+    length = struct.unpack(">I", png[idat - 4 : idat])[0]
+    raw = zlib.decompress(png[idat + 4 : idat + 4 + length])
+    assert len(raw) == height * (1 + (width + 7) // 8)
+
+
+def test_svg_output():
+    code = QRCode.encode("http://localhost:8000/abc123")
+    svg = code.to_svg(scale=3, margin=2).decode()
+
+    side = code.size + 4
+    assert svg.startswith("<svg")
+    assert f'viewBox="0 0 {side} {side}"' in svg
+    assert f'width="{side * 3}"' in svg
+    assert svg.count("h1v1h-1z") == sum(map(sum, code.modules))
+
+
+# ==================== CACHE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_render_cached_locally_and_in_redis(qr_redis):
+    rendered = qr_cache.rendered
+    first = await qr_cache.get("abc123", "png", 150)
+    second = await qr_cache.get("abc123", "png", 150)
+
+    assert first is second
+    assert qr_cache.rendered == rendered + 1
+    assert qr_redis.data["qr:abc123:png:150:4:M"] == first.content
+    assert first.media_type == "image/png"
+
+    # another worker finds it in redis and does not render again
+    other = QRCache(maxsize=8, redis_ttl=60, executor=ThreadPoolExecutor(1))
+    shared = await other.get("abc123", "png", 150)
+    assert other.rendered == 0
+    assert shared.etag == first.etag
+
+
+@pytest.mark.asyncio
+async def test_options_are_cached_separately(qr_redis):
+    rendered = qr_cache.rendered
+    png = await qr_cache.get("abc123", "png", 150)
+    svg = await qr_cache.get("abc123", "svg", 150)
+    large = await qr_cache.get("abc123", "png", 600)
+
+    assert qr_cache.rendered == rendered + 3
+    assert svg.media_type == "image/svg+xml"
+    assert len({png.etag, svg.etag, large.etag}) == 3
+
+
+@pytest.mark.asyncio
+async def test_renders_run_in_a_process_pool(qr_redis):
+    cache = QRCache(maxsize=8, redis_ttl=60, workers=1)
+    try:
+        assert isinstance(cache._pool(), ProcessPoolExecutor)
+        image = await cache.get("abc123", "png", 2048, 4, "H")
+    finally:
+        cache.shutdown()
+
+    assert image.content.startswith(b"\x89PNG")
+    assert cache._executor is None
+
+
+def test_etag_matches():
+    assert etag_matches('"abc"', '"abc"')
+    assert etag_matches('W/"abc", "def"', '"abc"')
+    assert etag_matches("*", '"abc"')
+    assert not etag_matches('"def"', '"abc"')
+    assert not etag_matches(None, '"abc"')
+
+
+# ==================== ROUTE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_generate_qr_conditional_get(qr_redis):
+    request = MagicMock()
+    request.headers = {}
+    response = await generate_qr("abc123", request, "svg", 150, 4, "M")
+
+    assert response.status_code == 200
+    assert response.media_type == "image/svg+xml"
+    assert response.headers["cache-control"].startswith("public, max-age=")
+    etag = response.headers["etag"]
+
+    request.headers = {"if-none-match": etag}
+    cached = await generate_qr("abc123", request, "svg", 150, 4, "M")
+    assert cached.status_code == 304
+    assert cached.body == b""
+    assert cached.headers["etag"] == etag
+
+
+@pytest.mark.asyncio
+async def test_generate_qr_too_long(qr_redis, monkeypatch):
+    monkeypatch.setattr("linkly.services.qr.settings.LOCAL_HOST", "h" * 3000)
+    request = MagicMock()
+    request.headers = {}
+
+    with pytest.raises(HTTPException) as exc:
+        await generate_qr("abc123", request, "png", 150, 4, "H")
+    assert exc.value.status_code == 400
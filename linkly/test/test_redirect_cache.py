@@ -0,0 +1,167 @@
+"""
+Redirect cache tests - local tier only (FastAPICache is not initialised)
+"""
+
+import asyncio
+from unittest.mock import AsyncMock, MagicMock, patch
+
+import pytest
+from fastapi import HTTPException
+
+from linkly.services.redirect_cache import NOT_FOUND, RedirectCache
+from linkly.utils.lru import LRUCache
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture
+def cache():
+    return RedirectCache(maxsize=2, ttl=60, redis_ttl=180, not_found_ttl=30)
+
+
+@pytest.fixture
+def mock_db_cm():
+    mock_db = MagicMock()
+    mock_db.urls = MagicMock()
+    return mock_db
+
+
+# ==================== LRU TESTS ====================
+
+
+def test_lru_evicts_least_recently_used():
+    lru = LRUCache(maxsize=2)
+    lru.set("a", 1)
+    lru.set("b", 2)
+    lru.get("a")
+    lru.set("c", 3)
+
+    assert "a" in lru
+    assert "b" not in lru
+    assert lru.stats()["hits"] == 1
+
+
+def test_lru_expires_entries():
+    lru = LRUCache(maxsize=2, ttl=60)
+    with patch("linkly.utils.lru.time.monotonic", return_value=0):
+        lru.set("a", 1)
+    with patch("linkly.utils.lru.time.monotonic", return_value=61):
+        assert lru.get("a") is None
+    assert lru.stats()["misses"] == 1
+
+
+# ==================== RESOLVE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_resolves_url_hits_mongo_once(cache, mock_db_cm):
+    mock_db_cm.urls.find_one = AsyncMock(
+        return_value={"original_url": "https://example.com"}
+    )
+
+    with patch("linkly.services.shortner.redirect_cache", cache):
+        from linkly.services.shortner import resolves_url
+
+        first = await resolves_url("http://localhost:8000/abc12", mock_db_cm)
+        second = await resolves_url("http://localhost:8000/abc12", mock_db_cm)
+
+    assert first == second == "https://example.com"
+    mock_db_cm.urls.find_one.assert_called_once()
+    assert cache.stats()["local"]["hits"] == 1
+
+
+@pytest.mark.asyncio
+async def test_resolves_url_caches_not_found(cache, mock_db_cm):
+    mock_db_cm.urls.find_one = AsyncMock(return_value=None)
+
+    with patch("linkly.services.shortner.redirect_cache", cache):
+        from linkly.services.shortner import resolves_url
+
+        for _ in range(2):
+            with pytest.raises(HTTPException):
+                await resolves_url("http://localhost:8000/nope1", mock_db_cm)
+
+    mock_db_cm.urls.find_one.assert_called_once()
+    assert await cache.get("http://localhost:8000/nope1") == NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_invalidate_evicts_local_entry(cache):
+    await cache.set("http://localhost:8000/abc12", "https://example.com")
+    await cache.invalidate("http://localhost:8000/abc12")
+
+    assert await cache.get("http://localhost:8000/abc12") is None
+
+
+# ==================== TTL TESTS ====================
+
+
+def test_ttl_never_outlives_the_link(cache):
+    with patch("linkly.services.redirect_cache.time.time", return_value=1000):
+        assert cache.ttl_for(180, "https://example.com", expires_at=1030) == 30
+        assert cache.ttl_for(180, NOT_FOUND, expires_at=None) == 30
+
+
+def test_ttl_grows_for_hot_links_up_to_ceiling():
+    cache = RedirectCache(
+        maxsize=2, ttl=60, redis_ttl=180, not_found_ttl=30, max_ttl=500, hot_hits=10
+    )
+
+    assert cache.ttl_for(180, "https://example.com", None, hits=0) == 180
+    assert cache.ttl_for(180, "https://example.com", None, hits=10) == 360
+    assert cache.ttl_for(180, "https://example.com", None, hits=1000) == 500
+
+
+def test_links_without_expiry_cached_until_invalidated(cache):
+    assert cache.ttl_for(180, "https://example.com", None, hits=0) is None
+
+
+@pytest.mark.asyncio
+async def test_resolves_url_refuses_expired_link(cache, mock_db_cm):
+    mock_db_cm.urls.find_one = AsyncMock(
+        return_value={
+            "original_url": "https://example.com",
+            "created_at": 1000,
+            "expiry": 60,
+        }
+    )
+
+    with (
+        patch("linkly.services.shortner.redirect_cache", cache),
+        patch("linkly.services.shortner.time.time", return_value=2000),
+    ):
+        from linkly.services.shortner import resolves_url
+
+        with pytest.raises(HTTPException):
+            await resolves_url("http://localhost:8000/old12", mock_db_cm)
+
+    assert await cache.get("http://localhost:8000/old12") == NOT_FOUND
+
+
+@pytest.mark.asyncio
+async def test_stale_entry_served_while_refreshing(mock_db_cm):
+    cache = RedirectCache(
+        maxsize=2, ttl=60, redis_ttl=180, not_found_ttl=30, max_ttl=60, stale_ttl=30
+    )
+    mock_db_cm.urls.find_one = AsyncMock(
+        return_value={"original_url": "https://new.example.com"}
+    )
+    with patch("linkly.services.redirect_cache.time.monotonic", return_value=0):
+        await cache.set("http://localhost:8000/abc12", "https://old.example.com")
+
+    with (
+        patch("linkly.services.shortner.redirect_cache", cache),
+        patch("linkly.services.redirect_cache.time.monotonic", return_value=70),
+        patch("linkly.utils.lru.time.monotonic", return_value=70),
+    ):
+        from linkly.services.shortner import _refreshing, resolves_url
+
+        served = await resolves_url("http://localhost:8000/abc12", mock_db_cm)
+        await asyncio.gather(*_refreshing)
+
+        assert served == "https://old.example.com"
+        assert cache.lookup("http://localhost:8000/abc12") == (
+            "https://new.example.com",
+            False,
+        )
+    mock_db_cm.urls.find_one.assert_called_once()
@@ -0,0 +1,136 @@
+"""
+Background job scheduler tests
+"""
+
+import asyncio
+from unittest.mock import AsyncMock
+
+import pytest
+
+from linkly.services.scheduler import LAST_RUN_KEY, LEADER_KEY, Lease, Scheduler
+
+# ==================== FIXTURES ====================
+
+
+def make_scheduler() -> Scheduler:
+    return Scheduler(lease_ttl=30, backoff=0.01, max_backoff=0.05, shutdown_timeout=1)
+
+
+# ==================== LEASE TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_only_one_owner_holds_the_lease(fake_redis):
+    lease, other = Lease(LEADER_KEY, 30), Lease(LEADER_KEY, 30)
+
+    assert await lease.acquire()
+    assert await lease.acquire()  # renewal
+    assert not await other.acquire()
+
+    await other.release()
+    assert not await other.acquire()
+    await lease.release()
+    assert await other.acquire()
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_not_renewed_or_released_by_old_owner(fake_redis):
+    lease, other = Lease(LEADER_KEY, 30), Lease(LEADER_KEY, 30)
+    assert await lease.acquire()
+
+    del fake_redis.data[LEADER_KEY]  # expired while the owner was stalled
+    assert await other.acquire()
+
+    assert not await lease.acquire()
+    await lease.release()
+    assert fake_redis.data[LEADER_KEY] == other.token
+
+
+# ==================== SCHEDULER TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_periodic_job_runs_on_the_leader_only(fake_redis):
+    leader, follower = make_scheduler(), make_scheduler()
+    leader_job, follower_job = AsyncMock(), AsyncMock()
+    leader.every("sweep", 60, leader_job)
+    follower.every("sweep", 60, follower_job)
+
+    await leader.start()
+    await follower.start()
+    await asyncio.sleep(0.01)
+
+    assert leader.is_leader and not follower.is_leader
+    leader_job.assert_awaited_once()
+    follower_job.assert_not_awaited()
+    assert "sweep" in fake_redis.data[LAST_RUN_KEY]
+
+    await leader.stop()
+    await follower.stop()
+
+
+@pytest.mark.asyncio
+async def test_new_leader_keeps_the_schedule(fake_redis):
+    first, second = make_scheduler(), make_scheduler()
+    first_job, second_job = AsyncMock(), AsyncMock()
+    first.every("sweep", 60, first_job)
+    second.every("sweep", 60, second_job)
+
+    await first.start()
+    await asyncio.sleep(0.01)
+    await first.stop()
+    await second.start()
+    await asyncio.sleep(0.01)
+
+    # the lease was released on stop, the interval has not passed yet
+    assert second.is_leader
+    first_job.assert_awaited_once()
+    second_job.assert_not_awaited()
+
+    await second.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_task_is_restarted(fake_redis):
+    scheduler = make_scheduler()
+    started = 0
+
+    async def listener():
+        nonlocal started
+        started += 1
+        if started < 3:
+            raise ConnectionError("redis went away")
+        await asyncio.Event().wait()
+
+    scheduler.supervise("listener", listener)
+    await scheduler.start()
+    await asyncio.sleep(0.2)
+
+    assert started == 3
+    assert scheduler.restarts["listener"] == 2
+
+    await scheduler.stop()
+    assert not scheduler.running
+    assert LEADER_KEY not in fake_redis.data
+
+
+@pytest.mark.asyncio
+async def test_stop_cancels_jobs_past_the_timeout(fake_redis):
+    scheduler = make_scheduler()
+    scheduler.shutdown_timeout = 0.01
+    cancelled = asyncio.Event()
+
+    async def slow():
+        try:
+            await asyncio.sleep(10)
+        except asyncio.CancelledError:
+            cancelled.set()
+            raise
+
+    scheduler.every("slow", 60, slow)
+    await scheduler.start()
+    await asyncio.sleep(0.01)
+    await scheduler.stop()
+
+    assert cancelled.is_set()
+    assert not scheduler.is_leader
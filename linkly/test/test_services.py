@@ -11,14 +11,39 @@ import pytest_asyncio
 # ==================== FIXTURES ====================
 
 
+@pytest.fixture(autouse=True)
+def clear_geoip_cache():
+    """Resolved locations are cached per IP; start every test cold"""
+    from linkly.services.analytics import geoip
+
+    geoip.cache.clear()
+    yield
+    geoip.cache.clear()
+
+
 @pytest.fixture
-def mock_db_cm():
-    """Mock database connection manager"""
+def mock_db_cm(fake_redis):
+    """Mock database connection manager (click dedup runs on fake redis)"""
     mock_db = MagicMock()
-    mock_db.url_analytics = MagicMock()
+    mock_db.url_analytics_buckets.bulk_write = AsyncMock(return_value=None)
+    mock_db.url_rollups.bulk_write = AsyncMock(return_value=None)
     return mock_db
 
 
+def stored_clicks(mock_db):
+    """Clicks pushed into analytics buckets by the last bulk_write"""
+    operations = mock_db.url_analytics_buckets.bulk_write.call_args[0][0]
+    return [
+        click
+        for operation in operations
+        for click in operation._doc["$push"]["click_details"]["$each"]
+    ]
+
+
+def stored_dedup_keys(redis):
+    return [key for key in redis.data if key.startswith("click-seen:")]
+
+
 @pytest.fixture
 def mock_request():
     """Mock FastAPI request object"""
@@ -188,57 +213,39 @@ def mock_request_with_utm():
 @pytest.mark.asyncio
 async def test_url_analytics_location_api_failure_robust(mock_db_cm, mock_request):
     """Test analytics when IP geolocation API fails - Robust version"""
-    mock_db_cm.url_analytics.find_one = AsyncMock(return_value=None)
-    mock_db_cm.url_analytics.insert_one = AsyncMock(return_value=None)
 
-    # Mock httpx to raise an exception
-    with patch("linkly.services.shortner.httpx.AsyncClient") as MockAsyncClient:
-        mock_client_instance = MagicMock()
+    # Mock the geoip upstream to raise an exception
+    with patch("linkly.services.analytics.geoip_api") as mock_client_instance:
         mock_client_instance.get = AsyncMock(side_effect=Exception("API failed"))
 
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__ = AsyncMock(return_value=mock_client_instance)
-        mock_context_manager.__aexit__ = AsyncMock(return_value=None)
-
-        MockAsyncClient.return_value = mock_context_manager
-
         from linkly.services.shortner import url_analytics
 
         await url_analytics("http://localhost:8000/abc123", mock_request, mock_db_cm)
 
     # Verify the document was inserted with location=None
-    mock_db_cm.url_analytics.insert_one.assert_called_once()
-    insert_args = mock_db_cm.url_analytics.insert_one.call_args[0][0]
-    assert insert_args["click_details"][0]["location"] is None
+    mock_db_cm.url_analytics_buckets.bulk_write.assert_called_once()
+    clicks = stored_clicks(mock_db_cm)
+    assert clicks[0]["location"] is None
 
 
 @pytest.mark.asyncio
 async def test_url_analytics_api_non_200_response_robust(mock_db_cm, mock_request):
     """Test analytics when IP geolocation API returns non-200 status - Robust version"""
-    mock_db_cm.url_analytics.find_one = AsyncMock(return_value=None)
-    mock_db_cm.url_analytics.insert_one = AsyncMock(return_value=None)
 
-    # Mock httpx to return non-200 status
-    with patch("linkly.services.shortner.httpx.AsyncClient") as MockAsyncClient:
-        mock_client_instance = MagicMock()
+    # Mock the geoip upstream to return non-200 status
+    with patch("linkly.services.analytics.geoip_api") as mock_client_instance:
         mock_response = MagicMock()
         mock_response.status_code = 500
         mock_client_instance.get = AsyncMock(return_value=mock_response)
 
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__ = AsyncMock(return_value=mock_client_instance)
-        mock_context_manager.__aexit__ = AsyncMock(return_value=None)
-
-        MockAsyncClient.return_value = mock_context_manager
-
         from linkly.services.shortner import url_analytics
 
         await url_analytics("http://localhost:8000/abc123", mock_request, mock_db_cm)
 
     # Verify the document was inserted with location=None
-    mock_db_cm.url_analytics.insert_one.assert_called_once()
-    insert_args = mock_db_cm.url_analytics.insert_one.call_args[0][0]
-    assert insert_args["click_details"][0]["location"] is None
+    mock_db_cm.url_analytics_buckets.bulk_write.assert_called_once()
+    clicks = stored_clicks(mock_db_cm)
+    assert clicks[0]["location"] is None
 
 
 # @pytest.mark.asyncio
@@ -283,35 +290,26 @@ async def test_url_analytics_api_non_200_response_robust(mock_db_cm, mock_reques
 @pytest.mark.asyncio
 async def test_url_analytics_empty_location_data_robust(mock_db_cm, mock_request):
     """Test analytics when location data is empty - Robust version"""
-    mock_db_cm.url_analytics.find_one = AsyncMock(return_value=None)
-    mock_db_cm.url_analytics.insert_one = AsyncMock(return_value=None)
 
     # Mock API response with empty location data
-    with patch("linkly.services.shortner.httpx.AsyncClient") as MockAsyncClient:
-        mock_client_instance = MagicMock()
+    with patch("linkly.services.analytics.geoip_api") as mock_client_instance:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"city": "", "country": ""}
         mock_client_instance.get = AsyncMock(return_value=mock_response)
 
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__ = AsyncMock(return_value=mock_client_instance)
-        mock_context_manager.__aexit__ = AsyncMock(return_value=None)
-
-        MockAsyncClient.return_value = mock_context_manager
-
         from linkly.services.shortner import url_analytics
 
         await url_analytics("http://localhost:8000/abc123", mock_request, mock_db_cm)
 
     # Verify location is None when empty
-    mock_db_cm.url_analytics.insert_one.assert_called_once()
-    insert_args = mock_db_cm.url_analytics.insert_one.call_args[0][0]
-    assert insert_args["click_details"][0]["location"] is None
+    mock_db_cm.url_analytics_buckets.bulk_write.assert_called_once()
+    clicks = stored_clicks(mock_db_cm)
+    assert clicks[0]["location"] is None
 
 
 @pytest.mark.asyncio
-async def test_url_analytics_fingerprint_generation_robust(mock_db_cm):
+async def test_url_analytics_fingerprint_generation_robust(mock_db_cm, fake_redis):
     """Test fingerprint generation is consistent - Robust version"""
     # Create a request with specific IP and user agent
     request = MagicMock()
@@ -322,32 +320,25 @@ async def test_url_analytics_fingerprint_generation_robust(mock_db_cm):
     client.host = "192.168.1.100"
     request.client = client
 
-    mock_db_cm.url_analytics.find_one = AsyncMock(return_value=None)
-    mock_db_cm.url_analytics.insert_one = AsyncMock(return_value=None)
-
     # Mock successful API response
-    with patch("linkly.services.shortner.httpx.AsyncClient") as MockAsyncClient:
-        mock_client_instance = MagicMock()
+    with patch("linkly.services.analytics.geoip_api") as mock_client_instance:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"city": "TestCity", "country": "TestCountry"}
         mock_client_instance.get = AsyncMock(return_value=mock_response)
 
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__ = AsyncMock(return_value=mock_client_instance)
-        mock_context_manager.__aexit__ = AsyncMock(return_value=None)
-
-        MockAsyncClient.return_value = mock_context_manager
-
         from linkly.services.shortner import url_analytics
 
         await url_analytics("http://localhost:8000/abc123", request, mock_db_cm)
 
     # Verify fingerprint is generated correctly (IP + user-agent, lowercase)
-    mock_db_cm.url_analytics.insert_one.assert_called_once()
-    insert_args = mock_db_cm.url_analytics.insert_one.call_args[0][0]
+    mock_db_cm.url_analytics_buckets.bulk_write.assert_called_once()
     expected_fingerprint = "192.168.1.100testbrowser/1.0"
-    assert insert_args["finger_print"][0] == expected_fingerprint
+    from linkly.services.visitors import dedup_key
+
+    assert stored_dedup_keys(fake_redis) == [
+        dedup_key("http://localhost:8000/abc123", expected_fingerprint)
+    ]
 
 
 # @pytest.mark.asyncio
@@ -406,28 +397,18 @@ async def test_url_analytics_missing_user_agent_robust(mock_db_cm):
     client.host = "192.168.1.1"
     request.client = client
 
-    mock_db_cm.url_analytics.find_one = AsyncMock(return_value=None)
-    mock_db_cm.url_analytics.insert_one = AsyncMock(return_value=None)
-
     # Mock successful API response
-    with patch("linkly.services.shortner.httpx.AsyncClient") as MockAsyncClient:
-        mock_client_instance = MagicMock()
+    with patch("linkly.services.analytics.geoip_api") as mock_client_instance:
         mock_response = MagicMock()
         mock_response.status_code = 200
         mock_response.json.return_value = {"city": "Paris", "country": "France"}
         mock_client_instance.get = AsyncMock(return_value=mock_response)
 
-        mock_context_manager = AsyncMock()
-        mock_context_manager.__aenter__ = AsyncMock(return_value=mock_client_instance)
-        mock_context_manager.__aexit__ = AsyncMock(return_value=None)
-
-        MockAsyncClient.return_value = mock_context_manager
-
         from linkly.services.shortner import url_analytics
 
         await url_analytics("http://localhost:8000/abc123", request, mock_db_cm)
 
     # Verify user_agent defaults to "unknown"
-    mock_db_cm.url_analytics.insert_one.assert_called_once()
-    insert_args = mock_db_cm.url_analytics.insert_one.call_args[0][0]
-    assert insert_args["click_details"][0]["user_agent"] == "unknown"
+    mock_db_cm.url_analytics_buckets.bulk_write.assert_called_once()
+    clicks = stored_clicks(mock_db_cm)
+    assert clicks[0]["user_agent"] == "unknown"
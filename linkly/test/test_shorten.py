@@ -0,0 +1,94 @@
+"""
+Batch shortening tests
+"""
+
+import string
+from unittest.mock import AsyncMock, MagicMock
+
+import pytest
+from fastapi import HTTPException
+from pymongo.errors import BulkWriteError
+
+from linkly.services.expiry import EXPIRY_SCHEDULE
+from linkly.services.shortner import shorten_urls
+from linkly.utils.encode_url import ShortIdAllocator
+
+# ==================== FIXTURES ====================
+
+
+@pytest.fixture(autouse=True)
+def short_ids(monkeypatch, fake_redis):
+    monkeypatch.setattr(
+        "linkly.utils.encode_url.settings.BASE62",
+        string.digits + string.ascii_uppercase + string.ascii_lowercase,
+    )
+    monkeypatch.setattr(
+        "linkly.services.shortner.settings.LOCAL_HOST", "http://localhost:8000"
+    )
+    monkeypatch.setattr("linkly.services.shortner.redis_client", fake_redis)
+    lease = AsyncMock(return_value=0)
+    allocator = ShortIdAllocator(lease, length=6, block_size=1000)
+    monkeypatch.setattr("linkly.services.shortner.short_ids", allocator)
+    return lease
+
+
+@pytest.fixture
+def mock_db_cm():
+    mock_db = MagicMock()
+    mock_db.urls.insert_many = AsyncMock(return_value=None)
+    return mock_db
+
+
+# ==================== BATCH TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_shorten_urls_single_insert_and_single_zadd(
+    mock_db_cm, short_ids, fake_redis
+):
+    items = [(f"https://example.com/{i}", 60 if i % 2 else None) for i in range(10)]
+
+    results = await shorten_urls(items, mock_db_cm)
+
+    short_ids.assert_called_once_with(1000)
+    mock_db_cm.urls.insert_many.assert_called_once()
+    docs = mock_db_cm.urls.insert_many.call_args[0][0]
+    assert mock_db_cm.urls.insert_many.call_args[1] == {"ordered": False}
+    assert len({doc["short_id"] for doc in docs}) == 10
+
+    assert [r["original_url"] for r in results] == [url for url, _ in items]
+    assert all(r["error"] is None and r["short_url"] for r in results)
+    scheduled = fake_redis.data[EXPIRY_SCHEDULE]
+    assert set(scheduled) == {doc["short_id"] for doc in docs if doc["expiry"]}
+    assert len(scheduled) == 5
+
+
+@pytest.mark.asyncio
+async def test_shorten_urls_reports_failed_items(mock_db_cm, fake_redis):
+    mock_db_cm.urls.insert_many.side_effect = BulkWriteError(
+        {"writeErrors": [{"index": 1, "errmsg": "duplicate key"}]}
+    )
+    items = [("https://a.com", 60), ("https://b.com", 60), ("https://c.com", None)]
+
+    results = await shorten_urls(items, mock_db_cm)
+
+    assert results[1] == {
+        "original_url": "https://b.com",
+        "short_url": None,
+        "expiry": 60,
+        "error": "duplicate key",
+    }
+    assert results[0]["short_url"] and results[2]["short_url"]
+    # the link that was never stored is not scheduled for expiry
+    assert len(fake_redis.data[EXPIRY_SCHEDULE]) == 1
+
+
+@pytest.mark.asyncio
+async def test_shorten_urls_rejects_oversized_batch(mock_db_cm, monkeypatch):
+    monkeypatch.setattr("linkly.services.shortner.settings.SHORTEN_BATCH_LIMIT", 2)
+
+    with pytest.raises(HTTPException) as exc:
+        await shorten_urls([("https://a.com", None)] * 3, mock_db_cm)
+
+    assert exc.value.status_code == 413
+    mock_db_cm.urls.insert_many.assert_not_called()
@@ -0,0 +1,78 @@
+"""
+Request coalescing tests
+"""
+
+import asyncio
+
+import pytest
+
+from linkly.utils.singleflight import SingleFlight
+
+# ==================== IN-PROCESS TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_concurrent_callers_share_one_call():
+    flight = SingleFlight()
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return "https://example.com"
+
+    results = await asyncio.gather(*(flight.do("abc12", lookup) for _ in range(50)))
+
+    assert results == ["https://example.com"] * 50
+    assert calls == 1
+    assert flight.shared == 49
+    assert not flight.in_flight("abc12")
+
+
+@pytest.mark.asyncio
+async def test_failure_reaches_every_waiter_and_is_not_cached():
+    flight = SingleFlight()
+
+    async def broken():
+        await asyncio.sleep(0.01)
+        raise RuntimeError("mongo down")
+
+    results = await asyncio.gather(
+        *(flight.do("abc12", broken) for _ in range(3)), return_exceptions=True
+    )
+    assert all(isinstance(r, RuntimeError) for r in results)
+
+    async def working():
+        return "https://example.com"
+
+    assert await flight.do("abc12", working) == "https://example.com"
+
+
+# ==================== CROSS-WORKER TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_second_worker_waits_for_lock_holder(fake_redis):
+    shared_cache = {}
+    leader = SingleFlight(fake_redis, lock_ttl=1, poll_interval=0.001)
+    follower = SingleFlight(fake_redis, lock_ttl=1, poll_interval=0.001)
+    calls = 0
+
+    async def lookup():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        shared_cache["abc12"] = "https://example.com"
+        return "https://example.com"
+
+    async def peek():
+        return shared_cache.get("abc12")
+
+    results = await asyncio.gather(
+        leader.do("abc12", lookup, peek), follower.do("abc12", lookup, peek)
+    )
+
+    assert results == ["https://example.com"] * 2
+    assert calls == 1
+    assert "singleflight:abc12" not in fake_redis.data
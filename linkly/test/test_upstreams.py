@@ -0,0 +1,162 @@
+"""
+Outbound http layer tests
+"""
+
+import asyncio
+
+import httpx
+import pytest
+
+from linkly.services.upstreams import (
+    CircuitBreaker,
+    CircuitOpen,
+    Upstream,
+    UpstreamBusy,
+)
+
+# ==================== FIXTURES ====================
+
+
+def make_upstream(handler, **options) -> Upstream:
+    options.setdefault("backoff", 0)
+    return Upstream(
+        "test",
+        "http://upstream.test",
+        transport=httpx.MockTransport(handler),
+        **options,
+    )
+
+
+def responder(*statuses):
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        status = statuses[min(len(calls), len(statuses)) - 1]
+        if status is None:
+            raise httpx.ConnectError("refused", request=request)
+        return httpx.Response(status, json={"ok": status == 200})
+
+    return handler, calls
+
+
+# ==================== RETRY TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_get_retries_server_errors():
+    handler, calls = responder(503, None, 200)
+    upstream = make_upstream(handler, retries=2)
+
+    response = await upstream.get("/json/8.8.8.8")
+
+    assert response.status_code == 200
+    assert len(calls) == 3
+    assert str(calls[0].url) == "http://upstream.test/json/8.8.8.8"
+    assert upstream.stats()["retried"] == 2
+    assert upstream.breaker.state == "closed"
+    await upstream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_post_is_not_retried():
+    handler, calls = responder(503, 200)
+    upstream = make_upstream(handler, retries=2)
+
+    response = await upstream.post("/token")
+
+    assert response.status_code == 503
+    assert len(calls) == 1
+    await upstream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_client_errors_are_returned_not_retried():
+    handler, calls = responder(404)
+    upstream = make_upstream(handler, retries=2)
+
+    response = await upstream.get("/missing")
+
+    assert response.status_code == 404
+    assert len(calls) == 1
+    assert upstream.breaker.failures == 0
+    await upstream.aclose()
+
+
+# ==================== CIRCUIT BREAKER TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_circuit_opens_after_consecutive_failures():
+    handler, calls = responder(None)
+    upstream = make_upstream(handler, retries=0, breaker=CircuitBreaker(2, 60))
+
+    for _ in range(2):
+        with pytest.raises(httpx.ConnectError):
+            await upstream.get("/")
+    with pytest.raises(CircuitOpen):
+        await upstream.get("/")
+
+    assert len(calls) == 2
+    assert upstream.stats()["circuit"] == "open"
+    assert upstream.stats()["rejected"] == 1
+    await upstream.aclose()
+
+
+@pytest.mark.asyncio
+async def test_half_open_trial_closes_circuit():
+    handler, calls = responder(None, 200)
+    breaker = CircuitBreaker(1, 60)
+    upstream = make_upstream(handler, retries=0, breaker=breaker)
+
+    with pytest.raises(httpx.ConnectError):
+        await upstream.get("/")
+    assert breaker.state == "open"
+
+    breaker.opened_at -= 60
+    assert breaker.state == "half-open"
+    response = await upstream.get("/")
+
+    assert response.status_code == 200
+    assert breaker.state == "closed"
+    await upstream.aclose()
+
+
+def test_failed_trial_reopens_circuit():
+    breaker = CircuitBreaker(3, 60)
+    breaker.failure()
+    breaker.failure()
+    breaker.failure()
+    breaker.opened_at -= 60
+
+    assert breaker.allow()
+    # only one trial call at a time
+    assert not breaker.allow()
+    breaker.failure()
+    assert breaker.state == "open"
+
+
+# ==================== CONCURRENCY TESTS ====================
+
+
+@pytest.mark.asyncio
+async def test_concurrency_is_bounded():
+    release = asyncio.Event()
+
+    async def handler(request):
+        await release.wait()
+        return httpx.Response(200)
+
+    upstream = make_upstream(handler, max_concurrency=1, pool_timeout=0.05)
+
+    first = asyncio.create_task(upstream.get("/slow"))
+    await asyncio.sleep(0)
+    with pytest.raises(UpstreamBusy):
+        await upstream.get("/slow")
+
+    release.set()
+    assert (await first).status_code == 200
+    stats = upstream.stats()
+    assert stats["in_flight"] == 0
+    assert stats["latency_ms"]["p50"] is not None
+    await upstream.aclose()
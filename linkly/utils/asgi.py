@@ -0,0 +1,41 @@
+"""
+Small ASGI helpers.
+"""
+
+
+class PathScoped:
+    """
+    Apply ``middleware`` only to requests whose path starts with one of
+    ``prefixes``; every other request skips it.
+
+    ``app.add_middleware(PathScoped, prefixes=("/auth/",), middleware=SessionMiddleware, ...)``
+    """
+
+    def __init__(self, app, prefixes: tuple[str, ...], middleware, **options):
+        self.app = app
+        self.prefixes = tuple(prefixes)
+        self.scoped = middleware(app, **options)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] in ("http", "websocket") and scope["path"].startswith(
+            self.prefixes
+        ):
+            await self.scoped(scope, receive, send)
+        else:
+            await self.app(scope, receive, send)
+
+
+def iter_routes(routes, prefix: str = ""):
+    """
+    Yield ``(path, route)`` for every route, included routers flattened.
+    fastapi 0.115 flattens them at include time; newer versions keep the
+    included router as a route of its own.
+    """
+    for route in routes:
+        included = getattr(route, "original_router", None)
+        if included is not None:
+            yield from iter_routes(
+                included.routes, prefix + route.include_context.prefix
+            )
+        else:
+            yield prefix + getattr(route, "path", ""), route
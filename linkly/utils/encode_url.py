@@ -1,35 +1,193 @@
 """
-Generates a unique short URL ID by converting a MongoDB ObjectId
-to a compact Base62-encoded string.
+Short id generation.
 
-Steps:
-1. Create a new MongoDB ObjectId (which is globally unique).
-2. Convert the ObjectId’s 24-character hex string to an integer.
-3. Encode this integer into a Base62 string using digits, uppercase,
-   and lowercase letters for compactness.
+``ShortIdAllocator`` hands out collision-free short ids:
 
-The resulting short ID is unique, collision-free, and shorter than
-the original ObjectId representation, suitable for URL shortening.
+1. Each worker leases a block of ``SHORT_ID_BLOCK_SIZE`` sequence numbers
+   with one atomic increment of a shared counter (a Mongo counter document
+   or a Redis ``INCRBY`` key).
+2. Ids inside the block are produced locally, with no further I/O.
+3. A sequence number is optionally run through ``IdPermutation``, a keyed
+   Feistel network over ``[0, 62 ** length)``, so consecutive ids do not
+   look consecutive.
+4. The result is encoded as fixed-length base62 with the ``BASE62`` alphabet.
+
+Every step is a bijection, so two distinct sequence numbers can never map
+to the same id. The permutation secret must never change once ids exist.
+
+``ShortIdGenerator`` is the original ObjectId based encoder, kept for the
+base62 helpers.
 """
 
+import asyncio
+import hashlib
+from typing import Awaitable, Callable
+
 from bson import ObjectId
+from pymongo import ReturnDocument
 
 from linkly.settings import settings
 
+# lease(count) reserves `count` sequence numbers and returns the first one
+Lease = Callable[[int], Awaitable[int]]
+
 
 class ShortIdGenerator:
     @classmethod
-    def encode_base62(cls, num: int) -> str:
+    def encode_base62(cls, num: int, length: int = 0) -> str:
+        alphabet = settings.BASE62
         if num == 0:
-            return settings.BASE62[0]
+            return alphabet[0] * max(length, 1)
         base62 = []
         while num:
             num, rem = divmod(num, 62)
-            base62.append(settings.BASE62[rem])
-        return "".join(reversed(base62))
+            base62.append(alphabet[rem])
+        return "".join(reversed(base62)).rjust(length, alphabet[0])
+
+    @classmethod
+    def decode_base62(cls, value: str) -> int:
+        alphabet = settings.BASE62
+        num = 0
+        for char in value:
+            index = alphabet.find(char)
+            if index < 0:
+                raise ValueError(f"{char!r} is not a base62 character")
+            num = num * 62 + index
+        return num
 
     @classmethod
     def generate(cls):
         obj = ObjectId()
         obj_id_int = int(str(obj), 16)
         return cls.encode_base62(obj_id_int)
+
+
+class IdPermutation:
+    """
+    Keyed bijection on ``[0, domain)``: a balanced Feistel network over the
+    smallest even number of bits that covers the domain, with cycle walking
+    to stay inside it.
+    """
+
+    def __init__(self, secret: str, domain: int, rounds: int = 4):
+        self.domain = domain
+        self.rounds = rounds
+        bits = max(2, (domain - 1).bit_length())
+        self.half = (bits + 1) // 2
+        self.mask = (1 << self.half) - 1
+        self.key = hashlib.blake2b(secret.encode()).digest()
+
+    def _f(self, value: int, round_: int) -> int:
+        digest = hashlib.blake2b(
+            value.to_bytes(16, "big"),
+            key=self.key,
+            digest_size=16,
+            salt=round_.to_bytes(16, "big"),
+        ).digest()
+        return int.from_bytes(digest, "big") & self.mask
+
+    def _encrypt(self, value: int) -> int:
+        left, right = value >> self.half, value & self.mask
+        for i in range(self.rounds):
+            left, right = right, left ^ self._f(right, i)
+        return (left << self.half) | right
+
+    def _decrypt(self, value: int) -> int:
+        left, right = value >> self.half, value & self.mask
+        for i in reversed(range(self.rounds)):
+            left, right = right ^ self._f(left, i), left
+        return (left << self.half) | right
+
+    def permute(self, value: int) -> int:
+        value = self._encrypt(value)
+        while value >= self.domain:
+            value = self._encrypt(value)
+        return value
+
+    def invert(self, value: int) -> int:
+        value = self._decrypt(value)
+        while value >= self.domain:
+            value = self._decrypt(value)
+        return value
+
+
+class ShortIdAllocator:
+    def __init__(
+        self,
+        lease: Lease,
+        length: int = 6,
+        block_size: int = 1000,
+        secret: str | None = None,
+    ):
+        self.lease = lease
+        self.length = length
+        self.block_size = block_size
+        self.domain = 62**length
+        self.permutation = IdPermutation(secret, self.domain) if secret else None
+        self._next = 0
+        self._end = 0
+        self._lock = asyncio.Lock()
+
+    def encode(self, sequence: int) -> str:
+        if sequence >= self.domain:
+            raise OverflowError(f"short id space of length {self.length} exhausted")
+        if self.permutation:
+            sequence = self.permutation.permute(sequence)
+        return ShortIdGenerator.encode_base62(sequence, self.length)
+
+    def decode(self, short_id: str) -> int:
+        """
+        Sequence number behind ``short_id`` (inverse of ``encode``).
+        """
+        value = ShortIdGenerator.decode_base62(short_id)
+        return self.permutation.invert(value) if self.permutation else value
+
+    async def next_id(self) -> str:
+        return (await self.allocate(1))[0]
+
+    async def allocate(self, count: int) -> list[str]:
+        """
+        Return ``count`` unique short ids, leasing new blocks only when the
+        current one runs out.
+        """
+        sequences: list[int] = []
+        async with self._lock:
+            while len(sequences) < count:
+                if self._next >= self._end:
+                    size = max(self.block_size, count - len(sequences))
+                    self._next = await self.lease(size)
+                    self._end = self._next + size
+                take = min(count - len(sequences), self._end - self._next)
+                sequences.extend(range(self._next, self._next + take))
+                self._next += take
+        return [self.encode(sequence) for sequence in sequences]
+
+
+def mongo_lease(get_db: Callable, name: str = "short_id") -> Lease:
+    """
+    Lease blocks from ``counters.{name}`` with an atomic ``$inc``. The
+    database is resolved on first use, not at import time.
+    """
+
+    async def lease(count: int) -> int:
+        doc = await get_db().counters.find_one_and_update(
+            {"_id": name},
+            {"$inc": {"seq": count}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+        )
+        return doc["seq"] - count
+
+    return lease
+
+
+def redis_lease(redis_client, key: str = "short-id-seq") -> Lease:
+    """
+    Lease blocks with ``INCRBY``. Only safe on a persistent redis: losing the
+    key restarts the sequence.
+    """
+
+    async def lease(count: int) -> int:
+        return await redis_client.incrby(key, count) - count
+
+    return lease
@@ -0,0 +1,180 @@
+"""
+Offline IP geolocation backed by a memory-mapped range table.
+
+The database is a single binary file compiled from a CSV range dump by
+``python -m linkly.commands.build_geoip``. IPv4 and IPv6 ranges live in two
+separate tables, sorted by start address. Each table is stored as three
+parallel arrays (big-endian start addresses, big-endian end addresses and
+little-endian location indexes), so a lookup is a binary search that compares
+raw byte slices of the mmap and never parses the whole file.
+
+Layout::
+
+    header        magic(8) v4_count(u32) v6_count(u32) loc_count(u32) pad(u32)
+    v4 table      starts[4 * n] ends[4 * n] locs[u32 * n]
+    v6 table      starts[16 * n] ends[16 * n] locs[u32 * n]
+    locations     offsets[u32 * (loc_count + 1)] utf-8 blob
+"""
+
+import ipaddress
+import mmap
+import os
+import struct
+from typing import Iterable
+
+from linkly.utils.lru import LRUCache
+
+MAGIC = b"LKGEO\x00\x01\x00"
+HEADER = struct.Struct("<8sIIII")
+
+# returned by GeoIPResolver.lookup when the local data has no answer
+MISSING = object()
+
+
+def _packed(ip: str) -> bytes:
+    address = ipaddress.ip_address(ip)
+    if address.version == 6 and address.ipv4_mapped:
+        address = address.ipv4_mapped
+    return address.packed
+
+
+def format_location(city: str | None, country: str | None) -> str | None:
+    return ", ".join(filter(None, [city, country])) or None
+
+
+def build_database(rows: Iterable[tuple[str, str, str | None]], path: str) -> int:
+    """
+    Compile ``(start_ip, end_ip, location)`` rows into a database file.
+    Returns the number of ranges written. Overlapping ranges are rejected.
+    """
+    tables: dict[int, list[tuple[bytes, bytes, int]]] = {4: [], 16: []}
+    locations: dict[str, int] = {}
+
+    for start_ip, end_ip, location in rows:
+        start, end = _packed(start_ip), _packed(end_ip)
+        if len(start) != len(end) or start > end:
+            raise ValueError(f"Invalid range {start_ip} - {end_ip}")
+        index = locations.setdefault(location or "", len(locations))
+        tables[len(start)].append((start, end, index))
+
+    for width, ranges in tables.items():
+        ranges.sort()
+        for previous, current in zip(ranges, ranges[1:]):
+            if current[0] <= previous[1]:
+                raise ValueError(f"Overlapping IPv{4 if width == 4 else 6} ranges")
+
+    blob = bytearray()
+    offsets = []
+    for name in locations:
+        offsets.append(len(blob))
+        blob += name.encode()
+    offsets.append(len(blob))
+
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, len(tables[4]), len(tables[16]), len(locations), 0))
+        for width in (4, 16):
+            ranges = tables[width]
+            f.write(b"".join(start for start, _, _ in ranges))
+            f.write(b"".join(end for _, end, _ in ranges))
+            f.write(struct.pack(f"<{len(ranges)}I", *(i for _, _, i in ranges)))
+        f.write(struct.pack(f"<{len(offsets)}I", *offsets))
+        f.write(blob)
+    os.replace(tmp_path, path)
+
+    return len(tables[4]) + len(tables[16])
+
+
+class GeoIPDatabase:
+    def __init__(self, path: str):
+        self._file = open(path, "rb")
+        self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, v4_count, v6_count, loc_count, _ = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"{path} is not a linkly geoip database")
+
+        offset = HEADER.size
+        self._tables = {}
+        for width, count in ((4, v4_count), (16, v6_count)):
+            starts = offset
+            ends = starts + width * count
+            locs = ends + width * count
+            self._tables[width] = (count, starts, ends, locs)
+            offset = locs + 4 * count
+
+        self._offsets = offset
+        self._blob = offset + 4 * (loc_count + 1)
+        self.size = v4_count + v6_count
+
+    def lookup(self, ip: str) -> str | None:
+        try:
+            key = _packed(ip)
+        except ValueError:
+            return None
+
+        width = len(key)
+        count, starts, ends, locs = self._tables[width]
+        mm = self._mm
+
+        # rightmost range whose start <= key
+        lo, hi = 0, count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            at = starts + mid * width
+            if mm[at : at + width] <= key:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo == 0:
+            return None
+
+        i = lo - 1
+        at = ends + i * width
+        if mm[at : at + width] < key:
+            return None
+
+        (index,) = struct.unpack_from("<I", mm, locs + 4 * i)
+        start, end = struct.unpack_from("<II", mm, self._offsets + 4 * index)
+        return mm[self._blob + start : self._blob + end].decode() or None
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+class GeoIPResolver:
+    """
+    Local database plus an LRU of recently resolved IPs. ``lookup`` returns
+    ``MISSING`` when neither knows the IP, so callers can fall back to a remote
+    lookup and ``remember`` its answer.
+    """
+
+    def __init__(self, database: GeoIPDatabase | None, cache_size: int = 4096):
+        self.database = database
+        self.cache = LRUCache(maxsize=cache_size)
+
+    @classmethod
+    def open(cls, path: str | None, cache_size: int = 4096) -> "GeoIPResolver":
+        database = None
+        if path:
+            try:
+                database = GeoIPDatabase(path)
+            except (OSError, ValueError) as e:
+                print(f"[!] GeoIP database not loaded: {e}")
+        return cls(database, cache_size)
+
+    def lookup(self, ip: str):
+        location = self.cache.get(ip, MISSING)
+        if location is not MISSING or self.database is None:
+            return location
+
+        location = self.database.lookup(ip)
+        if location is None:
+            return MISSING
+        self.cache.set(ip, location)
+        return location
+
+    def remember(self, ip: str, location: str | None) -> None:
+        self.cache.set(ip, location)
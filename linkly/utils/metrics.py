@@ -0,0 +1,277 @@
+"""
+Minimal Prometheus style metrics.
+
+``Counter``, ``Gauge`` and ``Histogram`` keep their samples in plain dicts
+keyed by the label values, so recording one is a lock, a dict lookup and an
+addition. ``Collector`` metrics have no samples of their own: a callback
+reads them from existing state (cache stats, queue sizes, ...) when a
+snapshot is taken, so they cost nothing on the request path.
+
+``Registry.snapshot`` turns everything into a JSON serialisable dict.
+Snapshots of several workers are combined with ``merge`` (counters and
+histograms add up, gauges add up or take the maximum, as declared) and
+``render`` writes the text exposition format. A worker's counters start over
+when it restarts, so a sum over workers can go down; ``label_worker`` gives
+counters and histograms a ``worker`` label first, keeping every series
+monotonic.
+
+Recording is thread safe: the Mongo command listener runs in motor's worker
+threads.
+"""
+
+import math
+import threading
+from bisect import bisect_left
+from typing import Callable, Iterable
+
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)  # fmt: skip
+
+Labels = tuple[str, ...]
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(
+        self, name: str, help: str, labels: Iterable[str] = (), merge: str = "sum"
+    ):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.merge = merge
+        self._lock = threading.Lock()
+
+    def samples(self) -> list[list]:
+        raise NotImplementedError
+
+    def snapshot(self) -> dict:
+        return {
+            "kind": self.kind,
+            "help": self.help,
+            "labels": list(self.labels),
+            "merge": self.merge,
+            "samples": self.samples(),
+        }
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: Iterable[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        with self._lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+    def samples(self) -> list[list]:
+        with self._lock:
+            return [[list(labels), value] for labels, value in self.values.items()]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def __init__(
+        self, name: str, help: str, labels: Iterable[str] = (), merge: str = "sum"
+    ):
+        super().__init__(name, help, labels)
+        self.merge = merge
+
+    def set(self, value: float, *labels: str) -> None:
+        with self._lock:
+            self.values[labels] = value
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+        # per label values: [count per bucket (last one is +Inf)..., sum]
+        self.values: dict[Labels, list[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            row = self.values.get(labels)
+            if row is None:
+                row = self.values[labels] = [0] * (len(self.buckets) + 2)
+            row[index] += 1
+            row[-1] += value
+
+    def samples(self) -> list[list]:
+        with self._lock:
+            return [[list(labels), list(row)] for labels, row in self.values.items()]
+
+    def snapshot(self) -> dict:
+        snapshot = super().snapshot()
+        snapshot["buckets"] = list(self.buckets)
+        return snapshot
+
+
+class Collector(Metric):
+    """
+    A counter or gauge read from ``collect()`` when a snapshot is taken.
+    ``collect`` returns ``(label values, value)`` pairs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        collect: Callable[[], Iterable[tuple[Labels, float]]],
+        kind: str = "gauge",
+        labels: Iterable[str] = (),
+        merge: str = "sum",
+    ):
+        super().__init__(name, help, labels, merge)
+        self.kind = kind
+        self.collect = collect
+
+    def samples(self) -> list[list]:
+        return [[list(labels), value] for labels, value in self.collect()]
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        if metric.name in self.metrics:
+            raise ValueError(f"Metric {metric.name} is already registered")
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labels: Iterable[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labels))
+
+    def gauge(
+        self, name: str, help: str, labels: Iterable[str] = (), merge: str = "sum"
+    ) -> Gauge:
+        return self.register(Gauge(name, help, labels, merge))
+
+    def histogram(
+        self,
+        name: str,
+        help: str,
+        labels: Iterable[str] = (),
+        buckets: tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> Histogram:
+        return self.register(Histogram(name, help, labels, buckets))
+
+    def collector(self, name: str, help: str, collect, **options) -> Collector:
+        return self.register(Collector(name, help, collect, **options))
+
+    def snapshot(self) -> dict:
+        snapshot = {}
+        for name, metric in self.metrics.items():
+            try:
+                snapshot[name] = metric.snapshot()
+            except Exception as e:
+                # one broken collector must not take the endpoint down
+                print(f"[!] Collecting metric {name} failed: {e}")
+        return snapshot
+
+
+def merge(snapshots: list[dict]) -> dict:
+    """
+    Combine the snapshots of several workers into one.
+    """
+    merged: dict = {}
+    for snapshot in snapshots:
+        for name, metric in snapshot.items():
+            target = merged.setdefault(name, {**metric, "samples": {}})
+            samples = target["samples"]
+            for labels, value in metric["samples"]:
+                key = tuple(labels)
+                if key not in samples:
+                    samples[key] = list(value) if isinstance(value, list) else value
+                elif metric["kind"] == "histogram":
+                    samples[key] = [a + b for a, b in zip(samples[key], value)]
+                elif metric.get("merge") == "max":
+                    samples[key] = max(samples[key], value)
+                else:
+                    samples[key] += value
+
+    for metric in merged.values():
+        metric["samples"] = [[list(k), v] for k, v in metric["samples"].items()]
+    return merged
+
+
+def label_worker(snapshot: dict, worker: str) -> dict:
+    """
+    Add a ``worker`` label to the counters and histograms of ``snapshot``, so
+    ``merge`` keeps one series per worker instead of summing them. Gauges
+    are merged as before.
+    """
+    labelled = {}
+    for name, metric in snapshot.items():
+        if metric["kind"] in ("counter", "histogram"):
+            metric = {
+                **metric,
+                "labels": [*metric["labels"], "worker"],
+                "samples": [[[*labels, worker], v] for labels, v in metric["samples"]],
+            }
+        labelled[name] = metric
+    return labelled
+
+
+def _format_labels(names: list[str], values: list[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)] + (
+        [extra] if extra else []
+    )
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    if value == math.inf:
+        return "+Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+
+def render(snapshot: dict) -> str:
+    """
+    Text exposition format (version 0.0.4).
+    """
+    lines = []
+    for name, metric in sorted(snapshot.items()):
+        lines.append(f"# HELP {name} {metric['help']}")
+        lines.append(f"# TYPE {name} {metric['kind']}")
+        names = metric["labels"]
+        for values, value in metric["samples"]:
+            if metric["kind"] != "histogram":
+                lines.append(f"{name}{_format_labels(names, values)} {_number(value)}")
+                continue
+            cumulative = 0
+            bounds = [*metric["buckets"], math.inf]
+            for bound, count in zip(bounds, value[:-1]):
+                cumulative += count
+                le = f'le="{_number(bound)}"'
+                labels = _format_labels(names, values, le)
+                lines.append(f"{name}_bucket{labels} {_number(cumulative)}")
+            labels = _format_labels(names, values)
+            lines.append(f"{name}_sum{labels} {_number(value[-1])}")
+            lines.append(f"{name}_count{labels} {_number(cumulative)}")
+    return "\n".join(lines) + "\n"
+
+
+# process wide default registry
+registry = Registry()
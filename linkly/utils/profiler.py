@@ -0,0 +1,234 @@
+"""
+Wall clock sampling profiler for asyncio tasks.
+
+``Sampler`` runs one daemon thread while at least one task is profiled and
+every ``interval`` seconds records, for each profiled task:
+
+* the event loop thread's stack, cut at the task's root coroutine, when the
+  task is the one running;
+* the chain of coroutines it is suspended in, ending in ``(waiting)``, when
+  it waits for I/O or another task holds the loop.
+
+So a request's profile shows where its latency went, time spent waiting on
+Mongo or Redis included. Stacks are ``tuple[str, ...]`` of frame labels,
+root first, counted in a ``collections.Counter``.
+
+The thread only exists while something is profiled; tasks that are not
+profiled cost nothing.
+
+Encoders write the counters as collapsed stacks (``a;b;c 12``, read by
+flamegraph.pl and speedscope), as speedscope JSON, or as an SVG flame graph.
+"""
+
+import asyncio
+import html
+import sys
+import threading
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+
+WAITING = "(waiting)"
+
+Stack = tuple[str, ...]
+
+_labels: dict = {}
+
+
+def _label(frame) -> str:
+    code = frame.f_code
+    label = _labels.get(code)
+    if label is None:
+        module = frame.f_globals.get("__name__", "?")
+        label = _labels[code] = f"{module}:{code.co_qualname}".replace(";", ",")
+    return label
+
+
+def _thread_stack(frame, root) -> list[str]:
+    frames = []
+    while frame is not None:
+        frames.append(frame)
+        if frame is root:
+            break
+        frame = frame.f_back
+    return [_label(f) for f in reversed(frames)]
+
+
+def _await_stack(coro) -> list[str]:
+    stack = []
+    while coro is not None:
+        frame = getattr(coro, "cr_frame", None) or getattr(coro, "gi_frame", None)
+        if frame is None:
+            break
+        stack.append(_label(frame))
+        coro = getattr(coro, "cr_await", None) or getattr(coro, "gi_yieldfrom", None)
+    # a task that has not started or already finished has no frames
+    if stack:
+        stack.append(WAITING)
+    return stack
+
+
+def task_stack(task: asyncio.Task, loop, thread_frame) -> Stack:
+    """
+    Stack of ``task`` right now, seen from another thread.
+    """
+    coro = task.get_coro()
+    if thread_frame is not None and asyncio.current_task(loop) is task:
+        return tuple(_thread_stack(thread_frame, getattr(coro, "cr_frame", None)))
+    return tuple(_await_stack(coro))
+
+
+@dataclass
+class Profile:
+    loop: asyncio.AbstractEventLoop
+    thread_id: int
+    started: float = field(default_factory=time.time)
+    stacks: Counter = field(default_factory=Counter)
+
+
+class Sampler:
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._active: dict[asyncio.Task, Profile] = {}
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+
+    def begin(self, task: asyncio.Task) -> Profile:
+        profile = Profile(task.get_loop(), threading.get_ident())
+        with self._lock:
+            self._active[task] = profile
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name="linkly-profiler", daemon=True
+                )
+                self._thread.start()
+        return profile
+
+    def end(self, task: asyncio.Task) -> Profile:
+        with self._lock:
+            return self._active.pop(task)
+
+    def sample(self) -> None:
+        frames = sys._current_frames()
+        for task, profile in self._active.items():
+            stack = task_stack(task, profile.loop, frames.get(profile.thread_id))
+            if stack:
+                profile.stacks[stack] += 1
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                if not self._active:
+                    self._thread = None
+                    return
+                self.sample()
+            time.sleep(self.interval)
+
+
+# ---- encoders ----
+
+
+def to_collapsed(stacks: Counter) -> str:
+    return "".join(f"{';'.join(stack)} {count}\n" for stack, count in stacks.items())
+
+
+def from_collapsed(text: str) -> Counter:
+    stacks = Counter()
+    for line in text.splitlines():
+        stack, _, count = line.rpartition(" ")
+        if stack:
+            stacks[tuple(stack.split(";"))] += int(count)
+    return stacks
+
+
+def to_speedscope(stacks: Counter, name: str, interval: float) -> dict:
+    """
+    One sampled profile, weights in milliseconds.
+    """
+    frames: dict[str, int] = {}
+    samples, weights = [], []
+    for stack, count in stacks.items():
+        samples.append([frames.setdefault(label, len(frames)) for label in stack])
+        weights.append(count * interval * 1000)
+    total = sum(weights)
+    return {
+        "$schema": "https://www.speedscope.app/file-format-schema.json",
+        "exporter": "linkly",
+        "name": name,
+        "shared": {"frames": [{"name": label} for label in frames]},
+        "profiles": [
+            {
+                "type": "sampled",
+                "name": name,
+                "unit": "milliseconds",
+                "startValue": 0,
+                "endValue": total,
+                "samples": samples,
+                "weights": weights,
+            }
+        ],
+    }
+
+
+def from_speedscope(document: dict, interval: float) -> Counter:
+    labels = [frame["name"] for frame in document["shared"]["frames"]]
+    stacks = Counter()
+    for profile in document["profiles"]:
+        for sample, weight in zip(profile["samples"], profile["weights"]):
+            count = max(1, round(weight / (interval * 1000)))
+            stacks[tuple(labels[i] for i in sample)] += count
+    return stacks
+
+
+def to_svg(stacks: Counter, title: str, width: int = 1200, row: int = 16) -> str:
+    """
+    Flame graph, root at the bottom, hover a frame for its share.
+    """
+    tree: dict = {}
+    for stack, count in stacks.items():
+        node = tree
+        for label in stack:
+            entry = node.setdefault(label, [0, {}])
+            entry[0] += count
+            node = entry[1]
+
+    total = sum(stacks.values()) or 1
+    rects = []
+    depth_max = 0
+
+    def draw(node: dict, x: float, depth: int) -> None:
+        nonlocal depth_max
+        depth_max = max(depth_max, depth)
+        for label, (count, children) in sorted(node.items()):
+            w = count / total * width
+            if w >= 0.5:
+                rects.append((x, depth, w, label, count))
+                draw(children, x, depth + 1)
+            x += w
+
+    draw(tree, 0, 0)
+    height = (depth_max + 1) * row + 2 * row
+    parts = [
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{width}" height="{height}" '
+        f'font-family="monospace" font-size="11">',
+        f'<text x="4" y="{row - 4}">{html.escape(title)} ({total} samples)</text>',
+    ]
+    for x, depth, w, label, count in rects:
+        y = height - (depth + 1) * row
+        # waiting frames are blue, the rest warm colours stable per label
+        hue = 210 if label == WAITING else sum(label.encode()) % 50
+        parts.append(
+            f"<g><title>{html.escape(label)} ({count} samples, {count / total:.1%})"
+            f'</title><rect x="{x:.1f}" y="{y}" width="{w:.1f}" '
+            f'height="{row - 1}" fill="hsl({hue},80%,60%)"/>'
+        )
+        # roughly 7px per character at font-size 11
+        chars = int(w / 7)
+        if chars > 2:
+            shown = label if len(label) <= chars else label[: chars - 2] + ".."
+            parts.append(
+                f'<text x="{x + 2:.1f}" y="{y + row - 4}">{html.escape(shown)}</text>'
+            )
+        parts.append("</g>")
+    parts.append("</svg>")
+    return "\n".join(parts)
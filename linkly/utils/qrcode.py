@@ -0,0 +1,418 @@
+"""
+Pure Python QR code encoder (ISO/IEC 18004), byte mode only.
+
+``QRCode.encode(data, ecc)`` picks the smallest version (1-40) that fits the
+data at the requested error correction level (L, M, Q or H), lays out the
+function patterns, Reed-Solomon encodes and interleaves the codewords and
+applies the data mask with the lowest penalty. The result is a square
+matrix of booleans (True = dark) that ``to_png`` and ``to_svg`` render with
+a quiet zone of ``margin`` modules around it.
+
+No third party imaging library is needed: PNGs are written with ``zlib``
+and ``struct`` as 1-bit grayscale images.
+"""
+
+import struct
+import zlib
+from typing import Literal
+
+ErrorCorrection = Literal["L", "M", "Q", "H"]
+
+# format bits of each level, as laid out in the format information
+ECC_FORMAT_BITS = {"L": 1, "M": 0, "Q": 3, "H": 2}
+
+# error correction codewords per block, indexed by version (0 unused)
+ECC_CODEWORDS_PER_BLOCK = {
+    "L": (-1, 7, 10, 15, 20, 26, 18, 20, 24, 30, 18, 20, 24, 26, 30, 22, 24, 28, 30, 28, 28, 28, 28, 30, 30, 26, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),  # fmt: skip
+    "M": (-1, 10, 16, 26, 18, 24, 16, 18, 22, 22, 26, 30, 22, 22, 24, 24, 28, 28, 26, 26, 26, 26, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28, 28),  # fmt: skip
+    "Q": (-1, 13, 22, 18, 26, 18, 24, 18, 22, 20, 24, 28, 26, 24, 20, 30, 24, 28, 28, 26, 30, 28, 30, 30, 30, 30, 28, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),  # fmt: skip
+    "H": (-1, 17, 28, 22, 16, 22, 28, 26, 26, 24, 28, 24, 28, 22, 24, 24, 30, 28, 28, 26, 28, 30, 24, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30, 30),  # fmt: skip
+}
+
+# number of error correction blocks, indexed by version (0 unused)
+ECC_BLOCKS = {
+    "L": (-1, 1, 1, 1, 1, 1, 2, 2, 2, 2, 4, 4, 4, 4, 4, 6, 6, 6, 6, 7, 8, 8, 9, 9, 10, 12, 12, 12, 13, 14, 15, 16, 17, 18, 19, 19, 20, 21, 22, 24, 25),  # fmt: skip
+    "M": (-1, 1, 1, 1, 2, 2, 4, 4, 4, 5, 5, 5, 8, 9, 9, 10, 10, 11, 13, 14, 16, 17, 17, 18, 20, 21, 23, 25, 26, 28, 29, 31, 33, 35, 37, 38, 40, 43, 45, 47, 49),  # fmt: skip
+    "Q": (-1, 1, 1, 2, 2, 4, 4, 6, 6, 8, 8, 8, 10, 12, 16, 12, 17, 16, 18, 21, 20, 23, 23, 25, 27, 29, 34, 34, 35, 38, 40, 43, 45, 48, 51, 53, 56, 59, 62, 65, 68),  # fmt: skip
+    "H": (-1, 1, 1, 2, 4, 4, 4, 5, 6, 8, 8, 11, 11, 16, 16, 18, 16, 19, 21, 25, 25, 25, 34, 30, 32, 35, 37, 40, 42, 45, 48, 51, 54, 57, 60, 63, 66, 70, 74, 77, 81),  # fmt: skip
+}
+
+MASKS = (
+    lambda x, y: (x + y) % 2 == 0,
+    lambda x, y: y % 2 == 0,
+    lambda x, y: x % 3 == 0,
+    lambda x, y: (x + y) % 3 == 0,
+    lambda x, y: (x // 3 + y // 2) % 2 == 0,
+    lambda x, y: x * y % 2 + x * y % 3 == 0,
+    lambda x, y: (x * y % 2 + x * y % 3) % 2 == 0,
+    lambda x, y: ((x + y) % 2 + x * y % 3) % 2 == 0,
+)
+
+
+class DataTooLong(ValueError):
+    pass
+
+
+# ==================== GF(256) / REED-SOLOMON ====================
+
+_EXP = [0] * 512
+_LOG = [0] * 256
+_value = 1
+for _i in range(255):
+    _EXP[_i] = _value
+    _LOG[_value] = _i
+    _value <<= 1
+    if _value & 0x100:
+        _value ^= 0x11D
+for _i in range(255, 512):
+    _EXP[_i] = _EXP[_i - 255]
+
+
+def _gf_multiply(a: int, b: int) -> int:
+    if a == 0 or b == 0:
+        return 0
+    return _EXP[_LOG[a] + _LOG[b]]
+
+
+def _rs_divisor(degree: int) -> list[int]:
+    # coefficients of prod(x - 2^i) for i < degree, highest power dropped
+    result = [0] * (degree - 1) + [1]
+    root = 1
+    for _ in range(degree):
+        for j in range(degree):
+            result[j] = _gf_multiply(result[j], root)
+            if j + 1 < degree:
+                result[j] ^= result[j + 1]
+        root = _gf_multiply(root, 2)
+    return result
+
+
+def _rs_remainder(data: list[int], divisor: list[int]) -> list[int]:
+    result = [0] * len(divisor)
+    for byte in data:
+        factor = byte ^ result.pop(0)
+        result.append(0)
+        for i, coefficient in enumerate(divisor):
+            result[i] ^= _gf_multiply(coefficient, factor)
+    return result
+
+
+# ==================== LAYOUT HELPERS ====================
+
+
+def _raw_data_modules(version: int) -> int:
+    result = (16 * version + 128) * version + 64
+    if version >= 2:
+        alignments = version // 7 + 2
+        result -= (25 * alignments - 10) * alignments - 55
+        if version >= 7:
+            result -= 36
+    return result
+
+
+def _data_codewords(version: int, ecc: str) -> int:
+    return (
+        _raw_data_modules(version) // 8
+        - ECC_CODEWORDS_PER_BLOCK[ecc][version] * ECC_BLOCKS[ecc][version]
+    )
+
+
+def _alignment_positions(version: int) -> list[int]:
+    if version == 1:
+        return []
+    count = version // 7 + 2
+    step = (version * 8 + count * 3 + 5) // (count * 4 - 4) * 2
+    size = version * 4 + 17
+    positions = [size - 7 - i * step for i in range(count - 1)]
+    return [6] + sorted(positions)
+
+
+def _bits(value: int, length: int) -> list[int]:
+    return [(value >> i) & 1 for i in reversed(range(length))]
+
+
+class QRCode:
+    def __init__(self, version: int, ecc: str, modules: list[list[bool]]):
+        self.version = version
+        self.ecc = ecc
+        self.modules = modules
+        self.size = len(modules)
+
+    @classmethod
+    def encode(
+        cls, data: str | bytes, ecc: ErrorCorrection = "M", mask: int | None = None
+    ) -> "QRCode":
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        if ecc not in ECC_FORMAT_BITS:
+            raise ValueError(f"Unknown error correction level {ecc}")
+
+        for version in range(1, 41):
+            count_bits = 8 if version < 10 else 16
+            capacity = _data_codewords(version, ecc) * 8
+            if 4 + count_bits + len(data) * 8 <= capacity:
+                break
+        else:
+            raise DataTooLong(f"{len(data)} bytes do not fit in a QR code")
+
+        bits = _bits(0b0100, 4) + _bits(len(data), count_bits)
+        for byte in data:
+            bits += _bits(byte, 8)
+        bits += [0] * min(4, capacity - len(bits))
+        bits += [0] * (-len(bits) % 8)
+        codewords = [
+            int("".join(map(str, bits[i : i + 8])), 2) for i in range(0, len(bits), 8)
+        ]
+        pad = 0xEC
+        while len(codewords) < capacity // 8:
+            codewords.append(pad)
+            pad ^= 0xEC ^ 0x11
+
+        builder = _Builder(version, ecc)
+        builder.draw_function_patterns()
+        builder.draw_codewords(builder.add_ecc_and_interleave(codewords))
+        return cls(version, ecc, builder.finish(mask))
+
+    # ==================== RENDERING ====================
+
+    def rows(self, margin: int = 4):
+        quiet = [False] * (self.size + 2 * margin)
+        for _ in range(margin):
+            yield quiet
+        for row in self.modules:
+            yield [False] * margin + row + [False] * margin
+        for _ in range(margin):
+            yield quiet
+
+    def to_png(self, scale: int = 8, margin: int = 4) -> bytes:
+        """
+        1-bit grayscale PNG, ``scale`` pixels per module.
+        """
+        width = (self.size + 2 * margin) * scale
+        raw = bytearray()
+        for row in self.rows(margin):
+            bits = "".join("0" if dark else "1" for dark in row for _ in range(scale))
+            bits += "0" * (-len(bits) % 8)
+            line = b"\0" + int(bits, 2).to_bytes(len(bits) // 8, "big")
+            raw += line * scale
+
+        def chunk(kind: bytes, body: bytes) -> bytes:
+            crc = zlib.crc32(kind + body) & 0xFFFFFFFF
+            return struct.pack(">I", len(body)) + kind + body + struct.pack(">I", crc)
+
+        header = struct.pack(">IIBBBBB", width, width, 1, 0, 0, 0, 0)
+        return (
+            b"\x89PNG\r\n\x1a\n"
+            + chunk(b"IHDR", header)
+            + chunk(b"IDAT", zlib.compress(bytes(raw), 9))
+            + chunk(b"IEND", b"")
+        )
+
+    def to_svg(self, scale: int = 8, margin: int = 4) -> bytes:
+        """
+        SVG with one path; ``scale`` sets the rendered size of a module.
+        """
+        side = self.size + 2 * margin
+        path = "".join(
+            f"M{x + margin},{y + margin}h1v1h-1z"
+            for y, row in enumerate(self.modules)
+            for x, dark in enumerate(row)
+            if dark
+        )
+        return (
+            '<svg xmlns="http://www.w3.org/2000/svg" version="1.1" '
+            f'viewBox="0 0 {side} {side}" width="{side * scale}" '
+            f'height="{side * scale}" shape-rendering="crispEdges">'
+            '<rect width="100%" height="100%" fill="#fff"/>'
+            f'<path d="{path}" fill="#000"/></svg>'
+        ).encode()
+
+
+class _Builder:
+    def __init__(self, version: int, ecc: str):
+        self.version = version
+        self.ecc = ecc
+        self.size = version * 4 + 17
+        self.modules = [[False] * self.size for _ in range(self.size)]
+        self.reserved = [[False] * self.size for _ in range(self.size)]
+
+    def set(self, x: int, y: int, dark: bool) -> None:
+        self.modules[y][x] = dark
+        self.reserved[y][x] = True
+
+    def draw_function_patterns(self) -> None:
+        for i in range(self.size):
+            self.set(6, i, i % 2 == 0)
+            self.set(i, 6, i % 2 == 0)
+
+        for x, y in ((3, 3), (self.size - 4, 3), (3, self.size - 4)):
+            for dy in range(-4, 5):
+                for dx in range(-4, 5):
+                    xx, yy = x + dx, y + dy
+                    if 0 <= xx < self.size and 0 <= yy < self.size:
+                        self.set(xx, yy, max(abs(dx), abs(dy)) not in (2, 4))
+
+        positions = _alignment_positions(self.version)
+        last = len(positions) - 1
+        for i, x in enumerate(positions):
+            for j, y in enumerate(positions):
+                if (i, j) in ((0, 0), (0, last), (last, 0)):
+                    continue
+                for dy in range(-2, 3):
+                    for dx in range(-2, 3):
+                        self.set(x + dx, y + dy, max(abs(dx), abs(dy)) != 1)
+
+        # reserve the format areas now, they are written once the mask is known
+        self.draw_format_bits(0)
+        self.draw_version()
+
+    def draw_format_bits(self, mask: int) -> None:
+        data = ECC_FORMAT_BITS[self.ecc] << 3 | mask
+        remainder = data
+        for _ in range(10):
+            remainder = (remainder << 1) ^ ((remainder >> 9) * 0x537)
+        bits = (data << 10 | remainder) ^ 0x5412
+
+        def bit(i: int) -> bool:
+            return ((bits >> i) & 1) == 1
+
+        for i in range(6):
+            self.set(8, i, bit(i))
+        self.set(8, 7, bit(6))
+        self.set(8, 8, bit(7))
+        self.set(7, 8, bit(8))
+        for i in range(9, 15):
+            self.set(14 - i, 8, bit(i))
+
+        for i in range(8):
+            self.set(self.size - 1 - i, 8, bit(i))
+        for i in range(8, 15):
+            self.set(8, self.size - 15 + i, bit(i))
+        self.set(8, self.size - 8, True)
+
+    def draw_version(self) -> None:
+        if self.version < 7:
+            return
+        remainder = self.version
+        for _ in range(12):
+            remainder = (remainder << 1) ^ ((remainder >> 11) * 0x1F25)
+        bits = self.version << 12 | remainder
+        for i in range(18):
+            dark = ((bits >> i) & 1) == 1
+            a, b = self.size - 11 + i % 3, i // 3
+            self.set(a, b, dark)
+            self.set(b, a, dark)
+
+    def add_ecc_and_interleave(self, data: list[int]) -> list[int]:
+        blocks_count = ECC_BLOCKS[self.ecc][self.version]
+        ecc_len = ECC_CODEWORDS_PER_BLOCK[self.ecc][self.version]
+        raw_codewords = _raw_data_modules(self.version) // 8
+        short_blocks = blocks_count - raw_codewords % blocks_count
+        short_len = raw_codewords // blocks_count
+
+        divisor = _rs_divisor(ecc_len)
+        blocks = []
+        offset = 0
+        for i in range(blocks_count):
+            length = short_len - ecc_len + (0 if i < short_blocks else 1)
+            block = data[offset : offset + length]
+            offset += length
+            ecc = _rs_remainder(block, divisor)
+            if i < short_blocks:
+                # placeholder so every block has the same length while interleaving
+                block = block + [None]
+            blocks.append(block + ecc)
+
+        result = []
+        for i in range(len(blocks[0])):
+            for block in blocks:
+                if block[i] is not None:
+                    result.append(block[i])
+        return result
+
+    def draw_codewords(self, codewords: list[int]) -> None:
+        total = len(codewords) * 8
+        i = 0
+        right = self.size - 1
+        while right >= 1:
+            if right == 6:
+                right = 5
+            upward = ((right + 1) & 2) == 0
+            for vert in range(self.size):
+                y = self.size - 1 - vert if upward else vert
+                for x in (right, right - 1):
+                    if not self.reserved[y][x] and i < total:
+                        self.modules[y][x] = (
+                            (codewords[i >> 3] >> (7 - (i & 7))) & 1
+                        ) == 1
+                        i += 1
+            right -= 2
+
+    def apply_mask(self, mask: int) -> None:
+        test = MASKS[mask]
+        for y in range(self.size):
+            row, reserved = self.modules[y], self.reserved[y]
+            for x in range(self.size):
+                if not reserved[x] and test(x, y):
+                    row[x] = not row[x]
+
+    def finish(self, mask: int | None) -> list[list[bool]]:
+        if mask is None:
+            best = None
+            for candidate in range(8):
+                self.apply_mask(candidate)
+                self.draw_format_bits(candidate)
+                score = penalty(self.modules)
+                if best is None or score < best[0]:
+                    best = (score, candidate)
+                self.apply_mask(candidate)  # xor again to undo
+            mask = best[1]
+        self.apply_mask(mask)
+        self.draw_format_bits(mask)
+        return self.modules
+
+
+_FINDER_LIKE = ((1, 0, 1, 1, 1, 0, 1, 0, 0, 0, 0), (0, 0, 0, 0, 1, 0, 1, 1, 1, 0, 1))
+
+
+def penalty(modules: list[list[bool]]) -> int:
+    """
+    Mask penalty score (runs, 2x2 blocks, finder-like patterns, balance).
+    """
+    size = len(modules)
+    lines = [[int(v) for v in row] for row in modules]
+    columns = [list(column) for column in zip(*lines)]
+    score = 0
+
+    for line in lines + columns:
+        run = 1
+        for i in range(1, size):
+            if line[i] == line[i - 1]:
+                run += 1
+            else:
+                if run >= 5:
+                    score += run - 2
+                run = 1
+        if run >= 5:
+            score += run - 2
+
+        # the quiet zone counts as light modules around the symbol
+        padded = (0,) * 4 + tuple(line) + (0,) * 4
+        for i in range(size - 2):
+            if padded[i : i + 11] in _FINDER_LIKE:
+                score += 40
+
+    for y in range(size - 1):
+        for x in range(size - 1):
+            color = lines[y][x]
+            if (
+                color == lines[y][x + 1]
+                and color == lines[y + 1][x]
+                and color == lines[y + 1][x + 1]
+            ):
+                score += 3
+
+    dark = sum(map(sum, lines))
+    total = size * size
+    score += ((abs(dark * 20 - total * 10) + total - 1) // total - 1) * 10
+    return score
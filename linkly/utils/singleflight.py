@@ -0,0 +1,130 @@
+"""
+Request coalescing ("singleflight").
+
+``SingleFlight.do(key, fn)`` runs ``fn`` once per key at a time. Callers
+arriving while a call for the same key is in flight await that call's result
+(or exception) instead of starting their own.
+
+With a redis client the coalescing also spans workers: the worker that wins
+``SET {prefix}:{key} NX PX`` runs ``fn``; the others poll ``peek`` (usually
+a cache read) until the winner has published a value, and only run ``fn``
+themselves if the lock disappears or times out without one. The lock is
+short lived so a crashed holder cannot block a key for long.
+"""
+
+import asyncio
+import uuid
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class SingleFlight:
+    def __init__(
+        self,
+        redis_client=None,
+        prefix: str = "singleflight",
+        lock_ttl: float = 2.0,
+        poll_interval: float = 0.02,
+    ):
+        self.redis = redis_client
+        self.prefix = prefix
+        self.lock_ttl = lock_ttl
+        self.poll_interval = poll_interval
+        self.calls = 0
+        self.shared = 0
+        self._inflight: dict[Hashable, asyncio.Future] = {}
+
+    def in_flight(self, key: Hashable) -> bool:
+        return key in self._inflight
+
+    async def do(
+        self,
+        key: Hashable,
+        fn: Callable[[], Awaitable[Any]],
+        peek: Callable[[], Awaitable[Any]] | None = None,
+    ) -> Any:
+        future = self._inflight.get(key)
+        if future is not None:
+            self.shared += 1
+            try:
+                # shield: one caller giving up must not cancel the others
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                if not future.cancelled():
+                    raise
+                # the caller running fn was cancelled, not us: try again
+                return await self.do(key, fn, peek)
+
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            result = await self._call(key, fn, peek)
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except Exception as e:
+            future.set_exception(e)
+            # retrieved here so an unawaited failure is not reported as lost
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    async def _call(self, key, fn, peek) -> Any:
+        if self.redis is None:
+            self.calls += 1
+            return await fn()
+
+        lock = f"{self.prefix}:{key}"
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.redis.set(
+                lock, token, nx=True, px=int(self.lock_ttl * 1000)
+            )
+        except Exception:
+            # no redis, no cross worker coalescing
+            acquired = True
+            lock = None
+
+        if not acquired and peek is not None:
+            value = await self._wait(lock, peek)
+            if value is not None:
+                self.shared += 1
+                return value
+
+        self.calls += 1
+        try:
+            return await fn()
+        finally:
+            if acquired and lock:
+                await self._release(lock, token)
+
+    async def _wait(self, lock: str, peek) -> Any:
+        """
+        Poll ``peek`` until it returns a value or the lock holder is gone.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.lock_ttl
+        while loop.time() < deadline:
+            await asyncio.sleep(self.poll_interval)
+            value = await peek()
+            if value is not None:
+                return value
+            try:
+                if not await self.redis.get(lock):
+                    return await peek()
+            except Exception:
+                return None
+        return None
+
+    async def _release(self, lock: str, token: str) -> None:
+        try:
+            holder = await self.redis.get(lock)
+            if isinstance(holder, bytes):
+                holder = holder.decode()
+            if holder == token:
+                await self.redis.delete(lock)
+        except Exception:
+            pass